@@ -1,21 +1,23 @@
 
-import os
 import sys
-import time
+import queue
 import subprocess
 import requests
 import winsound
-from serial.tools.list_ports import comports
+
+from firmware_cache import get_firmware_cache
+from build_index import get_build_index
+from firmware_downloader import get_firmware_downloader, build_checksums
+from gang_flasher import GangFlasher
+from baud_profile import get_baud_profile, is_link_error
+from usb_hotplug import get_port_registry, EVENT_ADD
 
 # --- Configuration ---
 HARDWARE_VERSION = "1.9.0"
 DINOCORE_BASE_URL = "https://dinocore-telemetry-production.up.railway.app/"
-FIRMWARE_DIR = "production_firmware"
-BOOTLOADER = os.path.join(FIRMWARE_DIR, "bootloader.bin")
-APP = os.path.join(FIRMWARE_DIR, "magical-toys.bin")
-PARTITION_TABLE = os.path.join(FIRMWARE_DIR, "partition-table.bin")
-OTA_DATA = os.path.join(FIRMWARE_DIR, "ota_data_initial.bin")
-FLASH_BAUD = "460800"
+FIRMWARE_DIR = "production_firmware"   # Copy of the current build for manual use; flashing reads the cache
+FLASH_BAUD = "460800"  # Default until the port is calibrated (see baud_profile.py)
+MAX_PARALLEL_FLASHES = 4  # Boards flashed at the same time
 
 # --- Sound Definitions ---
 START_FREQ = 800  # Hz
@@ -48,25 +50,18 @@ def play_error_sound():
 
 def find_build_for_version(hardware_version):
     """Find the best build for the specified hardware version."""
-    url = f"{DINOCORE_BASE_URL}/api/builds"
     print(f"Searching for build compatible with version {hardware_version}...")
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        builds = response.json()
-
-        if not builds:
+        build_index = get_build_index('builds', DINOCORE_BASE_URL)
+        if not build_index.get_all_builds():
             print("[X] No builds found in DinoCore")
             return None
 
-        compatible_builds = [b for b in builds if hardware_version in b.get('supported_versions', [])]
-
-        if not compatible_builds:
+        selected_build = build_index.get_latest_build(hardware_version)
+        if not selected_build:
             print(f"[X] No builds found for hardware version {hardware_version}")
             return None
 
-        compatible_builds.sort(key=lambda x: x['created_at'], reverse=True)
-        selected_build = compatible_builds[0]
         print(f"Found compatible build: {selected_build['name']}")
         return selected_build
 
@@ -74,110 +69,117 @@ def find_build_for_version(hardware_version):
         print(f"[X] Failed to fetch builds from API: {e}")
         return None
 
-def download_file_from_api(build_id, file_type, output_path):
-    """Download a file from DinoCore API."""
-    url = f"{DINOCORE_BASE_URL}/api/builds/{build_id}/files/{file_type}/download"
-    print(f"Downloading {os.path.basename(output_path)}...")
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        os.makedirs(FIRMWARE_DIR, exist_ok=True)
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print(f"[OK] Downloaded {output_path}")
-        return True
-    except requests.exceptions.RequestException as e:
-        print(f"[X] Failed to download {output_path}: {e}")
-        return False
-
-def download_firmware_files(hardware_version):
-    """Download all required production firmware files."""
+def download_firmware_files(hardware_version, pin=False):
+    """Download all required production firmware files. Returns their cache paths or None.
+    With pin=True the caller must release them with get_firmware_cache().unpin()."""
     build = find_build_for_version(hardware_version)
     if not build:
-        return False
-
-    build_id = build['id']
-    file_mappings = {
-        'bootloader': BOOTLOADER,
-        'app': APP,
-        'partition_table': PARTITION_TABLE,
-        'ota_initial': OTA_DATA
-    }
+        return None
 
-    for file_type, output_path in file_mappings.items():
-        if not download_file_from_api(build_id, file_type, output_path):
-            return False
+    # Reuse the shared cache; only a new build id triggers a download
+    paths = get_firmware_cache().ensure_build(
+        'production', build,
+        lambda targets: get_firmware_downloader().download_build(DINOCORE_BASE_URL, 'builds', build['id'], targets,
+                                                                 checksums=build_checksums(build)),
+        pin=pin)
+    if not paths:
+        return None
 
     print("[OK] All production firmware files downloaded successfully!")
-    return True
+    return paths
 
-def flash_firmware(port, hardware_version):
+def flash_firmware(port, hardware_version, log=print):
     """Flash production firmware to a device."""
-    print(f"\n=== Production Firmware Flashing ===")
-    print(f"Target device: {port}")
-    print(f"Hardware version: {hardware_version}")
-
-    required_files = [BOOTLOADER, APP, PARTITION_TABLE, OTA_DATA]
-    if any(not os.path.exists(f) for f in required_files):
-        print("[X] Missing required firmware files. Attempting to download...")
-        if not download_firmware_files(hardware_version):
-            print("[X] Failed to download firmware. Aborting flash.")
-            return False
-
+    log(f"\n=== Production Firmware Flashing ===")
+    log(f"Target device: {port}")
+    log(f"Hardware version: {hardware_version}")
+
+    # Flash straight from the (pinned) cache: gang jobs never rewrite files another job is reading
+    paths = download_firmware_files(hardware_version, pin=True)
+    if not paths:
+        log("[X] Failed to download firmware. Aborting flash.")
+        return False
+    try:
+        return run_flash(port, paths, log)
+    finally:
+        get_firmware_cache().unpin(paths)
+
+def run_esptool(cmd, log=print):
+    """Run an esptool command, streaming its output to log. Returns (exit code, output)."""
+    process = subprocess.Popen(cmd,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               universal_newlines=True,
+                               bufsize=1)
+    output = []
+    for line in process.stdout:
+        log(line.rstrip())
+        output.append(line)
+    process.wait()
+    return process.returncode, "".join(output)
+
+def run_flash(port, paths, log=print):
+    """Run esptool write_flash with the build files in paths"""
+    baud = get_baud_profile().get_baud(port)
     flash_cmd = [
         sys.executable, "-m", "esptool",
         "--chip", "esp32s3",
         "-p", port,
-        "-b", FLASH_BAUD,
+        "-b", str(baud),
         "--before=default_reset",
         "--after=hard_reset",
         "write_flash",
         "--flash_mode", "dio",
         "--flash_freq", "80m",
         "--flash_size", "16MB",
-        "0x0", BOOTLOADER,
-        "0x260000", APP,
-        "0x10000", PARTITION_TABLE,
-        "0x15000", OTA_DATA
+        "0x0", paths['bootloader'],
+        "0x260000", paths['app'],
+        "0x10000", paths['partition_table'],
+        "0x15000", paths['ota_initial']
     ]
 
     try:
-        print("\nFlashing production firmware...")
+        log(f"\nFlashing production firmware at {baud} baud...")
         
-        process = subprocess.Popen(flash_cmd, 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.STDOUT, 
-                                   universal_newlines=True,
-                                   bufsize=1)
-
-        for line in process.stdout:
-            print(line, end='', flush=True)
-
-        process.wait()
-
-        if process.returncode != 0:
-            print(f"\n[X] Flash failed with exit code {process.returncode}")
+        return_code, output = run_esptool(flash_cmd, log)
+
+        if return_code != 0 and is_link_error(output):
+            # Fall back one baud step for this port and retry once
+            lower_baud = get_baud_profile().record_failure(port, baud)
+            if lower_baud:
+                log(f"[!] Flash failed at {baud} baud, retrying at {lower_baud} baud...")
+                baud = lower_baud
+                flash_cmd[flash_cmd.index("-b") + 1] = str(baud)
+                return_code, output = run_esptool(flash_cmd, log)
+
+        if return_code != 0:
+            log(f"\n[X] Flash failed with exit code {return_code}")
             play_error_sound()
             return False
-        
+
+        get_baud_profile().record_success(port, baud)
         play_end_sound()
-        print("\n[OK] Production firmware flash complete!")
+        log("\n[OK] Production firmware flash complete!")
         return True
 
     except FileNotFoundError:
-        print("[X] Could not execute esptool. Make sure esptool is installed.")
+        log("[X] Could not execute esptool. Make sure esptool is installed.")
         play_error_sound()
         return False
     except Exception as e:
-        print(f"[X] An unexpected error occurred during flashing: {e}")
+        log(f"[X] An unexpected error occurred during flashing: {e}")
         play_error_sound()
         return False
 
 
+def flash_job(log_queue, port, mode, stop_event, flash_limiter):
+    """Gang flasher job: flash one port while holding a flash slot."""
+    with flash_limiter:
+        return flash_firmware(port, HARDWARE_VERSION, log_queue)
+
 def get_current_ports():
     """Gets a set of current serial ports."""
-    return {port.device for port in comports()}
+    return {info.device for info in get_port_registry().get_ports()}
 
 def main():
     """Main function to watch for new devices and flash them."""
@@ -185,29 +187,41 @@ def main():
     print(f"Hardware Version: {HARDWARE_VERSION}")
     print("Checking for firmware...")
 
-    if not download_firmware_files(HARDWARE_VERSION):
+    paths = download_firmware_files(HARDWARE_VERSION)
+    if not paths:
         print("[X] Could not download initial firmware. Please check network and server status.")
         play_error_sound()
         return
+    # Exported once, before any job runs
+    get_firmware_cache().export_build(paths, FIRMWARE_DIR)
 
     print("\nWaiting for new devices to be connected...")
+    # Hotplug events arrive on the watcher thread; new ports are queued for this loop
+    new_ports = queue.Queue()
+    get_port_registry().subscribe(
+        lambda event, info: new_ports.put(info.device) if event == EVENT_ADD else None,
+        esp32_only=False)
     known_ports = get_current_ports()
     if known_ports:
-        print(f"Ignoring already connected devices: {', '.join(known_ports)}")
+        print(f"Ignoring already connected devices: {', '.join(sorted(known_ports))}")
 
 
+    # New ports are flashed concurrently, up to MAX_PARALLEL_FLASHES at a time
+    gang = GangFlasher(flash_job, MAX_PARALLEL_FLASHES)
     try:
         while True:
-            current_ports = get_current_ports()
-            new_ports = current_ports - known_ports
-
-            for port in new_ports:
-                print(f"\n>>> New device detected on: {port} <<<")
-                flash_firmware(port, HARDWARE_VERSION)
-                print(f"\nFinished processing {port}. Waiting for next device...")
-
-            known_ports = current_ports
-            time.sleep(2)
+            try:
+                port = new_ports.get(timeout=1)
+                if gang.submit(port, 'production'):
+                    print(f"\n>>> New device detected on: {port} <<<")
+            except queue.Empty:
+                pass
+
+            for slot in gang.get_slots():
+                if slot.is_finished:
+                    result = "[OK]" if slot.state == 'done' else "[X]"
+                    print(f"\n{result} Finished processing {slot.port}. Waiting for next device...")
+            gang.remove_finished()
     except KeyboardInterrupt:
         print("\nExiting program.")
 
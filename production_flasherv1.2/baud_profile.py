@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Baud Profile Module
+Per-port flash baud calibration with automatic one-step fallback and recovery
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+from serial.tools.list_ports import comports
+
+# --- Configuration ---
+PROFILE_FILE = "baud_profile.json"
+DEFAULT_BAUD = 460800
+BAUD_STEPS = [115200, 230400, 460800, 921600, 1500000, 2000000]
+CALIBRATION_ADDRESS = 0x260000      # App partition start, rewritten by the next flash anyway
+CALIBRATION_SIZE = 512 * 1024       # Random data, so compression cannot hide link errors
+CALIBRATION_ROUNDS = 2
+RECOVERY_SUCCESSES = 20             # Clean flashes in a row before a lowered port steps back up
+
+# esptool output that means the link dropped data mid-transfer (a baud problem)
+LINK_ERROR_MARKERS = [
+    "Serial data stream stopped",
+    "Packet content transfer stopped",
+    "Timed out waiting for packet",
+    "Invalid head of packet",
+    "Corrupt data",
+    "does not match",               # MD5 / checksum verification after write
+    "checksum",
+]
+# Failures that are not the link rate: board missing, port busy, no sync/boot mode
+NOT_LINK_MARKERS = [
+    "No serial data received",
+    "Failed to connect",
+    "Wrong boot mode",
+    "could not open port",
+    "returned no data",
+    "Access is denied",
+    "PermissionError",
+    "FileNotFoundError",
+    "No such file or directory",
+    "device disconnected",
+]
+
+
+def get_port_key(port: str) -> str:
+    """Profile key for a port: its USB location path when known, so the rate
+    follows the physical hub socket and cable rather than the COM number."""
+    for p in comports():
+        if p.device == port:
+            if p.location:
+                return f"usb:{p.location}"
+            break
+    return f"port:{port}"
+
+def step_down(baud: int) -> Optional[int]:
+    """Next lower calibrated step below baud, or None at the bottom"""
+    lower = [b for b in BAUD_STEPS if b < int(baud)]
+    return lower[-1] if lower else None
+
+def step_up(baud: int) -> Optional[int]:
+    """Next higher calibrated step above baud, or None at the top"""
+    higher = [b for b in BAUD_STEPS if b > int(baud)]
+    return higher[0] if higher else None
+
+def is_link_error(output: str) -> bool:
+    """True if esptool output shows a serial error during the transfer itself,
+    the only kind of failure a lower baud can fix."""
+    output = (output or "").lower()
+    if any(marker.lower() in output for marker in NOT_LINK_MARKERS):
+        return False
+    return any(marker.lower() in output for marker in LINK_ERROR_MARKERS)
+
+
+class BaudProfile:
+    """Highest verified flash baud per port, stored in a local JSON profile"""
+
+    def __init__(self, path: str = PROFILE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.ports = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data.get('ports'), dict):
+                return data['ports']
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'ports': self.ports}, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save baud profile: {e}")
+
+    def get_baud(self, port: str) -> int:
+        """Flash baud to use for a port (DEFAULT_BAUD until calibrated)"""
+        with self.lock:
+            entry = self.ports.get(get_port_key(port))
+            return int(entry['baud']) if entry else DEFAULT_BAUD
+
+    def set_baud(self, port: str, baud: int, calibrated: bool = False):
+        key = get_port_key(port)
+        with self.lock:
+            entry = self.ports.setdefault(key, {'failures': 0})
+            entry['baud'] = int(baud)
+            entry['port'] = port
+            if calibrated:
+                entry['calibrated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                entry['max_baud'] = int(baud)
+                entry['failures'] = 0
+                entry['successes'] = 0
+            self._save()
+
+    def record_failure(self, port: str, baud: int) -> Optional[int]:
+        """Note a write that failed on a link error at baud and lower the port one step.
+        Returns the rate to retry with, or None if already at the lowest step.
+        Callers check is_link_error() first; other failures must not lower the rate."""
+        lower = step_down(baud)
+        if lower is None:
+            return None
+        key = get_port_key(port)
+        with self.lock:
+            entry = self.ports.setdefault(key, {'failures': 0})
+            entry['baud'] = min(int(entry.get('baud', baud)), lower)
+            entry['port'] = port
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['successes'] = 0
+            entry['last_failure'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            self._save()
+        return lower
+
+    def record_success(self, port: str, baud: int) -> Optional[int]:
+        """Note a clean write at baud. After RECOVERY_SUCCESSES in a row on a
+        lowered port, step back up one rate (never above the calibrated or
+        default rate). Returns the new rate when it changed, else None."""
+        key = get_port_key(port)
+        with self.lock:
+            entry = self.ports.get(key)
+            if not entry or int(entry.get('baud', DEFAULT_BAUD)) != int(baud):
+                return None
+            ceiling = int(entry.get('max_baud', DEFAULT_BAUD))
+            if int(baud) >= ceiling:
+                return None
+            entry['successes'] = entry.get('successes', 0) + 1
+            if entry['successes'] < RECOVERY_SUCCESSES:
+                self._save()
+                return None
+            higher = min(step_up(baud) or ceiling, ceiling)
+            entry['baud'] = higher
+            entry['successes'] = 0
+            entry['failures'] = 0
+            self._save()
+        return higher
+
+    def calibrate(self, port: str, log: Callable[[str], None] = print,
+                  steps: List[int] = None) -> Optional[int]:
+        """Find the highest baud at which test writes verify and store it.
+
+        Writes CALIBRATION_SIZE bytes of random data at CALIBRATION_ADDRESS
+        CALIBRATION_ROUNDS times per rate, stepping up until a rate fails.
+        The board must be flashed again afterwards.
+        """
+        from esp_backend import EspSession
+
+        steps = sorted(steps or [b for b in BAUD_STEPS if b >= DEFAULT_BAUD // 2])
+        test_file = f"baud_calibration_{os.path.basename(port)}.bin"
+        with open(test_file, 'wb') as f:
+            f.write(os.urandom(CALIBRATION_SIZE))
+
+        best = None
+        try:
+            for baud in steps:
+                log(f"🎚️ Calibrating {port} at {baud} baud...")
+                session = EspSession(port, baud, log=log)
+                passed = True
+                start = time.time()
+                for round_number in range(CALIBRATION_ROUNDS):
+                    return_code, _output = session.esptool(
+                        ["write_flash", "-z", hex(CALIBRATION_ADDRESS), test_file])
+                    if return_code != 0:
+                        passed = False
+                        break
+                session.close(reset=True)
+                if not passed:
+                    log(f"[!] {baud} baud failed verification on {port}")
+                    break
+                rate_kbs = CALIBRATION_SIZE * CALIBRATION_ROUNDS / 1024 / max(time.time() - start, 0.001)
+                log(f"[OK] {baud} baud verified ({rate_kbs:.0f} KB/s)")
+                best = baud
+        finally:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+
+        if best:
+            self.set_baud(port, best, calibrated=True)
+            log(f"[OK] {port} calibrated: flashing at {best} baud")
+        else:
+            log(f"[X] No baud rate verified on {port}, keeping {self.get_baud(port)}")
+        return best
+
+
+# Global profile shared by all flashers on this station
+baud_profile = BaudProfile()
+
+def get_baud_profile() -> BaudProfile:
+    """Get the global baud profile instance"""
+    return baud_profile
+
+if __name__ == "__main__":
+    # Command line calibration: python baud_profile.py <port> [<port> ...]
+    if len(sys.argv) < 2:
+        print("Usage: python baud_profile.py <port> [<port> ...]")
+        sys.exit(1)
+    for calibration_port in sys.argv[1:]:
+        baud_profile.calibrate(calibration_port)
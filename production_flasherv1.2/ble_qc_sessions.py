@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - BLE QC Sessions Module
+Runs QC on several devices at once, one BluetoothQCTester per MAC
+"""
+
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional
+
+from i18n_utils import _
+from ble_service import get_ble_service
+from bluetooth_qc import BluetoothQCTester, DISCOVERY_TIMEOUT
+from qc_test_plan import QCPlanRunner, QCTestPlan, get_test_plan
+
+# --- Configuration ---
+MAX_BLE_CONNECTIONS = 3      # Simultaneous GATT connections (most USB adapters manage 3-5 reliably)
+SERVICE_SETTLE_TIME = 1.0    # Pause after connecting before the first command
+
+
+class QCSessionManager:
+    """Runs one QC session per device MAC on the shared BLE loop.
+
+    Each session gets its own BluetoothQCTester (client, notification
+    handler and result list), so results are attributed per MAC. Discovery
+    runs freely; connecting and testing are limited to max_connections at
+    a time by an adapter-level semaphore. Each session runs the test plan
+    (the active one from qc_test_plan unless set_test_plan() was called).
+    """
+
+    def __init__(self, log_queue=None, max_connections: int = MAX_BLE_CONNECTIONS):
+        self.log_queue = log_queue
+        self.test_plan: Optional[QCTestPlan] = None
+        self.max_connections = max(1, int(max_connections))
+        self.connection_limiter = None   # asyncio.Semaphore, created on the BLE loop
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, BluetoothQCTester] = {}   # MAC -> running session
+        self.results: Dict[str, Dict[str, Any]] = {}       # MAC -> last session result
+
+    def set_log_queue(self, queue_ref):
+        self.log_queue = queue_ref
+
+    def set_max_connections(self, max_connections: int):
+        """Change the limit (applies to sessions started after the current ones finish)"""
+        self.max_connections = max(1, int(max_connections))
+        self.connection_limiter = None
+
+    def set_test_plan(self, plan: QCTestPlan):
+        self.test_plan = plan
+
+    def is_running(self, address: str) -> bool:
+        with self.lock:
+            return address.upper() in self.sessions
+
+    def active_count(self) -> int:
+        with self.lock:
+            return len(self.sessions)
+
+    def get_result(self, address: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.results.get(address.upper())
+
+    def submit(self, address: str, name: str = None, port: str = None,
+               on_done: Callable[[Dict[str, Any]], None] = None) -> Optional[concurrent.futures.Future]:
+        """Start a QC session from any thread. Returns None if this MAC is already being tested.
+        on_done(result) is called on the BLE thread when the session ends, with an
+        error result if it was cancelled (BLE service stopped) or crashed."""
+        address = address.upper()
+        tester = BluetoothQCTester(self.log_queue, port)
+        with self.lock:
+            if address in self.sessions:
+                return None
+            self.sessions[address] = tester
+        try:
+            future = get_ble_service().submit(self._run_session(tester, address, name, port))
+        except RuntimeError:
+            with self.lock:
+                self.sessions.pop(address, None)
+            raise
+
+        def done_callback(f):
+            # Every submitted session reports back, also when it was cancelled or crashed
+            if f.cancelled() or f.exception() is not None:
+                with self.lock:
+                    if self.sessions.get(address) is tester:
+                        self.sessions.pop(address)   # Cancelled before _run_session could clean up
+                if on_done:
+                    error = 'cancelled' if f.cancelled() else (str(f.exception()) or 'error')
+                    on_done(self._error_result(address, name, port, error))
+            elif on_done:
+                on_done(f.result())
+        future.add_done_callback(done_callback)
+        return future
+
+    def submit_all(self, devices: List[Dict[str, Any]], on_done=None) -> List[concurrent.futures.Future]:
+        """Start sessions for dicts with 'address' and optional 'name'/'port'"""
+        futures = []
+        for device in devices:
+            future = self.submit(device['address'], device.get('name'), device.get('port'), on_done)
+            if future:
+                futures.append(future)
+        return futures
+
+    @staticmethod
+    def _error_result(address: str, name: str, port: str, error: str) -> Dict[str, Any]:
+        return {'address': address, 'name': name, 'port': port, 'results': [],
+                'passed': False, 'error': error}
+
+    async def _run_session(self, tester: BluetoothQCTester, address: str, name: str, port: str) -> Dict[str, Any]:
+        result = {'address': address, 'name': name, 'port': port, 'results': [],
+                  'passed': False, 'error': None, 'started': time.time()}
+        try:
+            device = await tester.find_device(address, name, DISCOVERY_TIMEOUT)
+            if device is None:
+                result['error'] = _("Device not found")
+                return result
+            result['name'] = device.name or name
+            tester.device = device
+
+            if self.connection_limiter is None:
+                self.connection_limiter = asyncio.Semaphore(self.max_connections)
+            async with self.connection_limiter:
+                if not await tester.connect_device(device.address):
+                    result['error'] = _("Failed to connect to device")
+                    return result
+                try:
+                    await asyncio.sleep(SERVICE_SETTLE_TIME)
+                    await QCPlanRunner(tester, self.test_plan or get_test_plan()).run()
+                finally:
+                    await tester.disconnect()
+
+            result['results'] = tester.get_test_results()
+            result['passed'] = bool(result['results']) and all(r.get('status') == 'pass' for r in result['results'])
+            if not result['results']:
+                result['error'] = _("No test results received")
+            return result
+
+        except Exception as e:
+            result['error'] = str(e)
+            tester.log('error', _("QC session error: {}").format(str(e)))
+            return result
+        finally:
+            result['duration'] = time.time() - result['started']
+            with self.lock:
+                self.sessions.pop(address, None)
+                self.results[address] = result
+            tester.log('success' if result['passed'] else 'error',
+                       _("QC {}: {}").format(address, _("PASS") if result['passed'] else
+                                              _("FAIL") + (f" ({result['error']})" if result['error'] else "")),
+                       {'qc_passed': result['passed'], 'qc_seconds': round(result['duration'], 1)})
+
+
+# Global session manager
+qc_session_manager = QCSessionManager()
+
+def get_qc_session_manager() -> QCSessionManager:
+    """Get the global QC session manager instance"""
+    return qc_session_manager
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - BLE Service Module
+One long-lived asyncio loop with a continuous scanner and a live advertisement table
+"""
+
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Coroutine, Dict, List, Optional
+
+# Check if bleak (Bluetooth library) is available
+try:
+    import bleak
+    BLEAK_AVAILABLE = True
+except ImportError:
+    BLEAK_AVAILABLE = False
+    bleak = None
+
+# --- Configuration ---
+ADVERTISEMENT_TTL = 30.0     # Seconds an advertisement stays in the table without being seen again
+PRUNE_INTERVAL = 5.0
+SCANNER_RETRY_DELAY = 2.0    # Pause before restarting a scanner that failed
+
+
+class Advertisement:
+    """Latest advertisement seen from one device"""
+
+    __slots__ = ('device', 'address', 'name', 'rssi', 'service_uuids', 'first_seen', 'last_seen')
+
+    def __init__(self, device, advertisement_data):
+        self.first_seen = time.monotonic()
+        self.update(device, advertisement_data)
+
+    def update(self, device, advertisement_data):
+        self.device = device
+        self.address = device.address.upper()
+        self.name = device.name or advertisement_data.local_name
+        self.rssi = advertisement_data.rssi
+        self.service_uuids = [uuid.lower() for uuid in advertisement_data.service_uuids]
+        self.last_seen = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.last_seen
+
+    def matches(self, address: str = None, name: str = None, service_uuid: str = None) -> bool:
+        if address and self.address == address.upper():
+            return True
+        if name and self.name == name:
+            return True
+        if not address and not name and service_uuid:
+            return service_uuid.lower() in self.service_uuids
+        return False
+
+
+class BLEService:
+    """Background thread owning the BLE event loop for the whole application.
+
+    start() launches the loop and a continuous BleakScanner whose callback
+    keeps a time-stamped advertisement table, so looking a device up is an
+    in-memory query instead of a fresh 5 s scan. Coroutines (QC jobs,
+    device selection) are handed over with submit() from any thread and
+    all BleakClients live on this one loop.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.advertisements: Dict[str, Advertisement] = {}
+        self.waiters = []            # (address, name, service_uuid, future)
+        self.scanner = None
+        self.scanner_task = None
+        self.scanning = False
+        self.scanner_error = None
+
+    # --- Lifecycle ---
+    def start(self) -> bool:
+        """Start the loop thread and the scanner (no-op if already running)"""
+        if not BLEAK_AVAILABLE:
+            return False
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return True
+            self.ready.clear()
+            self.thread = threading.Thread(target=self._run_loop, daemon=True, name="ble-service")
+            self.thread.start()
+        self.ready.wait(timeout=5)
+        return self.is_running()
+
+    def is_running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+
+    def in_loop(self) -> bool:
+        """True when called from a coroutine running on the service loop"""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def stop(self, timeout: float = 5.0):
+        if not self.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Run a coroutine on the BLE loop from any thread"""
+        if not self.start():
+            coro.close()
+            raise RuntimeError("BLE service not available")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.scanner_task = self.loop.create_task(self._scanner_worker())
+        self.loop.call_soon(self.ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+            self.loop = None
+
+    async def _shutdown(self):
+        if self.scanner_task:
+            self.scanner_task.cancel()
+        await self._stop_scanner()
+        # Cancel submitted jobs so their futures (and QC done callbacks) complete
+        jobs = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in jobs:
+            task.cancel()
+        if jobs:
+            await asyncio.wait(jobs, timeout=2.0)
+
+    # --- Scanner ---
+    async def _scanner_worker(self):
+        """Keep the scanner running and prune stale advertisements"""
+        try:
+            while True:
+                if not self.scanning:
+                    try:
+                        self.scanner = bleak.BleakScanner(detection_callback=self._on_advertisement)
+                        await self.scanner.start()
+                        self.scanning = True
+                        self.scanner_error = None
+                    except Exception as e:
+                        self.scanner_error = str(e)
+                        await asyncio.sleep(SCANNER_RETRY_DELAY)
+                        continue
+                await asyncio.sleep(PRUNE_INTERVAL)
+                self._prune()
+        except asyncio.CancelledError:
+            pass
+
+    async def _stop_scanner(self):
+        if self.scanner and self.scanning:
+            try:
+                await self.scanner.stop()
+            except Exception:
+                pass
+        self.scanning = False
+
+    def _on_advertisement(self, device, advertisement_data):
+        with self.lock:
+            entry = self.advertisements.get(device.address.upper())
+            if entry is None:
+                entry = self.advertisements[device.address.upper()] = Advertisement(device, advertisement_data)
+            else:
+                entry.update(device, advertisement_data)
+            waiters = [w for w in self.waiters if entry.matches(*w[:3])]
+        for waiter in waiters:
+            # Backends may call back from their own thread
+            self.loop.call_soon_threadsafe(self._resolve, waiter[3], entry)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, entry: Advertisement):
+        if not future.done():
+            future.set_result(entry)
+
+    def _prune(self):
+        with self.lock:
+            for address in [a for a, entry in self.advertisements.items() if entry.age() > ADVERTISEMENT_TTL]:
+                del self.advertisements[address]
+
+    # --- Queries ---
+    def devices(self, max_age: float = ADVERTISEMENT_TTL) -> List[Advertisement]:
+        """Devices heard within max_age seconds, strongest signal first"""
+        with self.lock:
+            entries = [entry for entry in self.advertisements.values() if entry.age() <= max_age]
+        return sorted(entries, key=lambda entry: entry.rssi or -999, reverse=True)
+
+    def find(self, address: str = None, name: str = None, service_uuid: str = None,
+             max_age: float = ADVERTISEMENT_TTL) -> Optional[Advertisement]:
+        """Most recent matching advertisement from the table, if any"""
+        with self.lock:
+            matches = [entry for entry in self.advertisements.values()
+                       if entry.age() <= max_age and entry.matches(address, name, service_uuid)]
+        return max(matches, key=lambda entry: entry.last_seen) if matches else None
+
+    async def wait_for_device(self, address: str = None, name: str = None, service_uuid: str = None,
+                              timeout: float = 20.0, max_age: float = 5.0) -> Optional[Advertisement]:
+        """Matching advertisement seen within max_age seconds, or the next one to arrive
+        before timeout. Must be awaited on the service loop."""
+        entry = self.find(address, name, service_uuid, max_age)
+        if entry is not None:
+            return entry
+        waiter = (address, name, service_uuid, self.loop.create_future())
+        with self.lock:
+            self.waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[3], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self.lock:
+                self.waiters.remove(waiter)
+
+
+# Global BLE service shared by every QC job
+_ble_service = BLEService()
+
+def get_ble_service() -> BLEService:
+    """Get the global BLE service instance"""
+    return _ble_service
@@ -10,7 +10,9 @@ import time
 import threading
 import json
 import queue
-from typing import Optional, Dict, Any, Callable
+import asyncio
+import itertools
+from typing import Optional, Dict, Any, Callable, Tuple
 
 # Check if bleak (Bluetooth library) is available
 try:
@@ -21,43 +23,151 @@ except ImportError:
     bleak = None
 
 from i18n_utils import _
+from log_record import LogRecord, SUBSYSTEM_BLE
+from ble_service import get_ble_service
+
+# --- Configuration ---
+DISCOVERY_TIMEOUT = 20.0   # Overall deadline for finding one device by address/name
+REASSEMBLY_TIMEOUT = 2.0   # A JSON message split over notifications must complete within this
+MAX_MESSAGE_BYTES = 16384  # Partial messages larger than this are dropped
+TEXT_KIND = 'text'         # Handler/reply kind of plain text notifications (legacy firmware)
+
+
+def is_text_verdict(text: str) -> bool:
+    """Plain text test result from legacy firmware"""
+    return 'PASS' in text or 'FAIL' in text
+
+
+class MessageAssembler:
+    """Rebuilds messages split across several notifications (MTU-sized chunks).
+
+    feed() returns the complete messages found so far: parsed dicts for JSON
+    objects, str for plain text. Object boundaries are found by tracking
+    brace depth outside strings, so several objects in one chunk and one
+    object over several chunks both work.
+    """
+
+    def __init__(self, timeout: float = REASSEMBLY_TIMEOUT, max_bytes: int = MAX_MESSAGE_BYTES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self.last_chunk = 0.0
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> list:
+        now = time.monotonic()
+        if self.buffer and now - self.last_chunk > self.timeout:
+            # The rest of the previous message never came
+            self.dropped += 1
+            self.buffer.clear()
+        self.last_chunk = now
+        self.buffer.extend(data)
+
+        messages = []
+        while True:
+            start = self._skip_whitespace()
+            if start >= len(self.buffer):
+                self.buffer.clear()
+                break
+            if self.buffer[start] != ord('{'):
+                # Plain text: the whole notification
+                messages.append(self.buffer[start:].decode('utf-8', errors='ignore').strip())
+                self.buffer.clear()
+                break
+            end = self._object_end(start)
+            if end is None:
+                del self.buffer[:start]
+                if len(self.buffer) > self.max_bytes:
+                    self.dropped += 1
+                    self.buffer.clear()
+                break
+            raw = bytes(self.buffer[start:end])
+            del self.buffer[:end]
+            text = raw.decode('utf-8', errors='ignore')
+            try:
+                messages.append(json.loads(text))
+            except ValueError:
+                messages.append(text)
+        return messages
+
+    def _skip_whitespace(self) -> int:
+        index = 0
+        while index < len(self.buffer) and self.buffer[index] in b' \t\r\n\x00':
+            index += 1
+        return index
+
+    def _object_end(self, start: int) -> Optional[int]:
+        """Index just past the object starting at start, or None if it is incomplete"""
+        depth = 0
+        in_string = escaped = False
+        for index in range(start, len(self.buffer)):
+            byte = self.buffer[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif byte == 0x5C:     # backslash
+                    escaped = True
+                elif byte == 0x22:     # quote
+                    in_string = False
+            elif byte == 0x22:
+                in_string = True
+            elif byte == 0x7B:         # {
+                depth += 1
+            elif byte == 0x7D:         # }
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        return None
+
+
+class PendingRequest:
+    """A command waiting for its reply"""
+
+    __slots__ = ('id', 'kind', 'is_final', 'future', 'loop', 'timer', 'sent')
+
+    def __init__(self, command_id: str, kind: Optional[str], loop: asyncio.AbstractEventLoop,
+                 is_final: Callable[[Dict[str, Any]], bool] = None):
+        self.id = command_id
+        self.kind = kind
+        self.is_final = is_final     # False for progress messages (acks, "started"): keep waiting
+        self.loop = loop
+        self.future = loop.create_future()
+        self.timer = None
+        self.sent = time.monotonic()
 
 class BluetoothQCTester:
-    """Bluetooth-based Quality Control Tester for DinoCore devices"""
+    """Bluetooth-based Quality Control Tester for DinoCore devices.
+
+    One instance holds the connection, notification routing and results of
+    one device; QCSessionManager creates one per MAC to test several
+    devices at once. The global instance serves the single-device flow.
+    """
 
-    def __init__(self):
+    def __init__(self, log_queue=None, port: str = None):
         self.device = None
         self.client = None
-        self.log_queue = None
+        self.log_queue = log_queue
+        self.port = port             # Serial port the device was flashed on (routes logs to its slot)
         self.test_results = []
         self.is_connected = False
         self.is_testing = False
-        self.current_test = None
+        self.pending_requests: Dict[str, PendingRequest] = {}   # Command id -> request, oldest first
+        self.pending_lock = threading.Lock()
+        self.command_counter = itertools.count(1)
+        self.write_lock = None       # asyncio.Lock serializing GATT writes, created on the BLE loop
+        self.assembler = MessageAssembler()
+
+        # Notification handlers by message kind/type; replies to pending requests never reach them
+        self.handlers: Dict[str, Callable[[Any], None]] = {
+            'qa_instruction': self.handle_instruction,
+            TEXT_KIND: self.handle_text_message,
+        }
 
         # Bluetooth service and characteristic UUIDs
         self.QA_SERVICE_UUID = 'a07498ca-ad5b-474e-940d-16f1fbe7e8cd'
         self.QA_CONTROL_UUID = 'b30ac6b4-1b2d-4c2f-9c10-4b2a7b80f1a1'
         self.QA_EVENTS_UUID = 'f29f4a3e-9a53-4d93-9b33-0a1cc4f0c8a2'
 
-        # QC thresholds
-        self.QC_THRESHOLD = 4500
-
-        # Test definitions
-        self.tests = [
-            {
-                'name': _("Test Mic L/R Balance"),
-                'command': 'qa_mic_lr_test',
-                'payload': {
-                    'wait_ms': 2000,
-                    'tone_ms': 2000,
-                    'volume_percent': 95,
-                    'freq_hz': 1000
-                },
-                'timeout': 10000,
-                'description': _("Test microphone left/right balance")
-            }
-        ]
-
     def set_log_queue(self, queue_ref):
         """Set the logging queue for UI updates"""
         self.log_queue = queue_ref
@@ -65,12 +175,9 @@ class BluetoothQCTester:
     def log(self, level: str, message: str, data=None):
         """Add message to log queue"""
         if self.log_queue:
-            self.log_queue.put({
-                'level': level,
-                'message': message,
-                'data': data,
-                'timestamp': time.time()
-            })
+            device = getattr(self.client, 'address', None) or getattr(self.device, 'address', None)
+            self.log_queue.put(LogRecord(message, level, SUBSYSTEM_BLE, self.port, device,
+                                         fields={'data': data} if data is not None else None))
 
     async def scan_devices(self) -> list:
         """Scan for available Bluetooth devices"""
@@ -81,7 +188,16 @@ class BluetoothQCTester:
         try:
             self.log('info', _("Scanning for Bluetooth devices..."))
 
-            devices = await bleak.BleakScanner.discover(timeout=5.0)
+            service = get_ble_service()
+            if service.in_loop() and service.scanning:
+                # The background scanner already knows who is advertising
+                devices = [entry.device for entry in service.devices()]
+                if not devices:
+                    # Scanner just started: give it one scan window
+                    await asyncio.sleep(5.0)
+                    devices = [entry.device for entry in service.devices()]
+            else:
+                devices = await bleak.BleakScanner.discover(timeout=5.0)
 
             # Filter devices - less strict to detect more devices
             qa_devices = []
@@ -108,6 +224,79 @@ class BluetoothQCTester:
             self.log('error', _("Error scanning Bluetooth devices: {}").format(str(e)))
             return []
 
+    async def find_device(self, address: str = None, name: str = None,
+                          timeout: float = DISCOVERY_TIMEOUT, service_filter: bool = False):
+        """Wait for the advertisement of one device and return it immediately.
+
+        Matches the MAC address (case-insensitive) or, where the platform hides
+        MACs, the advertised name. Without address and name the first device
+        advertising the QA service is returned. service_filter=True also asks
+        the OS to report only QA service advertisements. Returns None at the deadline.
+        """
+        if not BLEAK_AVAILABLE:
+            self.log('error', _("Bluetooth library not available"))
+            return None
+
+        address = address.upper() if address else None
+        qa_service = self.QA_SERVICE_UUID.lower()
+        found = asyncio.Event()
+        match = {}
+
+        def detection_callback(device, advertisement_data):
+            if found.is_set():
+                return
+            if address or name:
+                hit = ((address and device.address.upper() == address) or
+                       (name and name in (device.name, advertisement_data.local_name)))
+            else:
+                hit = qa_service in [uuid.lower() for uuid in advertisement_data.service_uuids]
+            if hit:
+                match['device'] = device
+                match['rssi'] = advertisement_data.rssi
+                found.set()
+
+        target = address or name or _("QA service")
+        self.log('info', _("Looking for device {}...").format(target))
+        start = time.monotonic()
+
+        service = get_ble_service()
+        if service.in_loop() and service.scanning:
+            # In-memory lookup in the shared advertisement table
+            entry = await service.wait_for_device(address, name, qa_service, timeout)
+            if entry is not None:
+                match['device'], match['rssi'] = entry.device, entry.rssi
+            return self._discovery_result(match, target, timeout, start)
+
+        scanner = bleak.BleakScanner(detection_callback=detection_callback,
+                                     service_uuids=[self.QA_SERVICE_UUID] if service_filter else None)
+        try:
+            await scanner.start()
+            try:
+                await asyncio.wait_for(found.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        except Exception as e:
+            self.log('error', _("Error scanning Bluetooth devices: {}").format(str(e)))
+        finally:
+            try:
+                await scanner.stop()
+            except Exception:
+                pass
+
+        return self._discovery_result(match, target, timeout, start)
+
+    def _discovery_result(self, match: Dict[str, Any], target: str, timeout: float, start: float):
+        elapsed_ms = round((time.monotonic() - start) * 1000)
+        device = match.get('device')
+        if device is None:
+            self.log('error', _("Device {} not found within {:.1f}s").format(target, timeout),
+                     {'discover_ms': elapsed_ms, 'found': False})
+            return None
+        self.log('success', _("Found {} ({}) in {:.1f}s").format(device.name or 'Unknown', device.address,
+                                                                 elapsed_ms / 1000),
+                 {'discover_ms': elapsed_ms, 'found': True, 'rssi': match.get('rssi')})
+        return device
+
     async def connect_device(self, device_address: str) -> bool:
         """Connect to Bluetooth device"""
         if not BLEAK_AVAILABLE:
@@ -147,74 +336,39 @@ class BluetoothQCTester:
     def notification_handler(self, sender, data):
         """Handle incoming Bluetooth notifications"""
         try:
-            # Decode JSON data
-            message = data.decode('utf-8', errors='ignore')
-            self.log('info', f"[BLE RX] {message}")
+            dropped = self.assembler.dropped
+            messages = self.assembler.feed(bytes(data))
+            if self.assembler.dropped != dropped:
+                self.log('warning', _("Discarded an incomplete Bluetooth message"))
 
-            try:
-                json_data = json.loads(message)
-
-                # Handle different message types
-                if json_data.get('kind') == 'mic_lr_test':
-                    self.handle_mic_lr_test_result(json_data)
-                elif json_data.get('type') == 'qa_instruction':
-                    self.handle_instruction(json_data)
-                else:
-                    self.log('info', _("Unhandled message type: {}").format(json_data.get('type', 'unknown')))
-
-            except json.JSONDecodeError:
-                # Handle plain text messages
-                self.handle_text_message(message)
+            for message in messages:
+                self.dispatch_message(message)
 
         except Exception as e:
             self.log('error', _("Error processing Bluetooth message: {}").format(str(e)))
 
-    def handle_mic_lr_test_result(self, data: Dict[str, Any]):
-        """Handle microphone L/R balance test results"""
-        try:
-            payload = data.get('payload', {})
-
-            if payload.get('tone'):
-                rms_l = payload['tone'].get('rms_L', 0)
-                rms_r = payload['tone'].get('rms_R', 0)
-
-                # Apply QC threshold
-                left_passed = rms_l > self.QC_THRESHOLD
-                right_passed = rms_r > self.QC_THRESHOLD
-                overall_passed = left_passed and right_passed
-
-                self.log('success', _("Processing microphone test results"))
-                self.log('info', _("Left channel: {:.1f} RMS ({})").format(
-                    rms_l, _("PASS") if left_passed else _("FAIL")))
-                self.log('info', _("Right channel: {:.1f} RMS ({})").format(
-                    rms_r, _("PASS") if right_passed else _("FAIL")))
-
-                # Create test result
-                result = {
-                    'name': _("Test Mic L/R Balance"),
-                    'status': 'pass' if overall_passed else 'fail',
-                    'details': _("L: {:.1f} RMS, R: {:.1f} RMS [Threshold: >{}]").format(
-                        rms_l, rms_r, self.QC_THRESHOLD),
-                    'evaluation_data': {
-                        'rms_L': rms_l,
-                        'rms_R': rms_r,
-                        'left_passed': left_passed,
-                        'right_passed': right_passed,
-                        'threshold': self.QC_THRESHOLD
-                    },
-                    'raw_response': data,
-                    'timestamp': time.time()
-                }
-
-                self.test_results.append(result)
-                self.log('success' if overall_passed else 'error',
-                        _("Test completed: {}").format(_("PASS") if overall_passed else _("FAIL")))
-
-                # Continue to next test or complete
-                self.current_test = None
+    def register_handler(self, kind: str, handler: Callable[[Any], None]):
+        """Route unsolicited messages of a kind (or 'text') to handler"""
+        self.handlers[kind] = handler
 
-        except Exception as e:
-            self.log('error', _("Error processing mic test: {}").format(str(e)))
+    def dispatch_message(self, message):
+        """Route one complete message: to the request it answers, else to the handler for its kind"""
+        if isinstance(message, str):
+            self.log('info', f"[BLE RX] {message}")
+            kind, reply = TEXT_KIND, {'kind': TEXT_KIND, 'text': message}
+        else:
+            self.log('info', f"[BLE RX] {json.dumps(message, ensure_ascii=False)}")
+            kind, reply = message.get('kind') or message.get('type'), message
+
+        if self.resolve_pending(reply):
+            return
+        handler = self.handlers.get(kind)
+        if handler is None and isinstance(message, dict):
+            handler = self.handlers.get(message.get('type'))
+        if handler:
+            handler(message)
+        else:
+            self.log('info', _("Unhandled message type: {}").format(kind or 'unknown'))
 
     def handle_instruction(self, data: Dict[str, Any]):
         """Handle instruction messages from device"""
@@ -227,68 +381,147 @@ class BluetoothQCTester:
 
     def handle_text_message(self, message: str):
         """Handle plain text messages (legacy compatibility)"""
-        if 'PASS' in message or 'FAIL' in message:
-            status = 'pass' if 'PASS' in message else 'fail'
-            if self.current_test:
-                result = {
-                    'name': self.current_test['name'],
-                    'status': status,
-                    'details': message,
-                    'timestamp': time.time()
-                }
-                self.test_results.append(result)
-                self.log('success' if status == 'pass' else 'error',
-                        _("Received test result: {}").format(status.upper()))
-                self.current_test = None
-
-    async def send_command(self, command: str, payload: Optional[Dict] = None) -> bool:
-        """Send command to Bluetooth device"""
+        if is_text_verdict(message):
+            # Verdicts answer a pending request; one arriving here has no test waiting for it
+            self.log('warning', _("Test result with no test running: {}").format(message))
+
+    async def send_command(self, command: str, payload: Optional[Dict] = None,
+                           command_id: str = None) -> Optional[str]:
+        """Send command to Bluetooth device. Returns the command id, or None if sending failed"""
         if not self.client or not self.is_connected:
             self.log('error', _("Not connected to device"))
-            return False
+            return None
 
         try:
             # Construct the JSON string manually to avoid any potential issues with json.dumps
-            command_id = f"{command}_{int(time.time())}"
+            command_id = command_id or self.new_command_id(command)
             payload_str = json.dumps(payload or {})
             
             json_command = f'{{"id":"{command_id}","type":"{command}","payload":{payload_str}}}'
             command_bytes = json_command.encode('utf-8')
 
             self.log('info', f"[BLE TX] {json_command}")
-            await self.client.write_gatt_char(self.QA_CONTROL_UUID, command_bytes)
+            if self.write_lock is None:
+                self.write_lock = asyncio.Lock()
+            # Commands in flight share the control characteristic: one write at a time
+            async with self.write_lock:
+                await self.client.write_gatt_char(self.QA_CONTROL_UUID, command_bytes)
 
-            return True
+            return command_id
 
         except Exception as e:
             self.log('error', _("Failed to send command: {}").format(str(e)))
-            return False
-
-    async def run_test(self, test_index: int) -> bool:
-        """Run a specific QC test"""
-        if not self.is_connected:
-            self.log('error', _("Not connected - cannot run tests"))
-            return False
-
-        if test_index >= len(self.tests):
-            self.log('error', _("Invalid test index: {}").format(test_index))
-            return False
-
-        test = self.tests[test_index]
-        self.current_test = test
-
-        self.log('info', _("Starting test: {}").format(test['name']))
-
-        # Send command
-        success = await self.send_command(test['command'], test['payload'])
-
-        if success:
-            # Set timeout for test
-            self.test_timeout = time.time() + (test['timeout'] / 1000)
-            return True
-        else:
-            self.current_test = None
-            return False
+            return None
+
+    def new_command_id(self, command: str) -> str:
+        """Command id, unique per tester even for several commands within one second"""
+        return f"{command}_{int(time.time())}_{next(self.command_counter)}"
+
+    async def send_request(self, command: str, payload: Optional[Dict] = None, timeout: float = 10.0,
+                           response_kind: str = None,
+                           is_final: Callable[[Dict[str, Any]], bool] = None) -> Optional[asyncio.Future]:
+        """Send a command and return a future for its reply.
+
+        The future resolves with the first reply is_final accepts (any reply
+        when it is None); other replies to the command are progress and are
+        only logged. It fails with
+        asyncio.TimeoutError after timeout seconds or ConnectionError on
+        disconnect. Returns None if the command could not be sent. Any number
+        of requests may be in flight on one connection.
+        """
+        loop = asyncio.get_running_loop()
+        request = PendingRequest(self.new_command_id(command), response_kind, loop, is_final)
+        # Registered before sending so a fast reply cannot be missed
+        with self.pending_lock:
+            self.pending_requests[request.id] = request
+
+        def cleanup(_future):
+            # Resolved, failed or cancelled by the caller: the id is no longer pending
+            self._discard_request(request.id)
+        request.future.add_done_callback(cleanup)
+
+        if not await self.send_command(command, payload, request.id):
+            self._discard_request(request.id)
+            return None
+        request.sent = time.monotonic()
+        request.timer = loop.call_later(timeout, self._fail_request, request.id, asyncio.TimeoutError())
+        return request.future
+
+    async def execute_command(self, command: str, payload: Optional[Dict] = None, timeout: float = 10.0,
+                              response_kind: str = None,
+                              is_final: Callable[[Dict[str, Any]], bool] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Send a command and wait for its reply.
+
+        Returns (reply, 'ok'), (None, 'timeout') or (None, 'send') when the
+        command could not be sent or the connection dropped.
+        """
+        future = await self.send_request(command, payload, timeout, response_kind, is_final)
+        if future is None:
+            return None, 'send'
+        try:
+            return await future, 'ok'
+        except asyncio.TimeoutError:
+            self.log('error', _("No reply to {} within {:.1f}s").format(command, timeout))
+            return None, 'timeout'
+        except ConnectionError:
+            return None, 'send'
+        finally:
+            # Caller cancelled: drop the request
+            future.cancel()
+
+    def resolve_pending(self, message: Dict[str, Any]) -> bool:
+        """Hand a reply to the request it answers. False if no request is waiting for it.
+
+        Matches the command id the firmware echoes ('reply_to', 'request_id'
+        or 'id'); replies without a known id go to the oldest request
+        expecting their kind. Legacy firmware answers any command with plain
+        text PASS/FAIL, which goes to the oldest request. A reply the request
+        does not accept as final is consumed without resolving it.
+        """
+        kind = message.get('kind') or message.get('type')
+        with self.pending_lock:
+            request = None
+            for key in ('reply_to', 'request_id', 'id'):
+                if message.get(key) in self.pending_requests:
+                    request = self.pending_requests[message[key]]
+                    break
+            if request is None:
+                request = next((r for r in self.pending_requests.values() if r.kind and r.kind == kind), None)
+            if request is None and kind == TEXT_KIND and is_text_verdict(message.get('text', '')):
+                request = next(iter(self.pending_requests.values()), None)
+            if request is None:
+                return False
+            if kind != TEXT_KIND and request.is_final and not request.is_final(message):
+                return True
+            del self.pending_requests[request.id]
+
+        def resolve():
+            if request.timer:
+                request.timer.cancel()
+            if not request.future.done():
+                request.future.set_result(message)
+        # Notifications may arrive on a backend thread
+        request.loop.call_soon_threadsafe(resolve)
+        return True
+
+    def _fail_request(self, request_id: str, error: Exception):
+        request = self._discard_request(request_id)
+        if request and not request.future.done():
+            request.future.set_exception(error)
+
+    def _discard_request(self, request_id: str) -> Optional[PendingRequest]:
+        with self.pending_lock:
+            request = self.pending_requests.pop(request_id, None)
+        if request and request.timer:
+            request.timer.cancel()
+        return request
+
+    def cancel_pending(self):
+        """Fail every outstanding request (connection lost or closed)"""
+        with self.pending_lock:
+            requests = list(self.pending_requests.values())
+        for request in requests:
+            request.loop.call_soon_threadsafe(self._fail_request, request.id, ConnectionError(_("Disconnected")))
 
     def get_test_results(self) -> list:
         """Get all test results"""
@@ -300,6 +533,7 @@ class BluetoothQCTester:
 
     async def disconnect(self):
         """Disconnect from Bluetooth device"""
+        self.cancel_pending()
         if self.client and self.is_connected:
             try:
                 await self.client.disconnect()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Boot Log Parser Module
+Extracts typed fields (BLE MAC, name, ready marker, ...) from device boot logs
+"""
+
+import re
+import configparser
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --- Configuration ---
+BOOT_LOG_SECTION = "boot_log"   # config.ini section with extra "<field> = <regex>" markers
+
+FIELD_STR = 'str'
+FIELD_MAC = 'mac'
+FIELD_INT = 'int'
+FIELD_FLAG = 'flag'
+
+_CONVERTERS = {
+    FIELD_STR: lambda value: value.strip(),
+    FIELD_MAC: lambda value: value.strip().upper(),
+    FIELD_INT: lambda value: int(value.strip(), 0),
+    FIELD_FLAG: lambda value: True,
+}
+
+
+class BootLogField:
+    """One value announced by the firmware on the serial console.
+
+    pattern is a regex with at most one capture group; the captured text is
+    converted according to field_type. FIELD_FLAG fields need no group and
+    simply become True when their line appears.
+    """
+
+    def __init__(self, name: str, pattern: str, field_type: str = FIELD_STR, label: str = None):
+        if field_type not in _CONVERTERS:
+            raise ValueError(f"Unknown boot log field type: {field_type}")
+        self.name = name
+        self.pattern = pattern
+        self.field_type = field_type
+        self.label = label
+        if re.compile(pattern).groups > 1:
+            raise ValueError(f"Boot log field '{name}' must have at most one capture group")
+
+    def convert(self, value: Optional[str]) -> Any:
+        return _CONVERTERS[self.field_type](value or "")
+
+
+# Fields printed by the production firmware while it brings up BLE
+DEFAULT_FIELDS = [
+    BootLogField('mac', r'Bluetooth MAC: ([\w:]+)', FIELD_MAC, "Bluetooth MAC"),
+    BootLogField('name', r'Setting device name to: ([\w-]+)', FIELD_STR, "Bluetooth Name"),
+    BootLogField('ready', r'The device is now discoverable and ready for connection!', FIELD_FLAG),
+]
+DEFAULT_REQUIRED = ('mac', 'name')
+DEFAULT_TRIGGER = 'ready'
+
+
+def load_boot_log_fields(config_file: str) -> List[BootLogField]:
+    """DEFAULT_FIELDS plus the [boot_log] fields of config.ini.
+
+    Each entry is '<field> = <regex>' with one capture group, optionally
+    prefixed by a type: 'firmware_version = str:Firmware version: ([\\w.]+)'.
+    """
+    fields = list(DEFAULT_FIELDS)
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        config.read(config_file, encoding='utf-8')
+    except configparser.Error as e:
+        print(f"Warning: Could not read boot log fields: {e}")
+        return fields
+    if not config.has_section(BOOT_LOG_SECTION):
+        return fields
+
+    defaults = config.defaults()
+    for name, value in config.items(BOOT_LOG_SECTION):
+        if name in defaults:
+            continue
+        field_type, _sep, pattern = value.partition(':')
+        if field_type not in _CONVERTERS:
+            field_type, pattern = FIELD_STR, value
+        try:
+            field = BootLogField(name, pattern, field_type, name.replace('_', ' ').capitalize())
+        except (ValueError, re.error) as e:
+            print(f"Warning: Ignoring boot log field '{name}': {e}")
+            continue
+        fields = [f for f in fields if f.name != name] + [field]
+    return fields
+
+
+class BootLogMatcher:
+    """All field patterns compiled into one alternation, shared by every monitor"""
+
+    def __init__(self, fields: List[BootLogField] = None):
+        self.fields = list(fields or DEFAULT_FIELDS)
+        self.by_group = {}
+        parts = []
+        for index, field in enumerate(self.fields):
+            group = f"f{index}"
+            pattern = field.pattern
+            if re.compile(pattern).groups == 0:
+                pattern = f"(?:{pattern})()"
+            parts.append(f"(?P<{group}>{pattern})")
+            self.by_group[group] = field
+        self.regex = re.compile("|".join(parts))
+
+    def match(self, line: str) -> List[Tuple[BootLogField, Any]]:
+        """(field, converted value) for every marker found in the line"""
+        found = []
+        for match in self.regex.finditer(line):
+            group = match.lastgroup
+            field = self.by_group[group]
+            # The value group is the one right after the field's named group
+            value = match.group(match.re.groupindex[group] + 1)
+            try:
+                found.append((field, field.convert(value)))
+            except ValueError:
+                continue
+        return found
+
+
+class BootLogParser:
+    """Per-device parse state fed line by line from one serial monitor.
+
+    Captured values are kept in self.values. When the trigger field is seen
+    (or, without a trigger, as soon as every required field is present) and
+    all required fields are known, on_complete(values) is called and the
+    state starts over for the next boot.
+    """
+
+    def __init__(self, matcher: BootLogMatcher = None,
+                 required=DEFAULT_REQUIRED, trigger: Optional[str] = DEFAULT_TRIGGER,
+                 on_complete: Callable[[Dict[str, Any]], None] = None,
+                 on_field: Callable[[BootLogField, Any], None] = None):
+        self.matcher = matcher or default_matcher
+        self.required = tuple(required)
+        self.trigger = trigger
+        self.on_complete = on_complete
+        self.on_field = on_field
+        self.values: Dict[str, Any] = {}
+
+    def is_complete(self) -> bool:
+        return all(name in self.values for name in self.required)
+
+    def feed(self, line: str) -> List[Tuple[BootLogField, Any]]:
+        """Parse one line. Returns the fields captured from it."""
+        found = self.matcher.match(line)
+        for field, value in found:
+            self.values[field.name] = value
+            if self.on_field:
+                self.on_field(field, value)
+            if self.trigger is None or field.name == self.trigger:
+                if self.is_complete():
+                    values, self.values = self.values, {}
+                    if self.on_complete:
+                        self.on_complete(values)
+        return found
+
+    def reset(self):
+        self.values = {}
+
+
+# Matcher for the built-in fields
+default_matcher = BootLogMatcher()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Build Index Module
+TTL-cached, conditionally revalidated index of /api/builds and /api/testing-builds
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from typing import Dict, List, Optional
+
+# --- Configuration ---
+DINOCORE_BASE_URL = "https://dinocore-telemetry-production.up.railway.app/"
+INDEX_CACHE_DIR = "firmware_cache"
+DEFAULT_TTL = 300  # seconds before the index is revalidated against the server
+REQUEST_TIMEOUT = 15
+
+
+class BuildIndex:
+    """In-memory and on-disk index of DinoCore builds keyed by hardware version.
+
+    The build list is revalidated with If-None-Match / If-Modified-Since once it
+    is older than ttl seconds. With stale_while_revalidate enabled a stale index
+    is served immediately while the refresh runs in a background thread.
+    """
+
+    def __init__(self, base_url: str, api_path: str, ttl: float = DEFAULT_TTL,
+                 stale_while_revalidate: bool = True, cache_dir: str = INDEX_CACHE_DIR):
+        self.url = f"{base_url.rstrip('/')}/api/{api_path}"
+        self.api_path = api_path
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        url_hash = hashlib.sha1(self.url.encode('utf-8')).hexdigest()[:8]
+        self.cache_file = os.path.join(cache_dir, f"index_{api_path}_{url_hash}.json")
+
+        self.session = requests.Session()
+        self.lock = threading.RLock()
+        self.refresh_thread = None
+
+        self.builds = []
+        self.by_version = {}
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0
+
+        self._load_from_disk()
+
+    # --- Persistence ---
+    def _load_from_disk(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._set_builds(data.get('builds', []))
+            self.etag = data.get('etag')
+            self.last_modified = data.get('last_modified')
+            self.fetched_at = data.get('fetched_at', 0.0)
+        except (OSError, ValueError):
+            pass
+
+    def _save_to_disk(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_path = self.cache_file + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'url': self.url,
+                    'etag': self.etag,
+                    'last_modified': self.last_modified,
+                    'fetched_at': self.fetched_at,
+                    'builds': self.builds,
+                }, f)
+            os.replace(temp_path, self.cache_file)
+        except OSError as e:
+            print(f"Warning: Could not save build index: {e}")
+
+    def _set_builds(self, builds: List[Dict]):
+        by_version = {}
+        for build in sorted(builds, key=lambda b: b.get('created_at', ''), reverse=True):
+            for version in build.get('supported_versions', []):
+                by_version.setdefault(version, []).append(build)
+        self.builds = builds
+        self.by_version = by_version
+
+    # --- Revalidation ---
+    def is_fresh(self) -> bool:
+        return bool(self.fetched_at) and (time.time() - self.fetched_at) < self.ttl
+
+    def refresh(self) -> bool:
+        """Revalidate the index against the server. Returns True if it changed.
+
+        Raises requests.exceptions.RequestException on network errors.
+        """
+        headers = {}
+        with self.lock:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        response = self.session.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            with self.lock:
+                self.fetched_at = time.time()
+                self._save_to_disk()
+            return False
+
+        response.raise_for_status()
+        builds = response.json()
+        with self.lock:
+            self._set_builds(builds)
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            self.fetched_at = time.time()
+            self._save_to_disk()
+        return True
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except requests.exceptions.RequestException as e:
+            print(f"Warning: Background build index refresh failed: {e}")
+
+    def _ensure(self, revalidate: bool = False):
+        if self.is_fresh() and not revalidate:
+            return
+
+        with self.lock:
+            have_data = bool(self.fetched_at)
+            if have_data and self.stale_while_revalidate and not revalidate:
+                if not (self.refresh_thread and self.refresh_thread.is_alive()):
+                    self.refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+                    self.refresh_thread.start()
+                return
+
+        try:
+            self.refresh()
+        except requests.exceptions.RequestException as e:
+            if not have_data:
+                raise
+            print(f"Warning: Could not revalidate {self.api_path} index, using cached copy: {e}")
+
+    # --- Lookup ---
+    def get_all_builds(self, revalidate: bool = False) -> List[Dict]:
+        """Return the full build list"""
+        self._ensure(revalidate)
+        with self.lock:
+            return list(self.builds)
+
+    def get_compatible_builds(self, hardware_version: str, revalidate: bool = False) -> List[Dict]:
+        """Return builds supporting a hardware version, newest first"""
+        self._ensure(revalidate)
+        with self.lock:
+            return list(self.by_version.get(hardware_version, []))
+
+    def get_latest_build(self, hardware_version: str, revalidate: bool = False) -> Optional[Dict]:
+        """Return the newest build supporting a hardware version or None"""
+        self._ensure(revalidate)
+        with self.lock:
+            builds = self.by_version.get(hardware_version)
+            return builds[0] if builds else None
+
+
+# Shared indexes per (base url, api path)
+_build_indexes = {}
+_build_indexes_lock = threading.Lock()
+_index_settings = {'ttl': DEFAULT_TTL, 'stale_while_revalidate': True}
+
+def configure_build_indexes(ttl: float = None, stale_while_revalidate: bool = None):
+    """Set TTL / stale-while-revalidate for existing and future build indexes"""
+    with _build_indexes_lock:
+        if ttl is not None:
+            _index_settings['ttl'] = ttl
+        if stale_while_revalidate is not None:
+            _index_settings['stale_while_revalidate'] = stale_while_revalidate
+        for index in _build_indexes.values():
+            index.ttl = _index_settings['ttl']
+            index.stale_while_revalidate = _index_settings['stale_while_revalidate']
+
+def get_build_index(api_path: str, base_url: str = DINOCORE_BASE_URL) -> BuildIndex:
+    """Get the shared index for 'builds' or 'testing-builds'"""
+    key = (base_url.rstrip('/'), api_path)
+    with _build_indexes_lock:
+        index = _build_indexes.get(key)
+        if index is None:
+            index = BuildIndex(base_url, api_path, **_index_settings)
+            _build_indexes[key] = index
+        return index
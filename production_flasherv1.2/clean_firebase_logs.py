@@ -1,52 +1,215 @@
 #!/usr/bin/env python3
 """
-Script to clean all test logs from Firebase
+Script to clean test logs from Firebase
+Pages through collections by cursor and deletes in parallel batched writes
 """
 
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
 from firebase_db import get_firebase_db, init_firebase_with_credentials
+from session_log_store import SESSION_COLLECTION, CHUNK_SUBCOLLECTION
+
+# --- Configuration ---
+PAGE_SIZE = 500          # Documents fetched per cursor page
+BATCH_SIZE = 500         # Deletes per batched write (Firestore maximum)
+DELETE_WORKERS = 4       # Batches committed in parallel
+DEFAULT_COLLECTIONS = (SESSION_COLLECTION, 'flash_logs')   # QC results are kept unless asked for
+
+
+def parse_filter(text: str):
+    """'field=value' -> (field, '==', value) with numbers and booleans converted"""
+    field, sep, value = text.partition('=')
+    if not sep or not field:
+        raise argparse.ArgumentTypeError(f"Filter must be field=value: {text}")
+    if value.lower() in ('true', 'false'):
+        return field, '==', value.lower() == 'true'
+    try:
+        return field, '==', int(value)
+    except ValueError:
+        pass
+    try:
+        return field, '==', float(value)
+    except ValueError:
+        return field, '==', value
+
+
+class FirestoreCleaner:
+    """Deletes the documents matched by a query without loading the collection.
+
+    The query is read page by page with a start_after() cursor, and each
+    page is deleted in batched writes of up to batch_size, committed by a
+    pool of workers while the next page is fetched. Session logs also lose
+    their chunk subcollection. In dry-run mode matches are only counted.
+    """
+
+    def __init__(self, db, page_size: int = PAGE_SIZE, batch_size: int = BATCH_SIZE,
+                 workers: int = DELETE_WORKERS, dry_run: bool = False):
+        self.db = db
+        self.page_size = page_size
+        self.batch_size = min(batch_size, 500)
+        self.workers = workers
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.deleted = 0
+        self.errors = 0
+
+    def build_query(self, collection: str, older_than: datetime = None, filters=()):
+        """Server-side filters: timestamp cutoff and field equality tags"""
+        query = self.db.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        if older_than is not None:
+            query = query.where('timestamp', '<', older_than)
+        return query
+
+    def count(self, query) -> int:
+        """Matching documents, via an aggregation query when the client supports it"""
+        try:
+            return int(query.count().get()[0][0].value)
+        except Exception:
+            # Older clients: page through ids only
+            return sum(len(page) for page in self.pages(query.select([])))
+
+    def pages(self, query):
+        """Document snapshots in pages of page_size, following a cursor"""
+        cursor = None
+        while True:
+            page_query = query.limit(self.page_size)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            page = list(page_query.stream())
+            if not page:
+                return
+            yield page
+            if len(page) < self.page_size:
+                return
+            cursor = page[-1]
+
+    def clean(self, collection: str, older_than: datetime = None, filters=()) -> int:
+        """Delete (or count, in dry-run mode) the matching documents. Returns the count."""
+        query = self.build_query(collection, older_than, filters)
+        if self.dry_run:
+            total = self.count(query)
+            print(f"🔎 {collection}: {total} documents would be deleted")
+            return total
 
-def clean_firebase_logs():
-    """Clean all test logs from Firebase collections"""
-    print("🧹 Cleaning ALL Firebase logs...")
+        start = time.time()
+        self.deleted = self.errors = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for page in self.pages(query):
+                refs = [doc.reference for doc in page]
+                if collection == SESSION_COLLECTION:
+                    # Chunks first, so a half-finished run never leaves orphaned chunks
+                    refs = self._delete_chunks(pool, refs)
+                # Wait for this page before reading past it with the cursor
+                self._delete_all(pool, refs)
+                elapsed = max(time.time() - start, 1e-6)
+                print(f"🗑️ {collection}: {self.deleted} deleted ({self.deleted / elapsed:.0f} docs/s)")
+
+        elapsed = time.time() - start
+        print(f"✅ {collection}: {self.deleted} documents deleted in {elapsed:.1f}s"
+              + (f", {self.errors} failed" if self.errors else ""))
+        return self.deleted
+
+    def _submit_batches(self, pool, refs):
+        return [pool.submit(self._delete_batch, refs[i:i + self.batch_size])
+                for i in range(0, len(refs), self.batch_size)]
+
+    def _delete_all(self, pool, refs) -> bool:
+        """Delete refs in parallel batches and wait for them. True if every batch committed"""
+        return all([future.result() for future in self._submit_batches(pool, refs)])
+
+    def _delete_chunks(self, pool, session_refs):
+        """Delete the chunks of a page of sessions; returns the sessions whose chunks are all gone.
+
+        Batches never mix sessions, so one failed batch only keeps its own session."""
+        submitted = []
+        for session_ref in session_refs:
+            chunk_refs = []
+            for page in self.pages(session_ref.collection(CHUNK_SUBCOLLECTION).select([])):
+                chunk_refs.extend(doc.reference for doc in page)
+            submitted.append((session_ref, self._submit_batches(pool, chunk_refs)))
+
+        deletable = []
+        for session_ref, futures in submitted:
+            if all([future.result() for future in futures]):
+                deletable.append(session_ref)
+            else:
+                print(f"⚠️ Keeping session {session_ref.id}: some of its chunks could not be deleted")
+                with self.lock:
+                    self.errors += 1
+        return deletable
+
+    def _delete_batch(self, refs) -> bool:
+        batch = self.db.batch()
+        for ref in refs:
+            batch.delete(ref)
+        try:
+            batch.commit()
+        except Exception as e:
+            print(f"❌ Batch delete failed ({len(refs)} documents): {e}")
+            with self.lock:
+                self.errors += len(refs)
+            return False
+        with self.lock:
+            self.deleted += len(refs)
+        return True
+
+
+def clean_firebase_logs(collections=DEFAULT_COLLECTIONS, older_than_days: float = None,
+                        filters=(), dry_run: bool = False, workers: int = DELETE_WORKERS,
+                        batch_size: int = BATCH_SIZE):
+    """Clean test logs from Firebase collections"""
+    print("🧹 Cleaning Firebase logs..." + (" (dry run)" if dry_run else ""))
 
     if not init_firebase_with_credentials():
         print("❌ Failed to initialize Firebase")
         return False
 
     firebase_db = get_firebase_db()
+    cleaner = FirestoreCleaner(firebase_db.db, batch_size=batch_size, workers=workers, dry_run=dry_run)
+    older_than = None
+    if older_than_days is not None:
+        older_than = datetime.now(timezone.utc) - timedelta(days=older_than_days)
 
     try:
-        # Clean session logs (only ones containing test indicators)
-        session_docs = firebase_db.db.collection('logs').stream()
-        session_deleted = 0
-        for doc in session_docs:
-            data = doc.to_dict()
-            if ('session_logs' in data and
-                any('test' in str(log).lower() or 'production flasher v1' in str(log).lower()
-                    for log in data.get('session_logs', []))):
-                doc.reference.delete()
-                session_deleted += 1
-                print(f"🗑️ Deleted test session log: {doc.id}")
-
-        # Clean flash logs (on-site)
-        flash_docs = firebase_db.db.collection('flash_logs').stream()
-        flash_deleted = 0
-        for doc in flash_docs:
-            doc.reference.delete()
-            flash_deleted += 1
-            print(f"🗑️ Deleted flash log: {doc.id}")
-
-        # Keep QC results as they seem to be real (no test indicators)
-
-        print("\n✅ Firebase cleanup completed!")
-        print(f"   🗂️ Session logs deleted: {session_deleted}")
-        print(f"   ⚡ Flash logs deleted: {flash_deleted}")
-        print("   🔵 QC results preserved")
+        totals = {collection: cleaner.clean(collection, older_than, filters) for collection in collections}
+
+        print("\n✅ Firebase cleanup completed!" if not dry_run else "\n✅ Dry run completed!")
+        for collection, total in totals.items():
+            print(f"   🗂️ {collection}: {total} {'matching' if dry_run else 'deleted'}")
+        if 'qc_results' not in collections:
+            print("   🔵 QC results preserved")
         return True
 
     except Exception as e:
         print(f"❌ Error during cleanup: {e}")
         return False
 
+def main():
+    parser = argparse.ArgumentParser(description="Delete test logs from Firebase in bulk")
+    parser.add_argument('collections', nargs='*', default=list(DEFAULT_COLLECTIONS),
+                        help=f"Collections to clean (default: {' '.join(DEFAULT_COLLECTIONS)})")
+    parser.add_argument('--older-than-days', type=float, help="Only documents older than this many days")
+    parser.add_argument('--where', dest='filters', action='append', type=parse_filter, default=[],
+                        metavar='FIELD=VALUE', help="Only documents with this field value (repeatable), e.g. source=batch")
+    parser.add_argument('--all', action='store_true', help="Allow cleaning without any filter")
+    parser.add_argument('--dry-run', action='store_true', help="Only count the matching documents")
+    parser.add_argument('--workers', type=int, default=DELETE_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not (args.filters or args.older_than_days is not None or args.all or args.dry_run):
+        parser.error("refusing to delete whole collections: pass --where, --older-than-days or --all")
+
+    ok = clean_firebase_logs(args.collections, args.older_than_days, args.filters,
+                             args.dry_run, args.workers, args.batch_size)
+    return 0 if ok else 1
+
 if __name__ == "__main__":
-    clean_firebase_logs()
+    sys.exit(main())
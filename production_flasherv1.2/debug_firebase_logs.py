@@ -8,8 +8,12 @@ import os
 import sys
 import json
 import time
+import queue
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional
 
 # Add the current directory to the path to import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -24,15 +28,39 @@ except ImportError:
     print("❌ Firebase not available - install firebase-admin: pip install firebase-admin")
     firebase_admin = None
 
+from session_log_store import FORMAT_CHUNKED, CHUNK_SUBCOLLECTION, SESSION_COLLECTION, UPLOADED_FIELD, reassemble_records
+from firebase_log_cache import FirebaseLogCache, CACHE_FILE
+from storage_backend import LocalBackend, BACKENDS, BACKEND_LOCAL, configured_backend_name
+
+# --- Configuration ---
+PAGE_SIZE = 300              # Documents per cursor page
+EXPORT_QUEUE_SIZE = 1000     # Documents buffered between the fetch threads and the export writer
+# Result key -> Firestore collection
+COLLECTIONS = {
+    'session_logs': 'logs',
+    'flash_logs': 'flash_logs',
+    'qc_results': 'qc_results',
+}
+# Server-side time field windows are queried and cached on. Session documents keep the
+# station's start time in 'timestamp', so they are windowed by their upload time instead.
+WINDOW_FIELDS = {SESSION_COLLECTION: UPLOADED_FIELD}
+
 class FirebaseLogsDebugger:
     """Firebase logs debugger for remote troubleshooting"""
 
-    def __init__(self):
+    def __init__(self, cache_path: Optional[str] = CACHE_FILE):
         self.db = None
         self.initialized = False
+        # Documents fetched earlier are reused; pass cache_path=None to always refetch
+        self.cache = FirebaseLogCache(cache_path) if cache_path else None
+
+    def initialize_firebase(self, backend_name: str = None) -> bool:
+        """Initialize Firebase connection (or open the local store of an offline station)"""
+        if (backend_name or configured_backend_name()) == BACKEND_LOCAL:
+            self.db = LocalBackend().connect()
+            self.initialized = True
+            return True
 
-    def initialize_firebase(self) -> bool:
-        """Initialize Firebase connection"""
         if not FIREBASE_AVAILABLE:
             return False
 
@@ -78,80 +106,126 @@ class FirebaseLogsDebugger:
             print(f"❌ Firebase initialization error: {e}")
             return False
 
+    def iter_documents(self, collection: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """Documents of a collection stored in [start, end) (see WINDOW_FIELDS), oldest first.
+
+        With the cache, only the parts of the window that were never fetched
+        are read from Firestore (page by page); everything else, and open
+        sessions refreshed by id, comes from the local cache.
+        """
+        if self.cache is None:
+            yield from self._fetch_window(collection, start, end)
+            return
+
+        for gap_start, gap_end in self.cache.missing_ranges(collection, start.timestamp(), end.timestamp()):
+            for data in self._fetch_window(collection, self._utc(gap_start), self._utc(gap_end)):
+                self._cache_document(collection, data)
+            self.cache.add_range(collection, gap_start, gap_end)
+
+        for data, complete in self.cache.iter_range(collection, start.timestamp(), end.timestamp()):
+            if not complete:
+                data = self._refetch(collection, data)
+            if data is not None:
+                yield data
+
+    def _fetch_window(self, collection: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """Cursor-paginated query over a time window"""
+        field = WINDOW_FIELDS.get(collection, 'timestamp')
+        yield from self._query_window(collection, field, start, end)
+        if field != 'timestamp':
+            # Documents written before the upload time was recorded
+            for data in self._query_window(collection, 'timestamp', start, end):
+                if field not in data:
+                    yield data
+
+    def _query_window(self, collection: str, field: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        query = (self.db.collection(collection)
+                 .where(field, '>=', start).where(field, '<', end)
+                 .order_by(field).limit(PAGE_SIZE))
+        cursor = None
+        while True:
+            page = list((query.start_after(cursor) if cursor is not None else query).stream())
+            for doc in page:
+                yield self._document_data(collection, doc)
+            if len(page) < PAGE_SIZE:
+                return
+            cursor = page[-1]
+
+    def _refetch(self, collection: str, cached: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        doc = self.db.collection(collection).document(cached['id']).get()
+        if not doc.exists:
+            return None
+        data = self._document_data(collection, doc)
+        self._cache_document(collection, data)
+        return data
+
+    @staticmethod
+    def _document_data(collection: str, doc) -> Dict[str, Any]:
+        data = doc.to_dict()
+        data['id'] = doc.id
+        data['collection'] = collection
+        return data
+
+    @staticmethod
+    def _utc(seconds: float) -> datetime:
+        return datetime.fromtimestamp(seconds, timezone.utc)
+
+    def _cache_document(self, collection: str, data: Dict[str, Any]):
+        if self.cache is None:
+            return
+        timestamp = data.get(WINDOW_FIELDS.get(collection, 'timestamp'), data.get('timestamp'))
+        ts = timestamp.timestamp() if isinstance(timestamp, datetime) else 0.0
+        # Open sessions still get chunks; they are refetched until closed
+        complete = data.get('status') != 'open'
+        self.cache.put(collection, data['id'], ts, data, complete)
+
+    def with_content(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Session log with its chunks reassembled (cached once the session is closed)"""
+        if data.get('collection') == 'logs' and data.get('format') == FORMAT_CHUNKED and 'log_content' not in data:
+            if self.load_session_chunks(self.db.collection('logs').document(data['id']), data):
+                self._cache_document('logs', data)
+        return data
+
     def get_recent_logs(self, hours: int = 24, limit: int = 100) -> Dict[str, List[Dict[str, Any]]]:
-        """Get recent logs from all collections"""
+        """Get the newest `limit` documents of each collection from the last `hours` (queried concurrently)"""
         if not self.initialized or not self.db:
             return {}
 
-        try:
-            # Calculate time threshold
-            time_threshold = datetime.now(timezone.utc) - timedelta(hours=hours)
-
-            all_logs = {
-                'session_logs': [],
-                'flash_logs': [],
-                'qc_results': []
-            }
-
-            # Get session logs
-            try:
-                print(f"📥 Downloading session logs (last {hours}h)...")
-                logs_ref = self.db.collection('logs')
-                query = logs_ref.where('timestamp', '>=', time_threshold).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
-                docs = query.stream()
-
-                for doc in docs:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    data['collection'] = 'logs'
-                    all_logs['session_logs'].append(data)
-
-                print(f"   ✅ Found {len(all_logs['session_logs'])} session logs")
-
-            except Exception as e:
-                print(f"   ⚠️ Error getting session logs: {e}")
-
-            # Get flash logs
-            try:
-                print(f"📥 Downloading flash logs (last {hours}h)...")
-                flash_ref = self.db.collection('flash_logs')
-                query = flash_ref.where('timestamp', '>=', time_threshold).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
-                docs = query.stream()
-
-                for doc in docs:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    data['collection'] = 'flash_logs'
-                    all_logs['flash_logs'].append(data)
+        end = datetime.now(timezone.utc)
+        start = end - timedelta(hours=hours)
 
-                print(f"   ✅ Found {len(all_logs['flash_logs'])} flash logs")
-
-            except Exception as e:
-                print(f"   ⚠️ Error getting flash logs: {e}")
-
-            # Get QC results
+        def fetch(key: str) -> List[Dict[str, Any]]:
             try:
-                print(f"📥 Downloading QC results (last {hours}h)...")
-                qc_ref = self.db.collection('qc_results')
-                query = qc_ref.where('timestamp', '>=', time_threshold).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
-                docs = query.stream()
-
-                for doc in docs:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    data['collection'] = 'qc_results'
-                    all_logs['qc_results'].append(data)
-
-                print(f"   ✅ Found {len(all_logs['qc_results'])} QC results")
-
+                newest = deque(self.iter_documents(COLLECTIONS[key], start, end), maxlen=limit)
+                logs = [self.with_content(data) for data in reversed(newest)]
+                print(f"   ✅ Found {len(logs)} {key.replace('_', ' ')}")
+                return logs
             except Exception as e:
-                print(f"   ⚠️ Error getting QC results: {e}")
+                print(f"   ⚠️ Error getting {key.replace('_', ' ')}: {e}")
+                return []
 
-            return all_logs
+        print(f"📥 Downloading logs (last {hours}h)...")
+        with ThreadPoolExecutor(max_workers=len(COLLECTIONS)) as pool:
+            futures = {key: pool.submit(fetch, key) for key in COLLECTIONS}
+            return {key: future.result() for key, future in futures.items()}
 
+    def load_session_chunks(self, doc_ref, data: Dict[str, Any]) -> bool:
+        """Reassemble a chunked session log into log_content (and structured records).
+        Returns True if every chunk was found."""
+        try:
+            chunks = [chunk.to_dict() for chunk in doc_ref.collection(CHUNK_SUBCOLLECTION).order_by('index').stream()]
+            records = list(reassemble_records(chunks))
         except Exception as e:
-            print(f"❌ Error getting logs: {e}")
-            return {}
+            print(f"   ⚠️ Error reassembling session log {data.get('id')}: {e}")
+            return False
+        data['log_content'] = "\n".join(record.file_text() for record in records)
+        data['records'] = [record.to_dict() for record in records]
+        expected = data.get('chunk_count', len(chunks))
+        if len(chunks) < expected:
+            # Chunks still in a station's outbox (or lost with it)
+            print(f"   ⚠️ Session {data.get('id')}: {len(chunks)}/{expected} chunks uploaded")
+            return False
+        return True
 
     def display_logs(self, logs_data: Dict[str, List[Dict[str, Any]]], show_details: bool = True):
         """Display logs in a formatted way"""
@@ -187,6 +261,8 @@ class FirebaseLogsDebugger:
 
         if log.get('collection') == 'logs':
             log_content = log.get('log_content', 'No content')
+            if log.get('format') == FORMAT_CHUNKED:
+                print(f"📦 {log.get('line_count', 0)} lines in {log.get('chunk_count', 0)} chunks ({log.get('status', 'unknown')})")
             print(f"📝 Content: {log_content[:200]}..." if len(log_content) > 200 else f"📝 Content: {log_content}")
 
         elif log.get('collection') == 'flash_logs':
@@ -238,24 +314,88 @@ class FirebaseLogsDebugger:
             print(f"❌ Error exporting logs: {e}")
             return False
 
+    def export_window_jsonl(self, filename: str, start: datetime, end: datetime,
+                            collections: List[str] = None) -> int:
+        """Stream every document of a time window to a JSONL file, one document per line.
+        Collections are fetched concurrently; memory use stays bounded. Returns the count."""
+        collections = collections or list(COLLECTIONS.values())
+        documents = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        done = object()
+
+        def produce(collection: str):
+            try:
+                for data in self.iter_documents(collection, start, end):
+                    documents.put(self.with_content(data))
+            except Exception as e:
+                print(f"   ⚠️ Error exporting {collection}: {e}")
+            finally:
+                documents.put(done)
+
+        count = 0
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=len(collections)) as pool, \
+                open(filename, 'w', encoding='utf-8') as f:
+            for collection in collections:
+                pool.submit(produce, collection)
+            remaining = len(collections)
+            while remaining:
+                data = documents.get()
+                if data is done:
+                    remaining -= 1
+                    continue
+                f.write(json.dumps(data, default=str, ensure_ascii=False) + "\n")
+                count += 1
+                if count % 1000 == 0:
+                    print(f"   📤 {count} documents exported ({count / (time.time() - started):.0f}/s)")
+
+        print(f"💾 {count} documents exported to: {filename}")
+        return count
+
+def parse_time(text: str) -> datetime:
+    """ISO date/time argument, taken as UTC when no offset is given"""
+    value = datetime.fromisoformat(text)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
 def main():
     """Main debugging function"""
+    parser = argparse.ArgumentParser(description="Download and display DinoCore logs from Firebase")
+    parser.add_argument('--hours', type=float, default=24, help="Window size when --since is not given")
+    parser.add_argument('--limit', type=int, default=50, help="Documents shown per collection")
+    parser.add_argument('--since', type=parse_time, help="Window start (ISO date/time, UTC)")
+    parser.add_argument('--until', type=parse_time, help="Window end (ISO date/time, UTC)")
+    parser.add_argument('--export', metavar='FILE.jsonl', help="Stream the whole window to a JSONL file")
+    parser.add_argument('--collection', action='append', choices=list(COLLECTIONS.values()),
+                        help="Only these collections (repeatable)")
+    parser.add_argument('--backend', choices=list(BACKENDS), help="Storage backend (default: config.ini)")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the local document cache")
+    parser.add_argument('--refresh', action='store_true', help="Clear the local cache first")
+    args = parser.parse_args()
+
     print("🔧 DinoCore Firebase Logs Debugger")
     print("=================================")
 
-    debugger = FirebaseLogsDebugger()
+    debugger = FirebaseLogsDebugger(cache_path=None if args.no_cache else CACHE_FILE)
+    if args.refresh and debugger.cache:
+        debugger.cache.clear()
 
     # Initialize Firebase
-    if not debugger.initialize_firebase():
+    if not debugger.initialize_firebase(args.backend):
         print("❌ Cannot proceed without Firebase connection")
         return 1
 
-    # Get recent logs (last 24 hours by default)
-    print("\n📥 Downloading recent logs from Firebase...")
-    logs_data = debugger.get_recent_logs(hours=24, limit=50)
-
-    # Display logs
-    debugger.display_logs(logs_data)
+    if args.export or args.since:
+        end = args.until or datetime.now(timezone.utc)
+        start = args.since or end - timedelta(hours=args.hours)
+        filename = args.export or f"firebase_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        print(f"\n📥 Exporting {start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M} UTC...")
+        debugger.export_window_jsonl(filename, start, end, args.collection)
+    else:
+        # Get recent logs (last 24 hours by default)
+        print("\n📥 Downloading recent logs from Firebase...")
+        logs_data = debugger.get_recent_logs(hours=args.hours, limit=args.limit)
+
+        # Display logs
+        debugger.display_logs(logs_data)
 
     print("\n✅ Debugging session completed")
     return 0
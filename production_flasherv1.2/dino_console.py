@@ -20,6 +20,13 @@ from serial.tools.list_ports import comports
 import readline
 import atexit
 
+from firmware_cache import get_firmware_cache
+from build_index import get_build_index
+from firmware_downloader import get_firmware_downloader, build_checksums
+from baud_profile import get_baud_profile, is_link_error
+from usb_hotplug import get_port_registry
+from serial_reader import SerialLineReader, SerialDisconnected
+
 # Import local updater module
 try:
     from updater import DinoUpdater
@@ -29,7 +36,7 @@ except ImportError:
     print("⚠️  Update system not available - updater.py not found")
 
 # Configuration
-FLASH_BAUD = "460800"
+FLASH_BAUD = "460800"  # Default until the port is calibrated (see baud_profile.py)
 MONITOR_BAUD = 115200
 DINOCORE_BASE_URL = "https://dinocore-telemetry-production.up.railway.app/"  # Default to production
 FIRMWARE_DIR = "production_firmware"
@@ -56,6 +63,8 @@ class DinoConsole:
         self.base_url = "http://localhost:8000" if use_local else DINOCORE_BASE_URL
         self.devices_cache = []  # Cache for device list
         self.hardware_version = hardware_version
+        # Drop the cached device list whenever a serial port appears or disappears
+        get_port_registry().subscribe(self.on_port_hotplug, esp32_only=False)
         self.loading_active = False
         self.loading_thread = None
         
@@ -177,6 +186,7 @@ Available Commands:
   burn efuse <port>         - Burn hardware version to eFuse
   read efuse <port>         - Read eFuse values on device
   monitor <port>            - Open serial monitor for device
+  calibrate <port>          - Find the fastest reliable flash baud for a port
 
 Update Commands:
   check update              - Check if newer version is available on GitHub
@@ -196,8 +206,8 @@ Typical usage:
         """Get all connected ESP32 devices (internal method)"""
         devices = []
         
-        # Get all serial ports
-        ports = comports()
+        # Get all serial ports (kept current by the hotplug registry)
+        ports = get_port_registry().get_ports()
         
         # Also check for common device patterns on different platforms
         platform_patterns = {
@@ -314,6 +324,10 @@ Typical usage:
         
         return devices
 
+    def on_port_hotplug(self, event, port_info):
+        """Hotplug callback: device numbers must be resolved against a fresh list"""
+        self.devices_cache = []
+
     def resolve_device(self, device_spec):
         """Resolve device specification to port name"""
         # If it's already a port name, return it
@@ -374,23 +388,17 @@ Typical usage:
         self.clear_firmware_cache()
         
         try:
-            # Get all builds from DinoCore API
-            url = f"{self.base_url}/api/builds"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            builds = response.json()
+            # Revalidate the cached build index (cheap conditional request)
+            build_index = get_build_index('builds', self.base_url)
+            builds = build_index.get_all_builds(revalidate=True)
             
             if not builds:
                 print("⚠️  No production builds found in DinoCore")
                 print("   Production firmware flashing will not be available")
                 return False
             
-            # Find all compatible builds for this hardware version
-            compatible_builds = []
-            for build in builds:
-                supported_versions = build.get('supported_versions', [])
-                if self.hardware_version in supported_versions:
-                    compatible_builds.append(build)
+            # Compatible builds for this hardware version, newest first
+            compatible_builds = build_index.get_compatible_builds(self.hardware_version)
             
             if not compatible_builds:
                 print(f"⚠️  No compatible production firmware found for hardware version {self.hardware_version}")
@@ -401,8 +409,6 @@ Typical usage:
                     print(f"     - {build['name']}: {', '.join(versions)}")
                 return False
             
-            # Sort by creation date (newest first) and get the latest
-            compatible_builds.sort(key=lambda x: x['created_at'], reverse=True)
             latest_compatible_build = compatible_builds[0]
             
             # Download fresh firmware
@@ -443,23 +449,17 @@ Typical usage:
         self.clear_testing_firmware_cache()
         
         try:
-            # Get all testing builds from DinoCore API
-            url = f"{self.base_url}/api/testing-builds"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            builds = response.json()
+            # Revalidate the cached testing build index (cheap conditional request)
+            build_index = get_build_index('testing-builds', self.base_url)
+            builds = build_index.get_all_builds(revalidate=True)
             
             if not builds:
                 print("⚠️  No testing builds found in DinoCore")
                 print("   Testing firmware flashing will not be available")
                 return False
             
-            # Find all compatible builds for this hardware version
-            compatible_builds = []
-            for build in builds:
-                supported_versions = build.get('supported_versions', [])
-                if self.hardware_version in supported_versions:
-                    compatible_builds.append(build)
+            # Compatible builds for this hardware version, newest first
+            compatible_builds = build_index.get_compatible_builds(self.hardware_version)
             
             if not compatible_builds:
                 print(f"⚠️  No compatible testing firmware found for hardware version {self.hardware_version}")
@@ -470,8 +470,6 @@ Typical usage:
                     print(f"     - {build['name']}: {', '.join(versions)}")
                 return False
             
-            # Sort by creation date (newest first) and get the latest
-            compatible_builds.sort(key=lambda x: x['created_at'], reverse=True)
             latest_compatible_build = compatible_builds[0]
             
             
@@ -546,24 +544,16 @@ Typical usage:
         if not build:
             return False
         
-        # Get build details
-        build_id = build['id']
-        build_name = build['name']
-        
-        print(f"Using build: {build_name}")
-        
-        # Download each file
-        file_mappings = {
-            'bootloader': BOOTLOADER,
-            'app': APP,
-            'partition_table': PARTITION_TABLE,
-            'ota_initial': OTA_DATA
-        }
+        print(f"Using build: {build['name']}")
         
-        for file_type, output_path in file_mappings.items():
-            if not self.download_file_from_api(build_id, file_type, output_path):
-                return False
+        # Reuse the shared cache; only a new build id triggers a download
+        paths = get_firmware_cache().ensure_build(
+            'production', build,
+            lambda targets: self.download_build_files('builds', build['id'], targets, build_checksums(build)))
+        if not paths:
+            return False
         
+        get_firmware_cache().export_build(paths, FIRMWARE_DIR)
         print("✅ All production firmware files downloaded successfully!")
         return True
 
@@ -575,46 +565,32 @@ Typical usage:
         if not build:
             return False
         
-        # Get build details
-        build_id = build['id']
-        build_name = build['name']
-        
-        print(f"Using testing build: {build_name}")
-        
-        # Download each file
-        file_mappings = {
-            'bootloader': TESTING_BOOTLOADER,
-            'app': TESTING_APP,
-            'partition_table': TESTING_PARTITION_TABLE,
-            'ota_initial': TESTING_OTA_DATA
-        }
+        print(f"Using testing build: {build['name']}")
         
-        for file_type, output_path in file_mappings.items():
-            if not self.download_testing_file_from_api(build_id, file_type, output_path):
-                return False
+        # Reuse the shared cache; only a new build id triggers a download
+        paths = get_firmware_cache().ensure_build(
+            'testing', build,
+            lambda targets: self.download_build_files('testing-builds', build['id'], targets, build_checksums(build)))
+        if not paths:
+            return False
         
+        get_firmware_cache().export_build(paths, TESTING_FIRMWARE_DIR)
         print("✅ All testing firmware files downloaded successfully!")
         return True
 
     def find_build_for_version(self, hardware_version):
         """Find the best build for the specified hardware version"""
-        url = f"{self.base_url}/api/builds"
+        build_index = get_build_index('builds', self.base_url)
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            builds = response.json()
+            builds = build_index.get_all_builds()
             
             if not builds:
                 print("❌ No builds found in DinoCore")
                 return None
             
-            # Find builds that support this hardware version
-            compatible_builds = []
-            for build in builds:
-                supported_versions = build.get('supported_versions', [])
-                if hardware_version in supported_versions:
-                    compatible_builds.append(build)
+            # Builds that support this hardware version, newest first
+            compatible_builds = build_index.get_compatible_builds(hardware_version)
             
             if not compatible_builds:
                 print(f"❌ No builds found for hardware version {hardware_version}")
@@ -624,8 +600,6 @@ Typical usage:
                     print(f"  - {build['name']}: {', '.join(versions)}")
                 return None
             
-            # Sort by creation date (newest first) and return the first compatible build
-            compatible_builds.sort(key=lambda x: x['created_at'], reverse=True)
             selected_build = compatible_builds[0]
             
             print(f"Found compatible build: {selected_build['name']}")
@@ -640,23 +614,17 @@ Typical usage:
 
     def find_testing_build_for_version(self, hardware_version):
         """Find the best testing build for the specified hardware version"""
-        url = f"{self.base_url}/api/testing-builds"
+        build_index = get_build_index('testing-builds', self.base_url)
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            builds = response.json()
+            builds = build_index.get_all_builds()
             
             if not builds:
                 print("❌ No testing builds found in DinoCore")
                 return None
             
-            # Find builds that support this hardware version
-            compatible_builds = []
-            for build in builds:
-                supported_versions = build.get('supported_versions', [])
-                if hardware_version in supported_versions:
-                    compatible_builds.append(build)
+            # Builds that support this hardware version, newest first
+            compatible_builds = build_index.get_compatible_builds(hardware_version)
             
             if not compatible_builds:
                 print(f"❌ No testing builds found for hardware version {hardware_version}")
@@ -666,8 +634,6 @@ Typical usage:
                     print(f"  - {build['name']}: {', '.join(versions)}")
                 return None
             
-            # Sort by creation date (newest first) and return the first compatible build
-            compatible_builds.sort(key=lambda x: x['created_at'], reverse=True)
             selected_build = compatible_builds[0]
             
             print(f"Found compatible testing build: {selected_build['name']}")
@@ -680,65 +646,16 @@ Typical usage:
             print(f"Make sure DinoCore is running at {self.base_url}")
             return None
 
-    def download_file_from_api(self, build_id, file_type, output_path):
-        """Download a file from DinoCore API"""
-        url = f"{self.base_url}/api/builds/{build_id}/files/{file_type}/download"
-        
+    def download_build_files(self, api_path, build_id, targets, checksums=None):
+        """Download all files of a build from the DinoCore API in parallel"""
+        # Start loading animation
+        self.start_loading(f"Downloading {len(targets)} firmware files")
         try:
-            # Start loading animation
-            self.start_loading(f"Downloading {os.path.basename(output_path)}")
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            # Ensure production firmware directory exists
-            os.makedirs(FIRMWARE_DIR, exist_ok=True)
-            
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
+            return get_firmware_downloader().download_build(self.base_url, api_path, build_id, targets,
+                                                             checksums=checksums)
+        finally:
             # Stop loading animation
             self.stop_loading()
-            
-            # print(f"✅ Downloaded {output_path}")
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            # Stop loading animation on error
-            self.stop_loading()
-            print(f"❌ Failed to download {output_path}: {e}")
-            return False
-
-    def download_testing_file_from_api(self, build_id, file_type, output_path):
-        """Download a testing file from DinoCore API"""
-        url = f"{self.base_url}/api/testing-builds/{build_id}/files/{file_type}/download"
-        
-        try:
-            # Start loading animation
-            self.start_loading(f"Downloading {os.path.basename(output_path)}")
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            # Ensure testing firmware directory exists
-            os.makedirs(TESTING_FIRMWARE_DIR, exist_ok=True)
-            
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            # Stop loading animation
-            self.stop_loading()
-            
-            # print(f"✅ Downloaded {output_path}")
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            # Stop loading animation on error
-            self.stop_loading()
-            print(f"❌ Failed to download {output_path}: {e}")
-            return False
 
     def require_files(self):
         """Check if all required production firmware files exist"""
@@ -762,6 +679,32 @@ Typical usage:
             return False
         return True
 
+    def run_flash_command(self, port, flash_cmd, description):
+        """Run an esptool flash command at the port's calibrated baud,
+        retrying once a step lower if the write fails"""
+        baud = get_baud_profile().get_baud(port)
+        flash_cmd[flash_cmd.index("-b") + 1] = str(baud)
+        print(f"Command: {' '.join(flash_cmd)}")
+
+        self.start_loading(description)
+        result = subprocess.run(flash_cmd, capture_output=True, text=True)
+        self.stop_loading()
+
+        # Only errors during the transfer are a link problem; a USB lockout,
+        # missing board or failed sync must not lower the baud
+        if result.returncode != 0 and is_link_error((result.stdout or "") + (result.stderr or "")):
+            lower_baud = get_baud_profile().record_failure(port, baud)
+            if lower_baud:
+                print(f"⚠️  Flash failed at {baud} baud, retrying at {lower_baud} baud...")
+                baud = lower_baud
+                flash_cmd[flash_cmd.index("-b") + 1] = str(baud)
+                self.start_loading(description)
+                result = subprocess.run(flash_cmd, capture_output=True, text=True)
+                self.stop_loading()
+        if result.returncode == 0:
+            get_baud_profile().record_success(port, baud)
+        return result
+
     def flash_firmware(self, port):
         """Flash production firmware to device"""
         print(f"\n=== Production Firmware Flashing ===")
@@ -803,15 +746,7 @@ Typical usage:
         
         try:
             print("\nFlashing production firmware...")
-            print(f"Command: {' '.join(flash_cmd)}")
-            
-            # Start loading animation
-            self.start_loading("Flashing production firmware")
-            
-            result = subprocess.run(flash_cmd, capture_output=True, text=True)
-            
-            # Stop loading animation
-            self.stop_loading()
+            result = self.run_flash_command(port, flash_cmd, "Flashing production firmware")
         except FileNotFoundError as e:
             print("❌ Could not execute esptool. Make sure esptool is installed:")
             print(f"   {sys.executable} -m pip install esptool pyserial")
@@ -880,15 +815,7 @@ Typical usage:
         
         try:
             print("\nFlashing testing firmware...")
-            print(f"Command: {' '.join(flash_cmd)}")
-            
-            # Start loading animation
-            self.start_loading("Flashing testing firmware")
-            
-            result = subprocess.run(flash_cmd, capture_output=True, text=True)
-            
-            # Stop loading animation
-            self.stop_loading()
+            result = self.run_flash_command(port, flash_cmd, "Flashing testing firmware")
         except FileNotFoundError as e:
             print("❌ Could not execute esptool. Make sure esptool is installed:")
             print(f"   {sys.executable} -m pip install esptool pyserial")
@@ -1471,33 +1398,18 @@ Typical usage:
         print("Using simple serial monitor (press Ctrl+C to exit)")
         print("Note: This monitor is more stable but has limited features")
         
+        # Blocking reads: idle ports cost nothing, unplugging ends the monitor via hotplug
+        reader = SerialLineReader(ser, port)
         try:
             while True:
                 try:
-                    # Check if data is available
-                    if ser.in_waiting > 0:
-                        data = ser.read(ser.in_waiting)
-                        if data:
-                            # Decode and print the data
-                            try:
-                                decoded = data.decode('utf-8', errors='replace')
-                                print(decoded, end='', flush=True)
-                            except UnicodeDecodeError:
-                                # Fallback for non-UTF8 data
-                                print(data.hex(), end='', flush=True)
-                    else:
-                        # Small delay to prevent busy waiting
-                        time.sleep(0.01)
-                        
-                except serial.serialutil.SerialException as e:
-                    if "device reports readiness to read but returned no data" in str(e):
-                        # This is a common issue with ESP32 devices, just continue
-                        time.sleep(0.1)
-                        continue
-                    else:
-                        print(f"\n⚠️  Serial error: {e}")
-                        print("Device may have disconnected or been reset")
-                        break
+                    text = reader.read_text()
+                    if text:
+                        print(text, end='', flush=True)
+                except SerialDisconnected as e:
+                    print(f"\n⚠️  Serial error: {e}")
+                    print("Device may have disconnected or been reset")
+                    break
                 except Exception as e:
                     print(f"\n⚠️  Unexpected error: {e}")
                     break
@@ -1508,10 +1420,7 @@ Typical usage:
             print(f"\n⚠️  Monitor error: {e}")
             print("This is usually harmless and can be ignored.")
         finally:
-            try:
-                ser.close()
-            except Exception:
-                pass
+            reader.close()
         
         return True
 
@@ -1556,10 +1465,12 @@ Typical usage:
                         updater = DinoUpdater()
                         update_info = updater.check_for_updates()
                         if update_info:
-                            print("🎉 Update available!"                            print(f"   Version: {update_info['version']}")
+                            print("🎉 Update available!")
+                            print(f"   Version: {update_info['version']}")
                             print(f"   Release: {update_info['release_data'].get('name', 'N/A')}")
                             if update_info['changelog']:
-                                print("   Notes:"                                for line in update_info['changelog'][:200].split('\n')[:3]:
+                                print("   Notes:")
+                                for line in update_info['changelog'][:200].split('\n')[:3]:
                                     if line.strip():
                                         print(f"     {line.strip()}")
                             print("   Run 'update' to install this version")
@@ -1569,7 +1480,7 @@ Typical usage:
                         print(f"❌ Error checking for updates: {e}")
                 else:
                     print(f"❌ Unknown check subcommand: {subcommand}")
-                    print("Available subcommands: production, testing, update"
+                    print("Available subcommands: production, testing, update")
                 
             elif command in ['read', 'r']:
                 if len(args) < 2:
@@ -1666,6 +1577,17 @@ Typical usage:
                     return
                 self.open_monitor(port)
 
+            elif command == 'calibrate':
+                if len(args) < 1:
+                    print("❌ Usage: calibrate <port>")
+                    return
+                port = self.resolve_device(args[0])
+                if not port:
+                    return
+                print("⚠️  Calibration overwrites the app partition with test data.")
+                print("   Flash the device again afterwards.")
+                get_baud_profile().calibrate(port)
+
             else:
                 print(f"❌ Unknown command: {command}")
                 print("Type 'help' for available commands")
@@ -1704,7 +1626,8 @@ Typical usage:
             print(f"\n🎉 Update Available: v{update_info['version']}")
             print(f"   Release: {update_info['release_data'].get('name', 'New Version')}")
             if update_info['changelog']:
-                print("   Notes:"                for line in update_info['changelog'][:150].split('\n')[:2]:
+                print("   Notes:")
+                for line in update_info['changelog'][:150].split('\n')[:2]:
                     if line.strip():
                         print(f"     {line.strip()}")
             print("   💡 Run 'update' to install the new version")
@@ -1754,11 +1677,11 @@ Typical usage:
                         updater = DinoUpdater()
                         update_info = updater.check_for_updates()
                         if update_info:
-                            print("🎉 Update available!"
+                            print("🎉 Update available!")
                             print(f"   Version: {update_info['version']}")
                             print(f"   Release: {update_info['release_data'].get('name', 'N/A')}")
                             if update_info['changelog']:
-                                print("   Notes:"
+                                print("   Notes:")
                                 for line in update_info['changelog'][:200].split('\n')[:3]:
                                     if line.strip():
                                         print(f"     {line.strip()}")
@@ -1769,7 +1692,7 @@ Typical usage:
                         print(f"❌ Error checking for updates: {e}")
                 else:
                     print(f"❌ Unknown check subcommand: {subcommand}")
-                    print("Available subcommands: production, testing, update"
+                    print("Available subcommands: production, testing, update")
 
             elif command in ['read', 'r']:
                 if len(args) < 2:
@@ -1867,6 +1790,17 @@ Typical usage:
                     return
                 self.open_monitor(port)
 
+            elif command == 'calibrate':
+                if len(args) < 1:
+                    print("❌ Usage: calibrate <port>")
+                    return
+                port = self.resolve_device(args[0])
+                if not port:
+                    return
+                print("⚠️  Calibration overwrites the app partition with test data.")
+                print("   Flash the device again afterwards.")
+                get_baud_profile().calibrate(port)
+
             else:
                 print(f"❌ Unknown command: {command}")
                 print("Type 'help' for available commands")
@@ -1,6 +1,9 @@
 import requests
 import os
 
+from firmware_cache import FIRMWARE_FILES
+from firmware_downloader import get_firmware_downloader, build_checksums
+
 # --- Configuration ---
 VERSION = "1.9.0"
 API_URL = "https://dinocore-telemetry-production.up.railway.app/api/testing-builds"
@@ -24,20 +27,13 @@ def download_firmware():
         build_id = latest_build['id']
         print(f"Found compatible build: {latest_build['name']}")
 
-        # Download files
-        file_types = ['bootloader', 'app', 'partition_table', 'ota_initial']
-        filenames = ["bootloader.bin", "magical-toys.bin", "partition-table.bin", "ota_data_initial.bin"]
-
-        for f_type, f_name in zip(file_types, filenames):
-            output_path = os.path.join(OUTPUT_DIR, f_name)
-            dl_url = f"{os.path.dirname(API_URL)}/testing-builds/{build_id}/files/{f_type}/download"
-            print(f"Downloading {f_name}...")
-            dl_resp = requests.get(dl_url, stream=True, timeout=30)
-            dl_resp.raise_for_status()
-            with open(output_path, 'wb') as f:
-                for chunk in dl_resp.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        print(f"[OK] All firmware files for {VERSION} downloaded successfully to '{OUTPUT_DIR}'.")
+        # Download all files in parallel (resumable, verified, atomically renamed)
+        targets = {f_type: os.path.join(OUTPUT_DIR, f_name) for f_type, f_name in FIRMWARE_FILES.items()}
+        if get_firmware_downloader().download_build(os.path.dirname(os.path.dirname(API_URL)), 'testing-builds', build_id, targets,
+                                                    checksums=build_checksums(latest_build)):
+            print(f"[OK] All firmware files for {VERSION} downloaded successfully to '{OUTPUT_DIR}'.")
+        else:
+            print(f"[X] Some firmware files for {VERSION} could not be downloaded.")
 
     except requests.exceptions.RequestException as e:
         print(f"[X] Network error while downloading: {e}")
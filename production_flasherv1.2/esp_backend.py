@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - ESP Backend Module
+Runs esptool/espefuse steps in-process over one chip connection, or as subprocesses
+"""
+
+import sys
+import threading
+import subprocess
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import esptool
+    ESPTOOL_AVAILABLE = True
+except ImportError:
+    ESPTOOL_AVAILABLE = False
+    esptool = None
+
+try:
+    import espefuse
+    ESPEFUSE_AVAILABLE = True
+except ImportError:
+    ESPEFUSE_AVAILABLE = False
+    espefuse = None
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+# --- Configuration ---
+CHIP = "esp32s3"
+ROM_BAUD = 115200
+DEFAULT_BAUD = 460800
+BACKEND_INPROCESS = "inprocess"
+BACKEND_SUBPROCESS = "subprocess"
+BACKENDS = (BACKEND_INPROCESS, BACKEND_SUBPROCESS)
+
+_default_backend = BACKEND_INPROCESS
+
+
+def set_default_backend(backend: str):
+    """Select the backend used by sessions created without an explicit one"""
+    global _default_backend
+    backend = (backend or "").strip().lower()
+    _default_backend = backend if backend in BACKENDS else BACKEND_INPROCESS
+
+def get_default_backend() -> str:
+    return _default_backend
+
+def inprocess_available() -> bool:
+    return ESPTOOL_AVAILABLE and ESPEFUSE_AVAILABLE
+
+
+class _ThreadOutputRouter:
+    """sys.stdout/sys.stderr replacement that sends each thread's output to its own sink.
+
+    esptool and espefuse print their progress; several gang flasher threads may
+    run them at once, so output is routed by thread instead of swapping
+    sys.stdout globally.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.sinks = {}
+
+    def write(self, text):
+        sink = self.sinks.get(threading.get_ident())
+        if sink is not None:
+            sink.write(text)
+            return len(text)
+        return self.original.write(text)
+
+    def flush(self):
+        if threading.get_ident() not in self.sinks:
+            self.original.flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+_router_lock = threading.Lock()
+
+def _install_output_router():
+    with _router_lock:
+        if not isinstance(sys.stdout, _ThreadOutputRouter):
+            sys.stdout = _ThreadOutputRouter(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadOutputRouter):
+            sys.stderr = _ThreadOutputRouter(sys.stderr)
+
+
+class _LineCollector:
+    """Collects tool output, calling on_line for every completed line"""
+
+    def __init__(self, on_line: Optional[Callable[[str], None]] = None):
+        self.on_line = on_line
+        self.lines = []
+        self.pending = ""
+
+    def write(self, text: str):
+        self.pending += text.replace('\r', '\n')
+        *complete, self.pending = self.pending.split('\n')
+        for line in complete:
+            self._emit(line)
+
+    def _emit(self, line: str):
+        if not line.strip():
+            return
+        self.lines.append(line)
+        if self.on_line:
+            self.on_line(line + "\n")
+
+    def finish(self) -> str:
+        if self.pending:
+            self._emit(self.pending)
+            self.pending = ""
+        return "\n".join(self.lines)
+
+
+class EspSession:
+    """All esptool/espefuse steps for one device on one port.
+
+    With the in-process backend the chip is connected once, the flasher stub
+    is uploaded once and the same ESPLoader is handed to every esptool and
+    espefuse command until a step resets the chip. The subprocess backend
+    runs each step as 'python -m esptool/espefuse' like before and is used
+    automatically when the in-process path is unavailable or breaks.
+    """
+
+    def __init__(self, port: str, baud=DEFAULT_BAUD, backend: str = None, log: Callable[[str], None] = None):
+        self.port = port
+        self.baud = int(baud)
+        self.backend = backend or _default_backend
+        self.log = log or print
+        self.esp = None
+        if self.backend == BACKEND_INPROCESS and not inprocess_available():
+            self.log("[!] In-process esptool/espefuse not available, using subprocess backend")
+            self.backend = BACKEND_SUBPROCESS
+
+    # --- Public API ---
+    def esptool(self, args: List[str], on_line: Callable[[str], None] = None,
+                after: str = "no_reset") -> Tuple[int, str]:
+        """Run an esptool command. Returns (exit code, output)."""
+        if self.backend == BACKEND_INPROCESS:
+            result = self._run_inprocess(esptool.main, args, on_line, after, use_stub_flag=True)
+            if result is not None:
+                return result
+        cmd = [sys.executable, "-m", "esptool", "--chip", CHIP, "-p", self.port, "-b", str(self.baud),
+               "--before=default_reset", f"--after={after}"] + list(args)
+        return self._run_subprocess(cmd, on_line)
+
+    def espefuse(self, args: List[str], on_line: Callable[[str], None] = None) -> Tuple[int, str]:
+        """Run an espefuse command (global options such as --do-not-confirm go first in args)"""
+        if self.backend == BACKEND_INPROCESS:
+            result = self._run_inprocess(espefuse.main, args, on_line, None, use_stub_flag=False)
+            if result is not None:
+                return result
+        cmd = [sys.executable, "-m", "espefuse", "--chip", CHIP, "-p", self.port] + list(args)
+        return self._run_subprocess(cmd, on_line)
+
+    def call_loader(self, func: Callable, on_line: Callable[[str], None] = None):
+        """Run func(esp) on the shared in-process connection, connecting first if needed.
+
+        Returns func's result, or None when the session does not use the
+        in-process backend or the call failed (the connection is then dropped).
+        """
+        if self.backend != BACKEND_INPROCESS:
+            return None
+        _install_output_router()
+        collector = _LineCollector(on_line)
+        thread_id = threading.get_ident()
+        sys.stdout.sinks[thread_id] = collector
+        sys.stderr.sinks[thread_id] = collector
+        try:
+            if self.esp is None:
+                self._connect()
+            return func(self.esp)
+        except Exception as e:
+            collector.write(f"\nA fatal error occurred: {e}\n")
+            self.close()
+            return None
+        finally:
+            sys.stdout.sinks.pop(thread_id, None)
+            sys.stderr.sinks.pop(thread_id, None)
+            collector.finish()
+
+    def close(self, reset: bool = False):
+        """Release the serial port, optionally hard-resetting the chip into the app first"""
+        esp, self.esp = self.esp, None
+        if esp is None:
+            return
+        try:
+            if reset:
+                esp.hard_reset()
+        except Exception:
+            pass
+        try:
+            esp._port.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Subprocess backend ---
+    def _run_subprocess(self, cmd: List[str], on_line) -> Tuple[int, str]:
+        collector = _LineCollector(on_line)
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       universal_newlines=True, bufsize=1)
+            for line in iter(process.stdout.readline, ''):
+                collector.write(line)
+            process.stdout.close()
+            return process.wait(), collector.finish()
+        except OSError as e:
+            collector.write(f"Could not run {cmd[2]}: {e}\n")
+            return 1, collector.finish()
+
+    # --- In-process backend ---
+    def _connect(self):
+        connect_mode = "default_reset" if esptool.__version__.startswith(("2.", "3.", "4.")) else "default-reset"
+        esp = esptool.cmds.detect_chip(self.port, ROM_BAUD, connect_mode)
+        esp = esp.run_stub()
+        if self.baud > ROM_BAUD:
+            esp.change_baud(self.baud)
+        self.esp = esp
+
+    def _run_inprocess(self, main, args, on_line, after, use_stub_flag) -> Optional[Tuple[int, str]]:
+        """Run a tool's main() on the shared connection.
+
+        Returns None if the in-process path itself broke, after switching the
+        session to the subprocess backend so the caller can retry.
+        """
+        _install_output_router()
+        collector = _LineCollector(on_line)
+        thread_id = threading.get_ident()
+        sys.stdout.sinks[thread_id] = collector
+        sys.stderr.sinks[thread_id] = collector
+        code = 0
+        backend_error = None
+        try:
+            if self.esp is None:
+                self._connect()
+            argv = ["--chip", CHIP, "-p", self.port]
+            if after is not None:
+                argv.append(f"--after={after}")
+                if getattr(self.esp, 'IS_STUB', False) and use_stub_flag:
+                    argv.append("--no-stub")  # Stub already running on this connection
+            main(argv + list(args), self.esp)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception as e:
+            if self._is_device_error(e):
+                collector.write(f"\nA fatal error occurred: {e}\n")
+                code = 2
+            else:
+                backend_error = e
+        finally:
+            sys.stdout.sinks.pop(thread_id, None)
+            sys.stderr.sinks.pop(thread_id, None)
+
+        if backend_error is not None:
+            self.log(f"[!] In-process esptool failed ({backend_error}), falling back to subprocess backend")
+            self.close()
+            self.backend = BACKEND_SUBPROCESS
+            return None
+        if code != 0:
+            # Connection state is unknown after a failure: reconnect next time
+            self.close()
+        elif after is not None and after not in ("no_reset", "no-reset", "no_reset_stub", "no-reset-stub"):
+            # The chip was reset out of the bootloader, so this connection is done
+            self.close()
+        return code, collector.finish()
+
+    @staticmethod
+    def _is_device_error(error: Exception) -> bool:
+        """True for errors caused by the chip/port rather than the in-process backend itself"""
+        if isinstance(error, (esptool.FatalError, OSError)):
+            return True
+        return serial is not None and isinstance(error, serial.SerialException)
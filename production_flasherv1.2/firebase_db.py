@@ -10,16 +10,11 @@ import time
 from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 
-# Firebase imports with fallback
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore, initialize_app
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    FIREBASE_AVAILABLE = False
-    firebase_admin = None
-
 from i18n_utils import _
+from firebase_outbox import get_firebase_outbox, new_document_id, SERVER_TIMESTAMP
+from storage_backend import StorageBackend, create_backend, FIREBASE_AVAILABLE
+from local_firestore import DESCENDING
+from session_log_store import SessionLogWriter
 
 class FirebaseDB:
     """Firebase/Firestore database manager for DinoCore"""
@@ -28,67 +23,53 @@ class FirebaseDB:
         self.db = None
         self.initialized = False
         self.project_id = None
-
-    def initialize(self, credentials_path: str = None, project_id: str = None) -> bool:
-        """Initialize Firebase connection"""
-        if not FIREBASE_AVAILABLE:
+        # Firestore or the local stand-in, from storage_backend in config.ini
+        self.backend: StorageBackend = create_backend()
+
+    def initialize(self, credentials_path: str = None, project_id: str = None,
+                   backend: StorageBackend = None) -> bool:
+        """Initialize the database connection (Firestore, or the configured local store)"""
+        if backend is not None:
+            self.backend = backend
+        if not self.backend.available():
             print(_("Firebase not available - install firebase-admin: pip install firebase-admin"))
             return False
 
         try:
-            # Use provided credentials or look for default paths
-            if credentials_path and os.path.exists(credentials_path):
-                cred = credentials.Certificate(credentials_path)
-            else:
-                # Try common Firebase credentials locations
-                possible_paths = [
-                    'production_flasherv1.2/firebase-credentials.json',
-                    'firebase-credentials.json',
-                    'credentials.json',
-                    'firebase-adminsdk.json',
-                    os.path.expanduser('~/.firebase/credentials.json'),
-                    os.path.expanduser('~/firebase-credentials.json')
-                ]
-
-                cred = None
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        cred = credentials.Certificate(path)
-                        print(f"Found Firebase credentials at: {path}")
-                        break
-
-                if not cred:
-                    print(_("Firebase credentials not found. Please provide credentials file."))
-                    return False
-
-            # Initialize Firebase app
-            if project_id:
-                self.project_id = project_id
-                initialize_app(cred, {'projectId': project_id})
-            else:
-                initialize_app(cred)
-
-            # Get Firestore client
-            self.db = firestore.client()
+            self.db = self.backend.connect(credentials_path, project_id)
+            if self.db is None:
+                return False
+            self.project_id = project_id
             self.initialized = True
 
-            print(_("Firebase initialized successfully"))
+            # Upload whatever was queued while offline (including previous runs)
+            get_firebase_outbox().start(lambda: self.db if self.initialized else None)
+
+            print(_("Firebase initialized successfully") + f" ({self.backend.name})")
             return True
 
         except Exception as e:
             print(f"Firebase initialization error: {e}")
             return False
 
+    def queue_document(self, collection: str, doc_data: Dict[str, Any], doc_id: str = None) -> Optional[str]:
+        """Commit a document to the local outbox; the uploader sends it to Firestore.
+        Returns the document id, or None if it could not be queued."""
+        if not self.backend.available():
+            print(_("Firebase not available - install firebase-admin: pip install firebase-admin"))
+            return None
+        doc_id = doc_id or new_document_id()
+        doc_data.setdefault('recorded_at', datetime.now(timezone.utc))
+        if get_firebase_outbox().enqueue(collection, doc_id, doc_data):
+            return doc_id
+        return None
+
     def store_qc_results(self, device_info: Dict[str, Any], test_results: List[Dict[str, Any]]) -> bool:
         """Store Bluetooth QC test results in Firebase"""
-        if not self.initialized or not self.db:
-            print(_("Firebase not initialized"))
-            return False
-
         try:
             # Create document data
             doc_data = {
-                'timestamp': firestore.SERVER_TIMESTAMP,
+                'timestamp': SERVER_TIMESTAMP,
                 'device_info': device_info,
                 'test_results': test_results,
                 'total_tests': len(test_results),
@@ -99,12 +80,12 @@ class FirebaseDB:
                 'device_address': device_info.get('address', 'Unknown')
             }
 
-            # Use a timestamp-based document ID for easy sorting
-            doc_id = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S-%f')
-            doc_ref = self.db.collection('qc_results').document(doc_id)
-            doc_ref.set(doc_data)
+            # Timestamp-based document ID for easy sorting, fixed now so retries overwrite
+            doc_id = self.queue_document('qc_results', doc_data)
+            if not doc_id:
+                return False
 
-            print(f"QC results stored with ID: {doc_ref.id}")
+            print(f"QC results queued with ID: {doc_id}")
             return True
 
         except Exception as e:
@@ -113,14 +94,10 @@ class FirebaseDB:
 
     def store_flash_log(self, device_info: Dict[str, Any], flash_result: Dict[str, Any]) -> bool:
         """Store flash operation logs in Firebase"""
-        if not self.initialized or not self.db:
-            print(_("Firebase not initialized"))
-            return False
-
         try:
             # Create document data
             doc_data = {
-                'timestamp': firestore.SERVER_TIMESTAMP,
+                'timestamp': SERVER_TIMESTAMP,
                 'device_info': device_info,
                 'flash_result': flash_result,
                 'operation_type': 'flash',
@@ -132,39 +109,31 @@ class FirebaseDB:
                 'session_id': f"flash_{int(time.time())}"
             }
 
-            # Use a timestamp-based document ID for easy sorting
-            doc_id = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S-%f')
-            doc_ref = self.db.collection('flash_logs').document(doc_id)
-            doc_ref.set(doc_data)
+            # Timestamp-based document ID for easy sorting, fixed now so retries overwrite
+            doc_id = self.queue_document('flash_logs', doc_data)
+            if not doc_id:
+                return False
 
-            print(f"Flash log stored with ID: {doc_ref.id}")
+            print(f"Flash log queued with ID: {doc_id}")
             return True
 
         except Exception as e:
             print(f"Error storing flash log: {e}")
             return False
 
-    def store_session_log(self, session_logs: List[str]) -> bool:
-        """Store a full session log in Firebase."""
-        if not self.initialized or not self.db:
-            print(_("Firebase not initialized"))
-            return False
+    def open_session_log(self, source: str = "gui") -> SessionLogWriter:
+        """Start a streamed session log (parent document + compressed chunks)"""
+        return SessionLogWriter(self.queue_document, new_document_id("session_"), source)
 
+    def store_session_log(self, session_logs: List[Any]) -> bool:
+        """Store a complete session log in one go (lines may be strings or LogRecords).
+        Long logs are split into compressed chunks like a streamed session."""
         try:
-            # Join logs into a single string
-            log_content = "\n".join(session_logs)
+            session_log = self.open_session_log(source="batch")
+            session_log.extend(session_logs)
+            session_log.close()
 
-            doc_data = {
-                'timestamp': firestore.SERVER_TIMESTAMP,
-                'log_content': log_content,
-                'session_id': f"session_{int(time.time())}"
-            }
-
-            doc_id = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S-%f')
-            doc_ref = self.db.collection('logs').document(doc_id)
-            doc_ref.set(doc_data)
-
-            print(f"Session log stored with ID: {doc_ref.id}")
+            print(f"Session log queued with ID: {session_log.session_id} ({session_log.chunk_count} chunks)")
             return True
 
         except Exception as e:
@@ -178,7 +147,7 @@ class FirebaseDB:
 
         try:
             # Get recent QC results
-            docs = self.db.collection('qc_results').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
+            docs = self.db.collection('qc_results').order_by('timestamp', direction=DESCENDING).limit(limit).stream()
 
             results = []
             for doc in docs:
@@ -199,7 +168,7 @@ class FirebaseDB:
 
         try:
             # Get recent flash logs
-            docs = self.db.collection('flash_logs').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
+            docs = self.db.collection('flash_logs').order_by('timestamp', direction=DESCENDING).limit(limit).stream()
 
             results = []
             for doc in docs:
@@ -280,10 +249,71 @@ def store_flash_log(device_info: Dict[str, Any], flash_result: Dict[str, Any]) -
     """Store flash log in Firebase"""
     return firebase_db.store_flash_log(device_info, flash_result)
 
-def store_session_log(session_logs: List[str]) -> bool:
+def store_session_log(session_logs: List[Any]) -> bool:
     """Store session log in Firebase"""
     return firebase_db.store_session_log(session_logs)
 
+def open_session_log(source: str = "gui") -> Optional[SessionLogWriter]:
+    """Start a streamed session log, or None if Firebase is not installed"""
+    if not firebase_db.backend.available():
+        return None
+    return firebase_db.open_session_log(source)
+
+def configure_firebase_batching(max_docs: int = None, max_bytes: int = None, max_age: float = None):
+    """Set the outbox batch flush policy (documents, bytes, seconds)"""
+    get_firebase_outbox().configure(max_docs, max_bytes, max_age)
+
+def flush_firebase_writes(timeout: float = 10.0) -> bool:
+    """Commit everything still queued (call before exiting). Returns True if nothing is left."""
+    return get_firebase_outbox().flush(timeout)
+
+def run_storage_benchmark(count: int = 1000) -> Dict[str, float]:
+    """Push `count` flash logs, QC results and session log lines through the full
+    storage path (outbox, batched uploader, chunked session log) into a throwaway
+    local store, and report the throughput."""
+    import io
+    import tempfile
+    import contextlib
+    from storage_backend import LocalBackend
+
+    # Outbox and local store both live in a temporary directory
+    os.chdir(tempfile.mkdtemp(prefix="dinocore_bench_"))
+    db = FirebaseDB()
+    if not db.initialize(backend=LocalBackend()):
+        return {}
+
+    device = {'name': 'Bench Device', 'address': 'AA:BB:CC:DD:EE:FF'}
+    tests = [{'name': 'Mic L/R Balance', 'status': 'pass', 'details': 'L: 5000 RMS, R: 4950 RMS'}]
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):  # Skip the per-document messages
+        for i in range(count):
+            db.store_flash_log(device, {'success': True, 'mode': 'production', 'duration': 12.5, 'index': i})
+            db.store_qc_results(device, tests)
+    session_log = db.open_session_log(source="benchmark")
+    for i in range(count * 10):
+        session_log.append(f"[OK] Writing at 0x{i * 0x1000:08x}... ({i % 100} %)")
+    session_log.close()
+    queued = time.time() - start
+
+    flushed = flush_firebase_writes(timeout=max(60.0, count / 10))
+    total = time.time() - start
+    documents = count * 2 + session_log.chunk_count + 1
+    stored = sum(db.db.collection(name).count().get()[0][0].value for name in ('flash_logs', 'qc_results'))
+
+    results = {
+        'documents': documents,
+        'queue_docs_per_s': documents / queued,
+        'end_to_end_docs_per_s': documents / total,
+        'log_lines_per_s': count * 10 / total,
+        'compression_ratio': session_log.raw_bytes / max(1, session_log.stored_bytes),
+    }
+    print(f"📊 {documents} documents queued in {queued:.2f}s ({results['queue_docs_per_s']:.0f} docs/s)")
+    print(f"📊 Stored in {total:.2f}s end to end ({results['end_to_end_docs_per_s']:.0f} docs/s), "
+          f"{stored}/{count * 2} results found, flushed: {flushed}")
+    print(f"📊 Session log: {count * 10} lines in {session_log.chunk_count} chunks, "
+          f"{results['compression_ratio']:.1f}x compression")
+    return results
+
 if __name__ == "__main__":
     # Command line interface for Firebase setup
     import sys
@@ -306,7 +336,7 @@ if __name__ == "__main__":
                 try:
                     # Try to access Firestore
                     test_ref = firebase_db.db.collection('test').document('connection_test')
-                    test_ref.set({'test': True, 'timestamp': firestore.SERVER_TIMESTAMP})
+                    test_ref.set({'test': True, 'timestamp': SERVER_TIMESTAMP})
                     print("✅ Firestore connection verified")
                 except Exception as e:
                     print(f"❌ Firestore connection failed: {e}")
@@ -360,12 +390,17 @@ if __name__ == "__main__":
             else:
                 print("❌ Firebase initialization failed.")
 
+        elif command == "benchmark":
+            count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+            run_storage_benchmark(count)
+
         else:
             print("Usage: python firebase_db.py [setup|init|test|init_and_test] [args...]")
             print("  setup <project_id>  - Setup Firebase project")
             print("  init <cred_path> <project_id>  - Initialize Firebase")
             print("  test                - Test Firebase connection")
             print("  init_and_test       - Initialize and send a test log")
+            print("  benchmark [count]   - Measure the storage path against a local store")
 
     else:
         print("DinoCore Firebase Database Module")
@@ -375,7 +410,10 @@ if __name__ == "__main__":
         print("  setup <project_id>  - Guide Firebase project setup")
         print("  init <cred_path> <project_id>  - Initialize with credentials")
         print("  test                - Test Firebase connection")
+        print("  benchmark [count]   - Measure the storage path against a local store")
         print("")
+        print("Set storage_backend = local in config.ini (or DINOCORE_STORAGE_BACKEND=local)")
+        print("to keep all data in a local SQLite store instead of Firestore.")
         print(f"Firebase available: {FIREBASE_AVAILABLE}")
         if not FIREBASE_AVAILABLE:
             print("To enable Firebase: pip install firebase-admin")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Firebase Log Cache Module
+Local SQLite cache of downloaded Firestore documents and the time windows already fetched
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from firebase_outbox import encode_document, decode_document
+
+# --- Configuration ---
+CACHE_FILE = "firebase_log_cache.db"
+CACHE_PAGE_SIZE = 500       # Cached documents read per query
+CACHE_SETTLE_TIME = 300.0    # Windows newer than this are refetched (clock skew, commits in progress)
+
+
+class FirebaseLogCache:
+    """Documents already fetched, keyed by collection and id, plus the covered time ranges.
+
+    A range is recorded only after a window was fully paged through, so a
+    later query over the same window fetches just the gaps. Ranges are over
+    server-assigned times (upload time for session logs), so documents
+    that stations upload late from their outbox still land in new ranges. Documents that
+    may still change (open sessions) are stored with complete=False and
+    refetched by id whenever they are read.
+    """
+
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                ts REAL NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 1,
+                data TEXT NOT NULL,
+                PRIMARY KEY (collection, id)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_ts ON documents (collection, ts)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ranges (
+                collection TEXT NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL
+            )""")
+
+    # --- Documents ---
+    def put(self, collection: str, doc_id: str, ts: float, data: Dict[str, Any], complete: bool = True):
+        payload = json.dumps(encode_document(data), ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, id, ts, complete, data) VALUES (?, ?, ?, ?, ?)",
+                (collection, doc_id, ts, int(complete), payload))
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM documents WHERE collection = ? AND id = ?",
+                                    (collection, doc_id)).fetchone()
+        return decode_document(json.loads(row[0])) if row else None
+
+    def iter_range(self, collection: str, start: float, end: float) -> Iterator[Tuple[Dict[str, Any], bool]]:
+        """(document, complete) for cached documents with start <= ts < end, oldest first.
+        Read in pages so large windows are never held in memory at once."""
+        cursor = (start, "")
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT ts, id, data, complete FROM documents "
+                    "WHERE collection = ? AND (ts > ? OR (ts = ? AND id > ?)) AND ts < ? "
+                    "ORDER BY ts, id LIMIT ?",
+                    (collection, cursor[0], cursor[0], cursor[1], end, CACHE_PAGE_SIZE)).fetchall()
+            for _ts, _doc_id, data, complete in rows:
+                yield decode_document(json.loads(data)), bool(complete)
+            if len(rows) < CACHE_PAGE_SIZE:
+                return
+            cursor = (rows[-1][0], rows[-1][1])
+
+    # --- Covered ranges ---
+    def _ranges(self, collection: str) -> List[Tuple[float, float]]:
+        with self.lock:
+            return self.conn.execute("SELECT start, end FROM ranges WHERE collection = ? ORDER BY start",
+                                     (collection,)).fetchall()
+
+    def missing_ranges(self, collection: str, start: float, end: float) -> List[Tuple[float, float]]:
+        """Parts of [start, end) that were never fully fetched"""
+        gaps, cursor = [], start
+        for range_start, range_end in self._ranges(collection):
+            if range_end <= cursor:
+                continue
+            if range_start >= end:
+                break
+            if range_start > cursor:
+                gaps.append((cursor, range_start))
+            cursor = max(cursor, range_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def add_range(self, collection: str, start: float, end: float):
+        """Record [start, end) as fetched, merged with overlapping ranges. The part
+        newer than CACHE_SETTLE_TIME is left out so late uploads are still picked up."""
+        end = min(end, time.time() - CACHE_SETTLE_TIME)
+        if end <= start:
+            return
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT rowid, start, end FROM ranges WHERE collection = ? AND end >= ? AND start <= ?",
+                (collection, start, end)).fetchall()
+            for _rowid, range_start, range_end in rows:
+                start, end = min(start, range_start), max(end, range_end)
+            self.conn.executemany("DELETE FROM ranges WHERE rowid = ?", [(row[0],) for row in rows])
+            self.conn.execute("INSERT INTO ranges (collection, start, end) VALUES (?, ?, ?)",
+                              (collection, start, end))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM documents")
+            self.conn.execute("DELETE FROM ranges")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Firebase Outbox Module
+Durable local SQLite (WAL) outbox drained to Firestore in batches by a background uploader
+"""
+
+import json
+import time
+import base64
+import random
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+class _ServerTimestamp:
+    """Stand-in for firestore.SERVER_TIMESTAMP when firebase-admin is not installed"""
+    def __repr__(self):
+        return "SERVER_TIMESTAMP"
+
+try:
+    from firebase_admin import firestore
+    SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
+except ImportError:
+    firestore = None
+    SERVER_TIMESTAMP = _ServerTimestamp()
+
+# --- Configuration ---
+OUTBOX_FILE = "firebase_outbox.db"
+UPLOAD_INTERVAL = 2.0        # Seconds between outbox checks when idle
+BATCH_MAX_DOCS = 100         # Documents per Firestore WriteBatch commit (Firestore allows 500)
+BATCH_MAX_BYTES = 4 * 1024 * 1024   # Queued JSON bytes per commit (Firestore request limit is 10 MiB)
+BATCH_MAX_AGE = 2.0          # Commit a partial batch once its oldest document waited this long
+RETRY_BASE_DELAY = 2.0       # First retry after ~2 s, doubling per failed attempt
+RETRY_MAX_DELAY = 300.0
+FLUSH_RETRY_DELAY = 0.5      # Pause between attempts while flush() waits
+
+# JSON markers for Firestore values that plain JSON cannot hold
+_SERVER_TIMESTAMP = "__server_timestamp__"
+_DATETIME = "__datetime__"
+_BYTES = "__bytes__"
+
+
+def encode_document(value):
+    """JSON-safe copy of a Firestore document (SERVER_TIMESTAMP, datetimes and bytes tagged)"""
+    if isinstance(value, dict):
+        return {key: encode_document(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_document(item) for item in value]
+    if isinstance(value, datetime):
+        return {_DATETIME: value.isoformat()}
+    if isinstance(value, bytes):
+        return {_BYTES: base64.b64encode(value).decode('ascii')}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if value is SERVER_TIMESTAMP:
+        return {_SERVER_TIMESTAMP: True}
+    return str(value)
+
+def decode_document(value):
+    """Inverse of encode_document, producing values ready for Firestore"""
+    if isinstance(value, dict):
+        if value.get(_SERVER_TIMESTAMP) is True and len(value) == 1:
+            return SERVER_TIMESTAMP
+        if _DATETIME in value and len(value) == 1:
+            return datetime.fromisoformat(value[_DATETIME])
+        if _BYTES in value and len(value) == 1:
+            return base64.b64decode(value[_BYTES])
+        return {key: decode_document(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_document(item) for item in value]
+    return value
+
+def new_document_id(prefix: str = "") -> str:
+    """Timestamp-sortable document id with a random suffix so stations never collide.
+    The id is fixed when the record is queued, which makes retried uploads idempotent."""
+    stamp = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S-%f')
+    return f"{prefix}{stamp}_{random.getrandbits(32):08x}"
+
+
+class FirebaseOutbox:
+    """Write-ahead queue of Firestore documents.
+
+    enqueue() commits the document to a local SQLite database (WAL journal)
+    and returns immediately, so flashing threads never wait for the network.
+    A background thread uploads queued documents in WriteBatch commits
+    (flushed by count, size or age, see configure()) with set() under their
+    pre-assigned ids, deleting rows only after Firestore accepted the batch.
+    Failures are retried with exponential backoff; rows survive crashes and
+    restarts and are uploaded on the next run.
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL UNIQUE,
+                data TEXT NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            )""")
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.flushing = threading.Event()
+        self.thread = None
+        self.client_getter: Optional[Callable[[], Any]] = None
+        self.max_docs = BATCH_MAX_DOCS
+        self.max_bytes = BATCH_MAX_BYTES
+        self.max_age = BATCH_MAX_AGE
+
+    # --- Queueing ---
+    def enqueue(self, collection: str, doc_id: str, data: Dict[str, Any]) -> bool:
+        """Commit a document locally. collection may be a nested path ('logs/<id>/chunks')."""
+        path = f"{collection}/{doc_id}"
+        payload = json.dumps(encode_document(data), ensure_ascii=False)
+        try:
+            with self.lock:
+                # Re-queueing the same document replaces the pending version
+                self.conn.execute(
+                    "INSERT INTO outbox (path, data, created) VALUES (?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET data = excluded.data, attempts = 0, next_attempt = 0",
+                    (path, payload, time.time()))
+        except sqlite3.Error as e:
+            print(f"Error queueing Firebase document {path}: {e}")
+            return False
+        self.wakeup.set()
+        return True
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def configure(self, max_docs: int = None, max_bytes: int = None, max_age: float = None):
+        """Set the batch flush policy: a batch is committed when it reaches max_docs
+        documents or max_bytes, or when its oldest document is max_age seconds old."""
+        if max_docs:
+            self.max_docs = max(1, min(500, int(max_docs)))
+        if max_bytes:
+            self.max_bytes = max(1024, int(max_bytes))
+        if max_age is not None:
+            self.max_age = max(0.0, float(max_age))
+        self.wakeup.set()
+
+    # --- Uploading ---
+    def start(self, client_getter: Callable[[], Any]):
+        """Start the uploader. client_getter returns the Firestore client (or None while offline)."""
+        self.client_getter = client_getter
+        if self.thread and self.thread.is_alive():
+            self.wakeup.set()
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._upload_worker, daemon=True, name="firebase-outbox")
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Upload everything now, ignoring retry backoff, for up to timeout seconds.
+        Returns True once the outbox is empty."""
+        if not self.thread or not self.thread.is_alive():
+            return self.pending_count() == 0
+        deadline = time.time() + timeout
+        self.flushing.set()
+        try:
+            while self.pending_count() and time.time() < deadline:
+                self.wakeup.set()
+                time.sleep(0.1)
+        finally:
+            self.flushing.clear()
+        return self.pending_count() == 0
+
+    def _due_rows(self) -> List[tuple]:
+        due = float('inf') if self.flushing.is_set() else time.time()
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, path, data, attempts, created FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?",
+                (due, self.max_docs)).fetchall()
+
+    def _next_batch(self, rows: List[tuple]) -> Optional[List[tuple]]:
+        """Rows to commit now under the flush policy, or None to keep collecting"""
+        batch, size = [], 0
+        for row in rows:
+            if batch and size + len(row[2]) > self.max_bytes:
+                return batch  # Size limit reached
+            batch.append(row)
+            size += len(row[2])
+        if self.flushing.is_set() or len(batch) >= self.max_docs:
+            return batch
+        if time.time() - min(row[4] for row in batch) >= self.max_age:
+            return batch
+        return None
+
+    def _upload_worker(self):
+        while not self.stop_event.is_set():
+            self.wakeup.clear()
+            client = self.client_getter() if self.client_getter else None
+            rows = self._due_rows() if client is not None else []
+            batch = self._next_batch(rows) if rows else None
+            if not batch:
+                wait = UPLOAD_INTERVAL
+                if rows:
+                    wait = min(wait, max(0.05, self.max_age - (time.time() - min(row[4] for row in rows))))
+                self.wakeup.wait(wait)
+                continue
+            if not self._commit_batch(client, batch):
+                # Probably offline: back off instead of retrying straight away
+                self.stop_event.wait(FLUSH_RETRY_DELAY if self.flushing.is_set() else 0)
+
+    def _commit_batch(self, client, rows: List[tuple]) -> bool:
+        """Write rows in one WriteBatch commit. Documents are set() under fixed ids,
+        so a commit that is retried after an unclear failure cannot duplicate them."""
+        try:
+            write_batch = client.batch()
+            for _row_id, path, data, _attempts, _created in rows:
+                write_batch.set(client.document(path), decode_document(json.loads(data)))
+            write_batch.commit()
+        except Exception as e:
+            now = time.time()
+            with self.lock:
+                self.conn.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                    [(now + min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempts)) * random.uniform(0.8, 1.2),
+                      str(e)[:500], row_id)
+                     for row_id, _path, _data, attempts, _created in rows])
+            return False
+        with self.lock:
+            # A row re-queued with new data during the upload stays for the next batch
+            self.conn.executemany("DELETE FROM outbox WHERE id = ? AND data = ?",
+                                  [(row_id, data) for row_id, _path, data, _attempts, _created in rows])
+        return True
+
+
+# Global outbox shared by every Firebase writer in this process
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_firebase_outbox() -> FirebaseOutbox:
+    """Get the global outbox instance (opened on first use)"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = FirebaseOutbox()
+        return _outbox
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Firmware Cache Module
+Content-addressed local cache of downloaded firmware builds
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Dict, Optional, Callable
+
+# --- Configuration ---
+CACHE_DIR = "firmware_cache"
+DEFAULT_MAX_CACHE_MB = 512
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Build artifact type (as named by the DinoCore API) -> local file name
+FIRMWARE_FILES = {
+    'bootloader': "bootloader.bin",
+    'app': "magical-toys.bin",
+    'partition_table': "partition-table.bin",
+    'ota_initial': "ota_data_initial.bin",
+}
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FirmwareCache:
+    """Size-bounded LRU cache of firmware builds keyed by build id and content hash.
+
+    Every build is stored as a manifest (mode + build id -> file type -> sha256)
+    pointing into a shared blob store, so an unchanged bootloader or partition
+    table is kept only once no matter how many builds reference it.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = DEFAULT_MAX_CACHE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.build_locks = {}
+        self.export_lock = threading.Lock()
+        self.verified_blobs = set()  # Hashes already checked during this process
+        self.pins = {}               # Blob hash -> number of flashes using it (never deleted meanwhile)
+        self.index = self._load_index()
+
+    # --- Index persistence ---
+    def _load_index(self) -> Dict:
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if isinstance(index.get('builds'), dict):
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'builds': {}}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = self.index_file + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=2)
+            os.replace(temp_path, self.index_file)
+        except OSError as e:
+            print(f"Warning: Could not save firmware cache index: {e}")
+
+    @staticmethod
+    def _build_key(mode: str, build_id) -> str:
+        return f"{mode}:{build_id}"
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, f"{sha256}.bin")
+
+    def _staging_dir(self, mode: str, build_id) -> str:
+        return os.path.join(self.cache_dir, f"download_{mode}_{build_id}")
+
+    def _get_build_lock(self, key: str) -> threading.Lock:
+        with self.lock:
+            return self.build_locks.setdefault(key, threading.Lock())
+
+    # --- Lookup ---
+    def _verify_blob(self, sha256: str, size: int) -> bool:
+        path = self._blob_path(sha256)
+        try:
+            if os.path.getsize(path) != size:
+                return False
+        except OSError:
+            return False
+        if sha256 in self.verified_blobs:
+            return True
+        if file_sha256(path) != sha256:
+            return False
+        self.verified_blobs.add(sha256)
+        return True
+
+    def get_build(self, mode: str, build_id, pin: bool = False) -> Optional[Dict[str, str]]:
+        """Return {file_type: path} for a cached, verified build or None.
+        With pin=True the files stay on disk until unpin(paths) is called."""
+        key = self._build_key(mode, build_id)
+        with self.lock:
+            entry = self.index['builds'].get(key)
+            if not entry:
+                return None
+
+            paths = {}
+            for file_type, info in entry['files'].items():
+                if not self._verify_blob(info['sha256'], info['size']):
+                    # Corrupt or missing blob: forget the build so it is downloaded again
+                    self.index['builds'].pop(key, None)
+                    self._collect_garbage()
+                    self._save_index()
+                    return None
+                paths[file_type] = self._blob_path(info['sha256'])
+
+            entry['last_used'] = time.time()
+            self._save_index()
+            if pin:
+                self._pin(paths)
+            return paths
+
+    # --- Pinning ---
+    @staticmethod
+    def _blob_hash(path: str) -> str:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _pin(self, paths: Dict[str, str]):
+        for path in paths.values():
+            sha256 = self._blob_hash(path)
+            self.pins[sha256] = self.pins.get(sha256, 0) + 1
+
+    def unpin(self, paths: Optional[Dict[str, str]]):
+        """Release files returned with pin=True (call when the flash is done)"""
+        if not paths:
+            return
+        with self.lock:
+            for path in paths.values():
+                sha256 = self._blob_hash(path)
+                count = self.pins.get(sha256, 0) - 1
+                if count > 0:
+                    self.pins[sha256] = count
+                    continue
+                self.pins.pop(sha256, None)
+                if sha256 not in self._referenced_blobs():
+                    # Its build was evicted while the flash was running
+                    self._remove_blob(sha256)
+
+    # --- Population ---
+    def store_build(self, mode: str, build_id, files: Dict[str, str], name: str = None,
+                    pin: bool = False) -> Dict[str, str]:
+        """Move downloaded files into the blob store and record the build manifest"""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        # Hashing is the slow part and touches only the staging files
+        hashes = {file_type: (file_sha256(src_path), os.path.getsize(src_path))
+                  for file_type, src_path in files.items()}
+
+        key = self._build_key(mode, build_id)
+        now = time.time()
+        manifest = {}
+        paths = {}
+        # Blobs appear and get indexed in one step, so a concurrent eviction never sees them unreferenced
+        with self.lock:
+            for file_type, src_path in files.items():
+                sha256, size = hashes[file_type]
+                blob_path = self._blob_path(sha256)
+                if os.path.exists(blob_path) and os.path.getsize(blob_path) == size:
+                    os.remove(src_path)
+                else:
+                    os.replace(src_path, blob_path)
+                self.verified_blobs.add(sha256)
+                manifest[file_type] = {'sha256': sha256, 'size': size}
+                paths[file_type] = blob_path
+
+            self.index['builds'][key] = {
+                'mode': mode,
+                'build_id': build_id,
+                'name': name,
+                'files': manifest,
+                'created': now,
+                'last_used': now,
+            }
+            if pin:
+                self._pin(paths)
+            self._evict(keep_key=key)
+            self._save_index()
+        return paths
+
+    def ensure_build(self, mode: str, build: Dict, fetch_files: Callable[[Dict[str, str]], bool],
+                     log: Callable[[str], None] = print, pin: bool = False) -> Optional[Dict[str, str]]:
+        """Return cached paths for a build, downloading it once if needed.
+
+        fetch_files receives {file_type: output_path} for all FIRMWARE_FILES and
+        must return True only when every file was downloaded completely.
+        Flashing straight from the returned paths needs pin=True and a
+        matching unpin(paths) afterwards, so eviction cannot delete them.
+        """
+        build_id = build['id']
+        key = self._build_key(mode, build_id)
+        with self._get_build_lock(key):
+            paths = self.get_build(mode, build_id, pin)
+            if paths:
+                log(f"[OK] Using cached {mode} build: {build.get('name', build_id)}")
+                return paths
+
+            # The staging directory is kept after a failed attempt so that
+            # partially downloaded files can be resumed on the next try
+            staging_dir = self._staging_dir(mode, build_id)
+            os.makedirs(staging_dir, exist_ok=True)
+            targets = {file_type: os.path.join(staging_dir, file_name)
+                       for file_type, file_name in FIRMWARE_FILES.items()}
+            if not fetch_files(targets):
+                return None
+            missing = [p for p in targets.values() if not os.path.isfile(p)]
+            if missing:
+                log(f"[X] Download incomplete, missing: {', '.join(os.path.basename(p) for p in missing)}")
+                return None
+            paths = self.store_build(mode, build_id, targets, build.get('name'), pin)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            log(f"[OK] Cached {mode} build: {build.get('name', build_id)}")
+            return paths
+
+    def export_build(self, paths: Dict[str, str], output_dir: str) -> Dict[str, str]:
+        """Copy cached files into a firmware directory under their usual names.
+        Each file is written beside its target and renamed over it, so a reader
+        sees either the old or the new image, never a partial one."""
+        os.makedirs(output_dir, exist_ok=True)
+        exported = {}
+        with self.export_lock:
+            for file_type, src_path in paths.items():
+                dst_path = os.path.join(output_dir, FIRMWARE_FILES[file_type])
+                temp_path = f"{dst_path}.{threading.get_ident()}.tmp"
+                shutil.copyfile(src_path, temp_path)
+                os.replace(temp_path, dst_path)
+                exported[file_type] = dst_path
+        return exported
+
+    # --- Eviction ---
+    def _referenced_blobs(self) -> Dict[str, int]:
+        blobs = {}
+        for entry in self.index['builds'].values():
+            for info in entry['files'].values():
+                blobs[info['sha256']] = info['size']
+        return blobs
+
+    def total_size(self) -> int:
+        """Total bytes of all blobs referenced by cached builds"""
+        with self.lock:
+            return sum(self._referenced_blobs().values())
+
+    def _evict(self, keep_key: str = None):
+        builds = self.index['builds']
+        evicted = False
+        while sum(self._referenced_blobs().values()) > self.max_bytes:
+            candidates = [k for k in builds if k != keep_key]
+            if not candidates:
+                break
+            oldest = min(candidates, key=lambda k: builds[k].get('last_used', 0))
+            builds.pop(oldest)
+            evicted = True
+        if evicted:
+            self._collect_garbage()
+
+    def _collect_garbage(self):
+        """Delete blobs no build references. Caller holds self.lock"""
+        if not os.path.isdir(self.blob_dir):
+            return
+        referenced = self._referenced_blobs()
+        for file_name in os.listdir(self.blob_dir):
+            sha256 = os.path.splitext(file_name)[0]
+            if sha256 not in referenced and sha256 not in self.pins:
+                self._remove_blob(sha256)
+
+    def _remove_blob(self, sha256: str):
+        try:
+            os.remove(self._blob_path(sha256))
+        except OSError:
+            pass
+        self.verified_blobs.discard(sha256)
+
+    def clear(self, mode: str = None):
+        """Remove all cached builds, or only those of one mode"""
+        with self.lock:
+            builds = self.index['builds']
+            for key in [k for k, v in builds.items() if mode is None or v.get('mode') == mode]:
+                builds.pop(key)
+            self._collect_garbage()
+            if os.path.isdir(self.cache_dir):
+                prefix = "download_" if mode is None else f"download_{mode}_"
+                for name in os.listdir(self.cache_dir):
+                    if name.startswith(prefix):
+                        shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            self._save_index()
+
+
+# Global cache instance shared by the GUI, console and auto flasher
+firmware_cache = FirmwareCache()
+
+def get_firmware_cache() -> FirmwareCache:
+    """Get the global firmware cache instance"""
+    return firmware_cache
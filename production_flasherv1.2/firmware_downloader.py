@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Firmware Downloader Module
+Parallel, resumable and integrity-checked download of build artifacts
+"""
+
+import os
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Tuple
+
+# --- Configuration ---
+MAX_WORKERS = 4
+CHUNK_SIZE = 256 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 3
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded or failed verification"""
+
+
+def _sha256_of(info) -> Optional[str]:
+    if isinstance(info, str):
+        return info
+    if isinstance(info, dict):
+        return info.get('sha256') or info.get('checksum')
+    return None
+
+def build_checksums(build: Dict) -> Dict[str, str]:
+    """Expected SHA-256 per file type as published in a build index entry.
+
+    Accepts 'checksums': {type: sha256} or 'files' as {type: sha256 | {sha256}}
+    or as a list of {type/file_type, sha256}. Types without a digest are left out.
+    """
+    checksums = {}
+    files = build.get('files')
+    if isinstance(files, dict):
+        checksums.update({file_type: _sha256_of(info) for file_type, info in files.items()})
+    elif isinstance(files, list):
+        for info in files:
+            if isinstance(info, dict):
+                checksums[info.get('type') or info.get('file_type')] = _sha256_of(info)
+    if isinstance(build.get('checksums'), dict):
+        checksums.update(build['checksums'])
+    return {file_type: digest.lower() for file_type, digest in checksums.items()
+            if file_type and isinstance(digest, str) and len(digest) == 64}
+
+
+class FirmwareDownloader:
+    """Downloads several files concurrently over one pooled HTTP session.
+
+    Each file is streamed into '<name>.part' with large buffered writes, resumed
+    with an HTTP Range request after an interrupted attempt, checked against
+    its expected size (and SHA-256 when known) and only then atomically renamed
+    to its final name, so the flasher never sees a partial image.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def download_file(self, url: str, output_path: str, expected_sha256: Optional[str] = None,
+                      on_progress=None) -> int:
+        """Download one file with resume support. Returns its size in bytes.
+
+        on_progress(done_bytes, total_bytes) is called as data arrives.
+        Raises DownloadError or requests.exceptions.RequestException.
+        """
+        part_path = output_path + ".part"
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # No transfer compression: Content-Length and Range offsets must count the bytes written to disk
+        headers = {'Accept-Encoding': 'identity'}
+        if resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+            if response.status_code == 416:
+                # Stale partial file (e.g. the build changed); start over
+                os.remove(part_path)
+                raise DownloadError(f"Range not satisfiable for {os.path.basename(output_path)}, restarting")
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                content_range = response.headers.get('Content-Range', '')
+                total = int(content_range.rsplit('/', 1)[-1]) if '/' in content_range else None
+                mode = 'ab'
+            else:
+                resume_from = 0
+                length = response.headers.get('Content-Length')
+                total = int(length) if length else None
+                mode = 'wb'
+
+            done = resume_from
+            if on_progress:
+                on_progress(done, total)
+            with open(part_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if on_progress:
+                        on_progress(done, total)
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            # Resuming from a wrong offset would only extend the corruption
+            os.remove(part_path)
+            raise DownloadError(f"{os.path.basename(output_path)}: got {size} bytes, expected {total}")
+
+        if expected_sha256:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(WRITE_BUFFER_SIZE), b''):
+                    digest.update(chunk)
+            if digest.hexdigest().lower() != expected_sha256.lower():
+                os.remove(part_path)
+                raise DownloadError(f"{os.path.basename(output_path)}: SHA-256 mismatch")
+
+        os.replace(part_path, output_path)
+        return size
+
+    def download_files(self, jobs: Dict[str, Tuple[str, str]], log_queue=None,
+                       checksums: Optional[Dict[str, str]] = None) -> bool:
+        """Download {key: (url, output_path)} concurrently.
+
+        Text messages and aggregate ('progress', percent) updates go to
+        log_queue when given, otherwise text is printed.
+        """
+        log = log_queue.put if log_queue is not None else print
+        checksums = checksums or {}
+        progress = {key: (0, None) for key in jobs}
+        progress_lock = threading.Lock()
+        last_percent = [-1]
+
+        def report(key, done, total):
+            with progress_lock:
+                progress[key] = (done, total)
+                if log_queue is None or any(t is None for _, t in progress.values()):
+                    return
+                percent = int(100 * sum(d for d, _ in progress.values()) /
+                              max(sum(t for _, t in progress.values()), 1))
+                if percent != last_percent[0]:
+                    last_percent[0] = percent
+                    log_queue.put(('progress', percent))
+
+        def worker(key):
+            url, output_path = jobs[key]
+            name = os.path.basename(output_path)
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    size = self.download_file(url, output_path, checksums.get(key),
+                                              lambda done, total: report(key, done, total))
+                    log(f"[OK] Downloaded {name} ({size // 1024} KB)")
+                    return True
+                except (DownloadError, requests.exceptions.RequestException, OSError) as e:
+                    if attempt == MAX_ATTEMPTS:
+                        log(f"[X] Failed to download {name}: {e}")
+                        return False
+                    log(f"[!] Download of {name} interrupted ({e}), resuming (attempt {attempt + 1}/{MAX_ATTEMPTS})...")
+            return False
+
+        log(f"Downloading {len(jobs)} files...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(worker, jobs))
+        return all(results)
+
+    def download_build(self, base_url: str, api_path: str, build_id, targets: Dict[str, str],
+                       log_queue=None, checksums: Optional[Dict[str, str]] = None) -> bool:
+        """Download the artifacts of a DinoCore build to {file_type: output_path}"""
+        for output_path in targets.values():
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        unverified = sorted(set(targets) - set(checksums or {}))
+        if unverified:
+            message = f"[!] No published SHA-256 for {', '.join(unverified)}; checking size only"
+            (log_queue.put if log_queue is not None else print)(message)
+        jobs = {
+            file_type: (f"{base_url.rstrip('/')}/api/{api_path}/{build_id}/files/{file_type}/download", output_path)
+            for file_type, output_path in targets.items()
+        }
+        return self.download_files(jobs, log_queue, checksums)
+
+
+# Global downloader instance (shares one connection pool)
+firmware_downloader = FirmwareDownloader()
+
+def get_firmware_downloader() -> FirmwareDownloader:
+    """Get the global firmware downloader instance"""
+    return firmware_downloader
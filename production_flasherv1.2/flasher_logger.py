@@ -12,7 +12,7 @@ import platform
 import datetime
 import subprocess
 import threading
-from firebase_db import store_session_log, init_firebase_with_credentials
+from firebase_db import open_session_log, init_firebase_with_credentials, flush_firebase_writes
 
 class FlasherLogger:
     """Wrapper that starts logging and launches the application"""
@@ -20,6 +20,7 @@ class FlasherLogger:
     def __init__(self):
         self.start_time = time.time()
         self.session_logs = []
+        self.session_log = None  # Streamed Firebase session log, opened once Firebase is up
         self.logging_active = False
 
     def log(self, message: str, level: str = "INFO", immediate_store: bool = False):
@@ -30,9 +31,11 @@ class FlasherLogger:
         print(f"🎯 LOG: {full_message}")
         self.session_logs.append(full_message)
 
-        if immediate_store and self.logging_active:
+        if self.session_log:
             try:
-                store_session_log([full_message])
+                self.session_log.append(full_message)
+                if immediate_store:
+                    self.session_log.flush()
             except Exception as e:
                 print(f"❌ Failed to store log: {e}")
 
@@ -43,6 +46,9 @@ class FlasherLogger:
         try:
             if init_firebase_with_credentials():
                 self.logging_active = True
+                self.session_log = open_session_log(source="wrapper")
+                # Lines logged before Firebase came up go into the first chunk
+                self.session_log.extend(self.session_logs)
                 self.log("✅ Firebase logging active")
                 return True
             else:
@@ -97,13 +103,14 @@ class FlasherLogger:
         self.log(f"Session duration: {duration:.1f} seconds")
         self.log(f"Total logs collected: {len(self.session_logs)}")
 
-        if self.logging_active and self.session_logs:
+        if self.logging_active and self.session_log:
             try:
                 self.log("💾 Storing session logs to Firebase...")
-                if store_session_log(self.session_logs):
-                    self.log("✅ Session logs stored successfully")
-                else:
-                    self.log("❌ Failed to store session logs", "ERROR")
+                self.session_log.close()
+                print(f"✅ Session log {self.session_log.session_id} stored in {self.session_log.chunk_count} chunks")
+                # Final flush: commit everything still in the outbox before the wrapper exits
+                if not flush_firebase_writes(timeout=15):
+                    self.log("⚠️ Some logs are still queued and will be uploaded on the next run", "WARNING")
             except Exception as e:
                 self.log(f"❌ Exception during log storage: {e}", "ERROR")
         else:
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Gang Flasher Module
+Runs the device pipeline on several ESP32 ports at once
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# --- Configuration ---
+DEFAULT_MAX_PARALLEL = 4      # Concurrent eFuse/flash jobs (USB hub bandwidth)
+MAX_SLOT_LOG_LINES = 500      # Per-port log lines kept in memory
+
+# Slot states, in pipeline order
+STATE_WAITING = 'waiting'        # Queued for a free flash slot
+STATE_FLASHING = 'flashing'      # eFuse burn/verify and write_flash
+STATE_MONITORING = 'monitoring'  # Serial monitor / BLE capture after flash
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+FINISHED_STATES = (STATE_DONE, STATE_FAILED)
+
+
+class PortSlot:
+    """State of one device being processed on one port"""
+
+    def __init__(self, port: str, mode: str):
+        self.port = port
+        self.mode = mode
+        self.state = STATE_WAITING
+        self.progress = 0
+        self.last_message = ""
+        self.started = time.time()
+        self.finished = None
+        self.ble_mac = None
+        self.ble_name = None
+        self.boot_fields = {}         # Typed values parsed from the boot log
+        self.qc_result = None         # Result of the BLE QC session for ble_mac
+        self.log_lines = deque(maxlen=MAX_SLOT_LOG_LINES)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+
+class PortLogQueue:
+    """Queue-like log stream for one port.
+
+    Pipeline code calls put() exactly as it would on the shared log_queue.
+    Messages are recorded on the slot and forwarded as ('port', port, item)
+    so the GUI can route them to the port's row and log tab; without a
+    target queue they are printed with a port prefix.
+    """
+
+    def __init__(self, slot: PortSlot, target=None):
+        self.slot = slot
+        self.target = target
+
+    def put(self, item):
+        slot = self.slot
+        if isinstance(item, tuple):
+            if item[0] == 'state':
+                slot.state = item[1]
+            elif item[0] == 'progress':
+                slot.progress = item[1]
+        else:
+            text = str(item).strip()
+            if text:
+                slot.last_message = text
+                slot.log_lines.append(text)
+
+        if self.target is not None:
+            self.target.put(('port', slot.port, item))
+        elif not isinstance(item, tuple) and str(item).strip():
+            print(f"[{slot.port}] {str(item).strip()}", flush=True)
+
+    # Allow the wrapper to be passed where a log callback is expected
+    __call__ = put
+
+
+class GangFlasher:
+    """Schedules one pipeline thread per port with a cap on concurrent flashes.
+
+    pipeline(log_queue, port, mode, stop_event, flash_limiter) runs the whole
+    per-device job and returns True on success. It should hold flash_limiter
+    only around the USB-heavy steps (eFuse + write_flash) so that boards
+    sitting in the serial monitor do not block new ones.
+    """
+
+    def __init__(self, pipeline: Callable[..., bool], max_parallel: int = DEFAULT_MAX_PARALLEL,
+                 log_queue=None):
+        self.pipeline = pipeline
+        self.max_parallel = max(1, int(max_parallel))
+        self.flash_limiter = threading.BoundedSemaphore(self.max_parallel)
+        self.log_queue = log_queue
+        self.slots: Dict[str, PortSlot] = {}
+        self.lock = threading.Lock()
+
+    def is_busy(self, port: str) -> bool:
+        """True while a job for this port has not finished"""
+        with self.lock:
+            slot = self.slots.get(port)
+            return slot is not None and not slot.is_finished
+
+    def submit(self, port: str, mode: str) -> Optional[PortSlot]:
+        """Start processing a port. Returns None if the port is already busy."""
+        with self.lock:
+            slot = self.slots.get(port)
+            if slot is not None and not slot.is_finished:
+                return None
+            slot = PortSlot(port, mode)
+            self.slots[port] = slot
+            slot.thread = threading.Thread(target=self._run, args=(slot,), daemon=True,
+                                           name=f"gang-{port}")
+        slot.thread.start()
+        return slot
+
+    def submit_all(self, ports: List[str], mode: str) -> List[PortSlot]:
+        """Start every idle port in the list, returning the slots started"""
+        started = []
+        for port in ports:
+            slot = self.submit(port, mode)
+            if slot:
+                started.append(slot)
+        return started
+
+    def _run(self, slot: PortSlot):
+        slot_queue = PortLogQueue(slot, self.log_queue)
+        slot_queue.put(('state', STATE_WAITING))
+        success = False
+        try:
+            success = bool(self.pipeline(slot_queue, slot.port, slot.mode, slot.stop_event,
+                                         self.flash_limiter))
+        except Exception as e:
+            slot_queue.put(f"[X] Unexpected error on {slot.port}: {e}")
+        finally:
+            slot.finished = time.time()
+            slot_queue.put(('state', STATE_DONE if success else STATE_FAILED))
+            slot_queue.put(f"-- {slot.port} finished in {slot.duration:.1f}s --")
+
+    def stop(self, port: str = None):
+        """Ask one port's job (or all jobs) to stop monitoring and finish"""
+        with self.lock:
+            slots = [self.slots[port]] if port in self.slots else (list(self.slots.values()) if port is None else [])
+        for slot in slots:
+            slot.stop_event.set()
+
+    def get_slot(self, port: str) -> Optional[PortSlot]:
+        with self.lock:
+            return self.slots.get(port)
+
+    def get_slots(self) -> List[PortSlot]:
+        """All slots ordered by port name"""
+        with self.lock:
+            return [self.slots[p] for p in sorted(self.slots)]
+
+    def active_count(self) -> int:
+        with self.lock:
+            return sum(1 for s in self.slots.values() if not s.is_finished)
+
+    def remove_finished(self, keep_ports=()):
+        """Drop finished slots, except those of ports still connected"""
+        with self.lock:
+            for port in [p for p, s in self.slots.items() if s.is_finished and p not in keep_ports]:
+                del self.slots[port]
+
+    def wait_all(self, timeout: float = None) -> bool:
+        """Block until every submitted job finished. Returns False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        for slot in self.get_slots():
+            if slot.thread:
+                remaining = None if deadline is None else max(0, deadline - time.time())
+                slot.thread.join(remaining)
+                if slot.thread.is_alive():
+                    return False
+        return True
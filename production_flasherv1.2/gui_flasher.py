@@ -1,7 +1,6 @@
 import os
 import sys
 import time
-import subprocess
 import requests
 import winsound
 import threading
@@ -9,14 +8,14 @@ import queue
 import logging
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
-from serial.tools.list_ports import comports
+from tkinter import font as tkfont
+from collections import deque
 import re
 import traceback
 import serial
 import configparser
 import asyncio
 from tkinter import simpledialog
-import bleak
 from typing import Optional
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 
@@ -24,6 +23,20 @@ from PIL import Image, ImageTk, ImageDraw, ImageFont
 from i18n_utils import _, translation_manager
 
 # Import local modules
+from firmware_cache import get_firmware_cache
+from build_index import get_build_index, configure_build_indexes
+from firmware_downloader import get_firmware_downloader, build_checksums
+from gang_flasher import GangFlasher, DEFAULT_MAX_PARALLEL, STATE_FLASHING, STATE_MONITORING
+from esp_backend import EspSession, BACKEND_SUBPROCESS, set_default_backend
+from smart_flash import smart_flash, format_report
+from baud_profile import get_baud_profile, is_link_error
+from usb_hotplug import get_port_registry
+from serial_reader import SerialLineReader, SerialDisconnected, READ_TIMEOUT
+from boot_log_parser import BootLogMatcher, BootLogParser, load_boot_log_fields
+from log_pipeline import LogQueue, BufferedLogFile, tab_for
+from log_record import (LogRecord, LogEmitter, LEVEL_PROGRESS, SUBSYSTEM_APP, SUBSYSTEM_DOWNLOAD,
+                        SUBSYSTEM_EFUSE, SUBSYSTEM_FLASH, SUBSYSTEM_SERIAL, SUBSYSTEM_BLE)
+
 try:
     from updater import DinoUpdater
 except ImportError:
@@ -31,6 +44,9 @@ except ImportError:
 
 try:
     from bluetooth_qc import get_bluetooth_qc_tester, BLEAK_AVAILABLE
+    from ble_service import get_ble_service
+    from ble_qc_sessions import get_qc_session_manager, MAX_BLE_CONNECTIONS
+    from qc_test_plan import QCPlanRunner, get_test_plan, set_test_plan, load_test_plan, QC_PLAN_FILE
     BT_QC_AVAILABLE = True
 except ImportError:
     BT_QC_AVAILABLE = False
@@ -38,7 +54,8 @@ except ImportError:
 
 # Firebase database integration (optional)
 try:
-    from firebase_db import get_firebase_db, store_qc_results, store_flash_log, store_session_log, init_firebase_with_credentials
+    from firebase_db import get_firebase_db, store_qc_results, store_flash_log, init_firebase_with_credentials
+    from firebase_db import open_session_log, configure_firebase_batching, flush_firebase_writes
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
@@ -49,9 +66,12 @@ except ImportError:
 DINOCORE_BASE_URL = "https://dinocore-telemetry-production.up.railway.app/"
 FIRMWARE_DIR = "production_firmware"
 TESTING_FIRMWARE_DIR = "testing_firmware"
-FLASH_BAUD = "460800"
+FLASH_BAUD = "460800"  # Default until the port is calibrated (see baud_profile.py)
 MONITOR_BAUD = 115200
 CONFIG_FILE = "config.ini"
+MAX_LOG_ENTRIES = 5000     # Entries kept per log tab
+MAX_LOG_LINE_CHARS = 400   # Longer lines are cut when drawn
+LOG_TICK_BUDGET = 0.03     # Seconds per GUI tick spent draining log_queue
 
 # --- Sound Definitions ---
 START_FREQ = 800
@@ -68,6 +88,12 @@ def play_sound(freq, duration):
     except Exception:
         pass
 
+def load_station_config():
+    """Reads station settings from config.ini (missing keys fall back to defaults)."""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE, encoding='utf-8')
+    return config['DEFAULT']
+
 def create_icon_from_emoji(emoji: str, color: str, size: int = 16) -> Optional[ImageTk.PhotoImage]:
     """Creates a PhotoImage from an emoji character."""
     try:
@@ -99,57 +125,49 @@ def parse_version(version_string):
     except (ValueError, IndexError):
         return None
 
-def download_firmware(log_queue, mode, hardware_version):
-    log_queue.put(f"Downloading {mode} firmware for HW {hardware_version}...")
+def download_firmware(log_queue, mode, hardware_version, pin=False):
+    """Resolves the newest compatible build and returns its cached file paths (or None).
+    With pin=True the caller must release the paths with get_firmware_cache().unpin()."""
+    log = LogEmitter(log_queue, SUBSYSTEM_DOWNLOAD)
+    log.info(f"Downloading {mode} firmware for HW {hardware_version}...")
     api_path = 'builds' if mode == 'production' else 'testing-builds'
-    fw_dir = FIRMWARE_DIR if mode == 'production' else TESTING_FIRMWARE_DIR
-    url = f"{DINOCORE_BASE_URL}/api/{api_path}"
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        builds = response.json()
-        compatible = [b for b in builds if hardware_version in b.get('supported_versions', [])]
-        if not compatible:
-            log_queue.put(f"[X] No compatible {mode} firmware found for HW {hardware_version}.")
-            return False
-        latest_build = max(compatible, key=lambda x: x['created_at'])
-        build_id = latest_build['id']
-        log_queue.put(f"Found compatible build: {latest_build['name']}")
-        os.makedirs(fw_dir, exist_ok=True)
-        file_types = ['bootloader', 'app', 'partition_table', 'ota_initial']
-        filenames = ["bootloader.bin", "magical-toys.bin", "partition-table.bin", "ota_data_initial.bin"]
-        for f_type, f_name in zip(file_types, filenames):
-            output_path = os.path.join(fw_dir, f_name)
-            dl_url = f"{DINOCORE_BASE_URL}/api/{api_path}/{build_id}/files/{f_type}/download"
-            log_queue.put(f"Downloading {f_name}...")
-            dl_resp = requests.get(dl_url, stream=True, timeout=30)
-            dl_resp.raise_for_status()
-            with open(output_path, 'wb') as f:
-                for chunk in dl_resp.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        log_queue.put(f"[OK] {mode.capitalize()} firmware for {hardware_version} downloaded successfully.")
-        return True
+        latest_build = get_build_index(api_path, DINOCORE_BASE_URL).get_latest_build(hardware_version)
+        if not latest_build:
+            log.error(f"[X] No compatible {mode} firmware found for HW {hardware_version}.")
+            return None
+        log.info(f"Found compatible build: {latest_build['name']}")
+        paths = get_firmware_cache().ensure_build(
+            mode, latest_build,
+            lambda targets: get_firmware_downloader().download_build(
+                DINOCORE_BASE_URL, api_path, latest_build['id'], targets, log_queue,
+                build_checksums(latest_build)),
+            log=log_queue.put, pin=pin)
+        if paths:
+            log.success(f"[OK] {mode.capitalize()} firmware for {hardware_version} ready.")
+        return paths
     except requests.exceptions.RequestException as e:
-        log_queue.put(f"[X] Network error while downloading: {e}")
-        return False
+        log.error(f"[X] Network error while downloading: {e}")
+        return None
 
-def burn_efuse(log_queue, port, version):
-    log_queue.put(f"Attempting to burn eFuse with version {version}...")
+def burn_efuse(log_queue, port, version, session=None):
+    log = LogEmitter(log_queue, SUBSYSTEM_EFUSE, port)
+    log.info(f"Attempting to burn eFuse with version {version}...")
     version_parts = parse_version(version)
     if not version_parts:
-        log_queue.put(f"[X] Invalid version format: {version}")
+        log.error(f"[X] Invalid version format: {version}")
         return False
 
-    log_queue.put("Attempting to reset device into download mode...")
+    session = session or EspSession(port, get_baud_profile().get_baud(port), log=log_queue.put)
+    log.info("Attempting to reset device into download mode...")
     try:
-        reset_cmd = [sys.executable, "-m", "esptool", "--chip", "esp32s3", "-p", port, "--before=default_reset", "--after=hard_reset", "chip_id"]
-        result = subprocess.run(reset_cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            log_queue.put("Device reset successful, proceeding with eFuse burning...")
+        return_code, _output = session.esptool(["chip_id"])
+        if return_code == 0:
+            log.info("Device reset successful, proceeding with eFuse burning...")
         else:
-            log_queue.put("Device reset failed, but continuing with eFuse burning...")
+            log.warning("Device reset failed, but continuing with eFuse burning...")
     except Exception as e:
-        log_queue.put(f"Device reset error: {e}, but continuing...")
+        log.warning(f"Device reset error: {e}, but continuing...")
 
     major, minor, patch = version_parts
     temp_file = f"temp_efuse_{port}.bin"
@@ -158,150 +176,171 @@ def burn_efuse(log_queue, port, version):
             buffer = bytearray(32)
             buffer[0], buffer[1], buffer[2] = major, minor, patch
             f.write(buffer)
-        efuse_cmd = [sys.executable, "-m", "espefuse", "--chip", "esp32s3", "-p", port, "--do-not-confirm", "burn_block_data", "BLOCK3", temp_file]
-        result = subprocess.run(efuse_cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            log_queue.put("Could not burn eFuse. It might be already written.")
-            if result.stderr:
-                log_queue.put(f"eFuse burn error: {result.stderr}")
+        return_code, output = session.espefuse(["--do-not-confirm", "burn_block_data", "BLOCK3", temp_file])
+        if return_code != 0:
+            log.warning("Could not burn eFuse. It might be already written.")
+            if output:
+                log.error("eFuse burn error: " + "\n".join(output.splitlines()[-5:]))
             return False
-        log_queue.put("[OK] eFuse burned successfully.")
+        log.success("[OK] eFuse burned successfully.")
         return True
     finally:
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
-def read_efuse_version(log_queue, port):
-    log_queue.put(f"Attempting to read eFuse from {port}...")
+def read_efuse_version(log_queue, port, session=None):
+    log = LogEmitter(log_queue, SUBSYSTEM_EFUSE, port)
+    log.info(f"Attempting to read eFuse from {port}...")
     try:
-        summary_cmd = [sys.executable, "-m", "espefuse", "--chip", "esp32s3", "-p", port, "summary"]
-        result = subprocess.run(summary_cmd, capture_output=True, text=True, check=False, timeout=15)
-        if result.returncode != 0:
-            log_queue.put("[X] Failed to read eFuse. Maybe locked?")
+        session = session or EspSession(port, get_baud_profile().get_baud(port), log=log_queue.put)
+        return_code, output = session.espefuse(["summary"])
+        if return_code != 0:
+            log.error("[X] Failed to read eFuse. Maybe locked?")
             return None
-        output = result.stdout
         match = re.search(r"BLOCK_USR_DATA \(BLOCK3\).*?=\s*([0-9a-f]{2})\s*([0-9a-f]{2})\s*([0-9a-f]{2})", output, re.DOTALL | re.IGNORECASE)
         if match:
             major, minor, patch = int(match.group(1), 16), int(match.group(2), 16), int(match.group(3), 16)
             if major == 0 and minor == 0 and patch == 0:
-                log_queue.put("[!] eFuse block is empty (version 0.0.0). Treating as no version found.")
+                log.warning("[!] eFuse block is empty (version 0.0.0). Treating as no version found.")
                 return None
             version = f"{major}.{minor}.{patch}"
-            log_queue.put(f"[OK] Found raw eFuse version: {version}")
+            log.success(f"[OK] Found raw eFuse version: {version}")
             return version
-        log_queue.put("[!] No version found on eFuse.")
+        log.warning("[!] No version found on eFuse.")
         return None
     except Exception as e:
-        log_queue.put(f"[X] Error reading eFuse: {e}")
+        log.error(f"[X] Error reading eFuse: {e}")
         return None
 
-def flash_device(log_queue, port, mode, hardware_version):
+def flash_device(log_queue, port, mode, hardware_version, session=None, smart=False, report=None):
+    """Flash a build. With smart=True regions already on the chip are skipped
+    and the per-region result is appended to report."""
+    log = LogEmitter(log_queue, SUBSYSTEM_FLASH, port)
     log_queue.put(('show_progress',))
     play_sound(START_FREQ, START_DUR)
-    log_queue.put(f"-- Starting {mode} flash for HW {hardware_version} on {port} --")
-    fw_dir = FIRMWARE_DIR if mode == 'production' else TESTING_FIRMWARE_DIR
-    if os.path.exists(fw_dir):
-        for f in os.listdir(fw_dir):
-            try:
-                os.remove(os.path.join(fw_dir, f))
-            except OSError:
-                pass
-    if not download_firmware(log_queue, mode, hardware_version):
-        log_queue.put(f"[X] Download for {hardware_version} failed. Aborting flash.")
+    log.info(f"-- Starting {mode} flash for HW {hardware_version} on {port} --")
+    # Pinned: other boards finishing a download must not evict the files this flash reads
+    firmware_paths = download_firmware(log_queue, mode, hardware_version, pin=True)
+    if not firmware_paths:
+        log.error(f"[X] Download for {hardware_version} failed. Aborting flash.")
         play_sound(ERROR_FREQ, ERROR_DUR)
         log_queue.put(('hide_progress',))
         return False
-    bootloader, app, p_table, ota_data = [os.path.join(fw_dir, f) for f in ["bootloader.bin", "magical-toys.bin", "partition-table.bin", "ota_data_initial.bin"]]
-    flash_cmd = [sys.executable, "-m", "esptool", "--chip", "esp32s3", "-p", port, "-b", FLASH_BAUD, "--before=default_reset", "--after=hard_reset", "write_flash", "--flash_mode", "dio", "--flash_freq", "80m", "--flash_size", "16MB", "0x0", bootloader, "0x260000", app, "0x10000", p_table, "0x15000", ota_data]
+    bootloader, app, p_table, ota_data = [firmware_paths[t] for t in ['bootloader', 'app', 'partition_table', 'ota_initial']]
+    flash_options = ["-z", "--flash_mode", "dio", "--flash_freq", "80m", "--flash_size", "16MB"]
+    flash_args = ["write_flash"] + flash_options + ["0x0", bootloader, "0x260000", app, "0x10000", p_table, "0x15000", ota_data]
+    session = session or EspSession(port, get_baud_profile().get_baud(port), log=log_queue.put)
+    state = {'is_flashing_main_app': False, 'last_progress_line': "", 'output': []}
+
+    def is_app_address(line):
+        # The app starts at 0x260000; smart flash may start writing further in
+        match = re.search(r"at 0x([0-9a-fA-F]{8})", line)
+        return bool(match) and int(match.group(1), 16) >= 0x260000
+
+    def on_line(line):
+        if "Writing at" in line and "%" in line:
+            # Clean up progress line
+            progress_match = re.search(r'(\d+\.\d+)%', line)
+            if progress_match:
+                clean_line = f"\rFlashing... {progress_match.group(0)}"
+                if clean_line != state['last_progress_line']:
+                    log.progress(clean_line, float(progress_match.group(1)))
+                    state['last_progress_line'] = clean_line
+        else:
+            log.info(line)
+            state['output'].append(line)
+
+        if "Writing at" in line and is_app_address(line):
+            state['is_flashing_main_app'] = True
+        if state['is_flashing_main_app']:
+            match = re.search(r"([\d\.]+)\%", line)
+            if match:
+                progress = int(float(match.group(1)))
+                log_queue.put(('progress', progress))
+        if state['is_flashing_main_app'] and "Wrote" in line and is_app_address(line):
+            state['is_flashing_main_app'] = False
+
     try:
-        process = subprocess.Popen(flash_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
-        is_flashing_main_app = False
-        last_progress_line = ""
-        for line in iter(process.stdout.readline, ''):
-            if "Writing at" in line and "%" in line:
-                # Clean up progress line
-                progress_match = re.search(r'(\d+\.\d+)%', line)
-                if progress_match:
-                    clean_line = f"\rFlashing... {progress_match.group(0)}"
-                    if clean_line != last_progress_line:
-                        log_queue.put(clean_line)
-                        last_progress_line = clean_line
+        return_code = None
+        if smart:
+            log.info("♻️ Smart flash: comparing flash contents with the build...")
+            regions = [('bootloader', 0x0, bootloader), ('partition_table', 0x10000, p_table),
+                       ('ota_initial', 0x15000, ota_data), ('app', 0x260000, app)]
+            return_code, smart_report = smart_flash(session, regions, flash_options, on_line=on_line)
+            if return_code is None:
+                log.warning("[!] Smart flash needs the in-process backend, doing a full flash")
             else:
-                log_queue.put(line)
-
-            if "Writing at 0x00260000" in line:
-                is_flashing_main_app = True
-            if is_flashing_main_app:
-                match = re.search(r"([\d\.]+)\%", line)
-                if match:
-                    progress = int(float(match.group(1)))
-                    log_queue.put(('progress', progress))
-            if is_flashing_main_app and "Wrote" in line and "at 0x00260000" in line:
-                is_flashing_main_app = False
-        process.stdout.close()
-        return_code = process.wait()
+                for line in format_report(smart_report):
+                    log.info(line)
+                if report is not None:
+                    report.extend(smart_report)
+        if return_code is None:
+            return_code, _output = session.esptool(flash_args, on_line=on_line, after="hard_reset")
+        if return_code != 0 and is_link_error("\n".join(state['output'])):
+            # Fall back one baud step for this port and retry the whole image once
+            lower_baud = get_baud_profile().record_failure(port, session.baud)
+            if lower_baud:
+                log.warning(f"[!] Flash failed at {session.baud} baud, retrying at {lower_baud} baud...")
+                session.close()
+                session = EspSession(port, lower_baud, session.backend, log_queue.put)
+                return_code, _output = session.esptool(flash_args, on_line=on_line, after="hard_reset")
         if return_code != 0:
-            log_queue.put(f"\n[X] Flash failed with exit code {return_code}.\n")
+            log.error(f"\n[X] Flash failed with exit code {return_code}.\n")
             play_sound(ERROR_FREQ, ERROR_DUR)
             return False
         else:
-            log_queue.put("\n[OK] Flash successful!\n")
+            raised_baud = get_baud_profile().record_success(port, session.baud)
+            if raised_baud:
+                log.info(f"🎚️ {port} stable at {session.baud} baud, next flash uses {raised_baud} baud")
+            log.success("\n[OK] Flash successful!\n")
             play_sound(END_FREQ, END_DUR)
             return True
     except Exception as e:
-        log_queue.put(f"\n[X] An unexpected error occurred during flash: {e}\n")
+        log.error(f"\n[X] An unexpected error occurred during flash: {e}\n")
         play_sound(ERROR_FREQ, ERROR_DUR)
         return False
     finally:
+        get_firmware_cache().unpin(firmware_paths)
         log_queue.put(('hide_progress',))
-        log_queue.put(f"-- Finished flashing {port} --")
+        log.info(f"-- Finished flashing {port} --")
 
 def serial_monitor_thread(log_queue, port, stop_event, app_instance):
+    log = LogEmitter(log_queue, SUBSYSTEM_SERIAL, port)
     try:
-        ser = serial.Serial(port, MONITOR_BAUD, timeout=1)
-        log_queue.put(f"--- Serial monitor started for {port} ---")
-        mac_address = None
-        device_name = None
+        reader = SerialLineReader(serial.Serial(port, MONITOR_BAUD, timeout=READ_TIMEOUT), port)
+        log.info(f"--- Serial monitor started for {port} ---")
+        ble_log = log.bind(SUBSYSTEM_BLE)
+
+        def on_field(field, value):
+            if field.label:
+                ble_log.info(f"📱 Captured {field.label}: {value}", **{field.name: value})
+
+        def on_complete(values):
+            # MAC and name seen and the firmware announced it is ready for BLE QC
+            app_instance.set_captured_ble_details(values['mac'], values['name'], port, values)
+
+        parser = BootLogParser(app_instance.boot_log_matcher, on_field=on_field, on_complete=on_complete)
         while not stop_event.is_set():
             try:
-                if ser.in_waiting > 0:
-                    line_bytes = ser.readline()
-                    line = line_bytes.decode('utf-8', errors='replace')
-                    log_queue.put(line)
-
-                    # Capture MAC and Name
-                    if "Bluetooth MAC:" in line:
-                        mac_match = re.search(r'Bluetooth MAC: ([\w:]+)', line)
-                        if mac_match:
-                            mac_address = mac_match.group(1).strip().upper()
-                            log_queue.put(f"📱 Captured Bluetooth MAC: {mac_address}")
-                    
-                    if "Setting device name to:" in line:
-                        name_match = re.search(r'Setting device name to: ([\w-]+)', line)
-                        if name_match:
-                            device_name = name_match.group(1).strip()
-                            log_queue.put(f"📱 Captured Bluetooth Name: {device_name}")
-
-                    if "The device is now discoverable and ready for connection!" in line:
-                        if mac_address and device_name:
-                            app_instance.set_captured_ble_details(mac_address, device_name)
-                            mac_address, device_name = None, None # Reset
-                else:
-                    time.sleep(0.05)
-                    if not any(p.device == port for p in comports()):
-                        log_queue.put(f"\n--- Device {port} disconnected. Closing monitor. ---")
-                        break
-            except serial.SerialException:
-                log_queue.put(f"\n--- Device {port} disconnected. Closing monitor. ---")
+                lines = reader.read_lines()
+            except SerialDisconnected:
+                log.warning(f"\n--- Device {port} disconnected. Closing monitor. ---")
                 break
-        ser.close()
-        log_queue.put(f"--- Serial monitor for {port} stopped. ---")
+            for line in lines:
+                log.info(line)
+                parser.feed(line)
+        reader.close()
+        log.info(f"--- Serial monitor for {port} stopped. ---")
     except Exception as e:
-        log_queue.put(f"\n[X] Error opening serial monitor on {port}: {e}")
+        log.error(f"\n[X] Error opening serial monitor on {port}: {e}")
+
+def get_esp32_ports():
+    """Returns all ports connected to an ESP32 (by VID/PID) from the hotplug registry."""
+    return get_port_registry().get_esp32_ports()
 
 def get_esp32_port(log_queue):
     """Scans COM ports and identifies the one connected to an ESP32 using VID/PID."""
-    esp32_ports = [p for p in comports() if "303A:1001" in p.hwid]
+    esp32_ports = get_esp32_ports()
 
     if not esp32_ports:
         return None, "NO_ESP32_FOUND"
@@ -309,10 +348,16 @@ def get_esp32_port(log_queue):
     if len(esp32_ports) > 1:
         return None, "MULTIPLE_ESP32_FOUND"
 
-    port = esp32_ports[0].device
+    port = esp32_ports[0]
     return port, "ESP32_FOUND"
 
-def process_device_thread(log_queue, port, mode, stop_event, target_hw_version, app_instance):
+def process_device_thread(log_queue, port, mode, stop_event, target_hw_version, app_instance, flash_limiter=None):
+    """Full per-device pipeline: eFuse burn/verify, flash, serial monitor.
+
+    flash_limiter (a semaphore shared by the gang flasher) is held only while
+    the eFuse and flash steps use the USB bus. Returns True if the flash succeeded.
+    """
+    log = LogEmitter(log_queue, SUBSYSTEM_APP, port)
     start_time = time.time()
     device_info = {'port': port, 'serial_number': 'unknown'}
     flash_result = {
@@ -322,76 +367,98 @@ def process_device_thread(log_queue, port, mode, stop_event, target_hw_version,
         'error': ''
     }
 
+    limiter_held = False
+    session = None
     try:
-        log_queue.put(f"--- Processing new device on {port} ---")
+        log.info(f"--- Processing new device on {port} ---")
+        if flash_limiter is not None:
+            flash_limiter.acquire()
+            limiter_held = True
+        log_queue.put(('state', STATE_FLASHING))
+        # One chip connection for reset, eFuse burn/verify and flash (in-process backend)
+        session = EspSession(port, get_baud_profile().get_baud(port), log=log_queue.put)
         flash_hw_version = None
         if mode == 'testing':
-            log_queue.put(_("Attempting to burn eFuse with version {version}...").format(version=target_hw_version))
-            burn_successful = burn_efuse(log_queue, port, target_hw_version)
+            log.info(_("Attempting to burn eFuse with version {version}...").format(version=target_hw_version))
+            burn_successful = burn_efuse(log_queue, port, target_hw_version, session)
             if burn_successful:
-                log_queue.put(_("Burn command succeeded. Verifying by reading back eFuse..."))
-                time.sleep(2)  # Increased delay for device stabilization
-                read_version = read_efuse_version(log_queue, port)
+                log.info(_("Burn command succeeded. Verifying by reading back eFuse..."))
+                if session.backend == BACKEND_SUBPROCESS:
+                    time.sleep(2)  # Increased delay for device stabilization
+                read_version = read_efuse_version(log_queue, port, session)
                 if read_version == target_hw_version:
-                    log_queue.put(_("[OK] Verification successful. Version {version} is burned.").format(version=read_version))
+                    log.success(_("[OK] Verification successful. Version {version} is burned.").format(version=read_version))
                     flash_hw_version = target_hw_version
-                    log_queue.put(_("eFuse burning completed successfully. Starting firmware flash..."))
+                    log.info(_("eFuse burning completed successfully. Starting firmware flash..."))
                 else:
-                    log_queue.put(_("[X] VERIFICATION FAILED. Burned version ({burned}) does not match target ({target}). Stopping.").format(burned=read_version, target=target_hw_version))
+                    log.error(_("[X] VERIFICATION FAILED. Burned version ({burned}) does not match target ({target}). Stopping.").format(burned=read_version, target=target_hw_version))
                     play_sound(ERROR_FREQ, ERROR_DUR)
                     return
             else:
-                log_queue.put(_("Burn command failed. Attempting to read existing version..."))
-                existing_version = read_efuse_version(log_queue, port)
+                log.info(_("Burn command failed. Attempting to read existing version..."))
+                existing_version = read_efuse_version(log_queue, port, session)
                 if existing_version:
-                    log_queue.put(_("Proceeding with existing version: {version}").format(version=existing_version))
+                    log.info(_("Proceeding with existing version: {version}").format(version=existing_version))
                     flash_hw_version = existing_version
                 else:
-                    log_queue.put(_("[X] Could not read existing version after burn failure. Stopping."))
+                    log.error(_("[X] Could not read existing version after burn failure. Stopping."))
                     play_sound(ERROR_FREQ, ERROR_DUR)
                     return
         elif mode == 'production':
-            log_queue.put(_("Production mode: Reading eFuse..."))
-            existing_version = read_efuse_version(log_queue, port)
+            log.info(_("Production mode: Reading eFuse..."))
+            existing_version = read_efuse_version(log_queue, port, session)
             if existing_version:
                 flash_hw_version = existing_version
-                log_queue.put(_("Found eFuse version: {version}. Starting firmware flash...").format(version=existing_version))
+                log.info(_("Found eFuse version: {version}. Starting firmware flash...").format(version=existing_version))
             else:
-                log_queue.put(_("[X] PRODUCTION FAILED: No eFuse version found. Please run device through Testing Mode first."))
+                log.error(_("[X] PRODUCTION FAILED: No eFuse version found. Please run device through Testing Mode first."))
                 play_sound(ERROR_FREQ, ERROR_DUR)
                 return
 
         # If we have a firmware version to flash, proceed with flashing
         if flash_hw_version:
-            log_queue.put(_("-- Starting {mode} flash for HW {hardware_version} on {port} --").format(
+            log.info(_("-- Starting {mode} flash for HW {hardware_version} on {port} --").format(
                 mode=mode.capitalize(), hardware_version=flash_hw_version, port=port))
-            flash_ok = flash_device(log_queue, port, mode, flash_hw_version)
+            smart = getattr(app_instance, 'smart_flash', False)
+            flash_report = []
+            flash_ok = flash_device(log_queue, port, mode, flash_hw_version, session, smart, flash_report)
+            if flash_report:
+                flash_result['flash_report'] = flash_report
+            if limiter_held:
+                flash_limiter.release()
+                limiter_held = False
             if flash_ok:
-                log_queue.put(_("Flash completed successfully. Starting serial monitor..."))
+                log.info(_("Flash completed successfully. Starting serial monitor..."))
                 flash_result['success'] = True
+                log_queue.put(('state', STATE_MONITORING))
                 serial_monitor_thread(log_queue, port, stop_event, app_instance)
             else:
-                log_queue.put(_("[X] Flash failed. Unable to complete device programming."))
+                log.error(_("[X] Flash failed. Unable to complete device programming."))
                 flash_result['error'] = "Flash process failed"
                 play_sound(ERROR_FREQ, ERROR_DUR)
         else:
-            log_queue.put(_("[X] No valid hardware version found. Cannot proceed with flash."))
+            log.error(_("[X] No valid hardware version found. Cannot proceed with flash."))
             flash_result['error'] = "No valid hardware version found"
             play_sound(ERROR_FREQ, ERROR_DUR)
 
     except Exception as e:
         flash_result['error'] = str(e)
-        log_queue.put("!!!!!!!!!! UNEXPECTED ERROR in device processing thread !!!!!!!!!!!")
-        log_queue.put(f"ERROR: {e}")
-        log_queue.put(traceback.format_exc() + "\n")
+        log.error("!!!!!!!!!! UNEXPECTED ERROR in device processing thread !!!!!!!!!!!")
+        log.error(f"ERROR: {e}")
+        log.error(traceback.format_exc() + "\n")
         play_sound(ERROR_FREQ, ERROR_DUR)
     finally:
+        if session:
+            session.close()
+        if limiter_held:
+            flash_limiter.release()
         flash_result['duration'] = time.time() - start_time
         if FIREBASE_AVAILABLE:
             store_flash_log(device_info, flash_result)
-            # Also store the full session log
-            if app_instance.session_logs:
-                store_session_log(app_instance.session_logs)
+            # Push this device's part of the session log now instead of waiting for the chunk timer
+            if app_instance.session_log:
+                app_instance.session_log.flush()
+    return flash_result['success']
 
 class FlasherApp:
     def __init__(self, root):
@@ -457,14 +524,20 @@ class FlasherApp:
         # Clear log file on start, ensuring it's UTF-8
         with open(self.log_file, "w", encoding="utf-8") as f:
             f.write(f"--- Session Log Started: {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
+        self.log_writer = BufferedLogFile(self.log_file)
+        # The same session as structured records, one JSON object per line
+        self.record_file = "session.jsonl"
+        open(self.record_file, "w", encoding="utf-8").close()
+        self.record_writer = BufferedLogFile(self.record_file)
         
         self.hw_version_var = tk.StringVar()
         self.captured_ble_name = None
         self.captured_mac = None
-        self.session_logs = []
+        # Streamed to Firebase in compressed chunks while the session runs
+        self.session_log = open_session_log() if FIREBASE_AVAILABLE else None
         self.ble_ready_event = threading.Event()
         
-        self.log_queue = queue.Queue()
+        self.log_queue = LogQueue()
         self.scanner_stop_event = threading.Event()
         
         # --- Create Icons ---
@@ -480,6 +553,37 @@ class FlasherApp:
             'zh_flag': create_icon_from_emoji("🇨🇳", "#000000"),
         }
 
+        # --- Station Configuration ---
+        self.station_config = load_station_config()
+        configure_build_indexes(
+            ttl=self.station_config.getfloat('build_index_ttl', fallback=300),
+            stale_while_revalidate=self.station_config.getboolean('stale_while_revalidate', fallback=True))
+        set_default_backend(self.station_config.get('esp_backend', fallback='inprocess'))
+        self.smart_flash_var = tk.BooleanVar(value=self.station_config.getboolean('smart_flash', fallback=False))
+        self.smart_flash = self.smart_flash_var.get()
+        self.boot_log_matcher = BootLogMatcher(load_boot_log_fields(CONFIG_FILE))
+        if FIREBASE_AVAILABLE:
+            configure_firebase_batching(
+                max_docs=self.station_config.getint('firebase_batch_size', fallback=100),
+                max_age=self.station_config.getfloat('firebase_batch_max_age', fallback=2.0))
+
+        # --- Gang Flashing ---
+        self.esp32_port = None
+        self.esp32_ports = []
+        self.detector_subscribed = False
+        self.slot_rows = {}
+        self.port_log_views = {}
+        self.gang = GangFlasher(self.run_device_pipeline,
+                                self.station_config.getint('max_parallel_flashes', fallback=DEFAULT_MAX_PARALLEL),
+                                self.log_queue)
+        if BT_QC_AVAILABLE:
+            qc_sessions = get_qc_session_manager()
+            qc_sessions.set_log_queue(self.log_queue)
+            qc_sessions.set_max_connections(self.station_config.getint('max_ble_connections',
+                                                                       fallback=MAX_BLE_CONNECTIONS))
+            set_test_plan(load_test_plan(self.station_config.get('qc_test_plan', fallback=QC_PLAN_FILE)))
+        self.gang_qc_pending = 0
+
         self.create_widgets()
         self.update_log()
         
@@ -493,7 +597,11 @@ class FlasherApp:
 
         self.root.after(200, self.ask_hardware_version)
 
-    def set_captured_ble_details(self, mac, name):
+    def set_captured_ble_details(self, mac, name, port=None, boot_fields=None):
+        slot = self.gang.get_slot(port) if port else None
+        if slot:
+            slot.ble_mac, slot.ble_name = mac, name
+            slot.boot_fields = dict(boot_fields or {})
         self.captured_mac = mac
         self.captured_ble_name = name
         self.ble_ready_event.set() # Signal that BLE is ready
@@ -509,8 +617,7 @@ class FlasherApp:
             self.hw_version_var.set(version)
             self.log_queue.put(f"🎯 Using hardware version for this session: {version}")
             self.scanner_stop_event.clear()
-            detector_thread = threading.Thread(target=self.device_detector_worker, daemon=True)
-            detector_thread.start()
+            self.start_device_detector()
         elif version is None: # User cancelled
             self.root.destroy()
         else: # Invalid format
@@ -628,6 +735,11 @@ class FlasherApp:
             tk.Label(config_inner, text=_("🔄 Auto-update system not available"), font=("Segoe UI", 9),
                     bg=self.colors['frame_bg'], fg=self.colors['log_text']).pack(side=tk.LEFT, padx=(10, 0))
 
+        self.calibrate_button = tk.Button(config_inner, text=_("🎚️ Calibrate Baud"), font=("Segoe UI", 10, "bold"),
+                                          bg=self.colors['frame_bg'], fg=self.colors['text'],
+                                          command=self.start_baud_calibration, relief=tk.FLAT, padx=15)
+        self.calibrate_button.pack(side=tk.LEFT, padx=(10, 0))
+
         # --- Main Control Area ---
         self.control_area = tk.Frame(content_frame, bg=self.colors['bg'])
         self.control_area.pack(fill=tk.X, pady=(0, 15))
@@ -637,6 +749,16 @@ class FlasherApp:
                                     bg=self.colors['status_idle'], fg="white", pady=8, padx=15,
                                     relief=tk.FLAT)
         self.status_label.pack(fill=tk.X, pady=(0, 10))
+
+        # --- Gang Slots (one row per connected board) ---
+        self.slots_frame = tk.LabelFrame(self.control_area, text=f" 🔌 {_('Connected Boards')} ", font=("Segoe UI", 11, "bold"),
+                                    bg=self.colors['frame_bg'], fg=self.colors['text'], relief=tk.GROOVE, borderwidth=2)
+        self.slots_frame.pack(fill=tk.X, pady=(0, 5))
+        self.slots_inner = tk.Frame(self.slots_frame, bg=self.colors['frame_bg'])
+        self.slots_inner.pack(fill=tk.X, padx=15, pady=5)
+        self.slots_placeholder = tk.Label(self.slots_inner, text=_("No boards connected"), font=("Segoe UI", 10),
+                                          bg=self.colors['frame_bg'], fg=self.colors['log_text'], anchor='w')
+        self.slots_placeholder.pack(fill=tk.X)
         
         # --- Progress Bar ---
         self.progress_bar = ttk.Progressbar(self.control_area, orient='horizontal', length=100, mode='determinate', style="TProgressbar")
@@ -668,6 +790,13 @@ class FlasherApp:
                                     command=lambda: self.start_flashing('testing'), state='disabled', **button_config)
         self.test_button.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=(5, 0))
 
+        self.smart_flash_check = tk.Checkbutton(self.flash_frame, text=_("♻️ Smart re-flash (skip unchanged regions)"),
+                                                variable=self.smart_flash_var, font=("Segoe UI", 10),
+                                                bg=self.colors['frame_bg'], fg=self.colors['text'],
+                                                selectcolor=self.colors['entry_bg'], activebackground=self.colors['frame_bg'],
+                                                activeforeground=self.colors['text'])
+        self.smart_flash_check.pack(anchor='w', padx=15, pady=(0, 8))
+
         # --- Quality Control Section ---
         self.qc_frame = tk.LabelFrame(self.control_area, text=f" 🔵 {_('Bluetooth Quality Control (QC)')} ", font=("Segoe UI", 11, "bold"),
                                     bg=self.colors['frame_bg'], fg=self.colors['text'], relief=tk.GROOVE, borderwidth=2)
@@ -753,143 +882,230 @@ class FlasherApp:
         pass
 
     def update_log(self):
-        while not self.log_queue.empty():
-            message_info = self.log_queue.get_nowait()
-            
-            # --- Write to file log ---
+        """Drain log_queue for at most LOG_TICK_BUDGET seconds, then hand the Tk loop back."""
+        deadline = time.perf_counter() + LOG_TICK_BUDGET
+        progress_value = None
+        pending_progress = {}  # log view -> newest progress line not drawn yet
+        drained = True
+
+        while True:
+            if time.perf_counter() >= deadline:
+                drained = False
+                break
             try:
-                with open(self.log_file, "a", encoding="utf-8") as f:
-                    f.write(str(message_info).strip() + "\n")
-            except Exception as e:
-                print(f"Failed to write to log file: {e}") # Fallback to console
-            
-            # Store raw message for Firebase logging
-            self.session_logs.append(str(message_info))
-
-            # Determine target tab and message content
-            tab_name = "USB/Serial" # Default tab
-            message = message_info
-
-            if isinstance(message_info, tuple):
-                if message_info[0] in self.log_views:
-                    tab_name, message = message_info
-                # This handles progress bar updates without trying to log them as text
-                elif message_info[0] in ['progress', 'show_progress', 'hide_progress']:
-                    if message_info[0] == 'progress':
-                        self.progress_bar['value'] = message_info[1]
-                    elif message_info[0] == 'show_progress':
-                        if not self.progress_visible:
-                            # Pack it inside the main control area, right after the status label
-                            self.progress_bar.pack(in_=self.control_area, fill=tk.X, pady=5, after=self.status_label)
-                            self.progress_visible = True
-                    elif message_info[0] == 'hide_progress':
-                        if self.progress_visible:
-                            self.progress_bar.pack_forget()
-                            self.progress_visible = False
-                    continue # Skip text logging for this message
-            
-            message_str = str(message)
-            if "[BLE" in message_str or "Bluetooth" in message_str:
-                tab_name = "Bluetooth"
-            elif "Firebase" in message_str:
-                tab_name = "Firebase"
-
-            log_view = self.log_views[tab_name]
+                message_info = self.log_queue.get_nowait()
+            except queue.Empty:
+                break
 
-            # Special handling for single-line progress updates
-            if "Flashing..." in message_str and "%" in message_str:
-                log_view.update_last_line(message_str)
+            if isinstance(message_info, LogRecord):
+                self.log_writer.write(message_info.file_text() + "\n")
+                self.record_writer.write(message_info.to_json() + "\n")
+                if self.session_log:
+                    self.session_log.append(message_info)
+
+                log_view = self.get_port_log_view(message_info.port) if message_info.port \
+                    else self.log_views[tab_for(message_info)]
+                if message_info.level == LEVEL_PROGRESS:
+                    # Consecutive progress lines collapse into one redraw per tick
+                    pending_progress[log_view] = message_info.message
+                    continue
+                if log_view in pending_progress:
+                    log_view.update_last_line(pending_progress.pop(log_view))
+                level = message_info.level
+                log_view.add_log_entry(message_info.message, self.icons.get(level, self.icons['info']), level)
+
+            # Slot state and per-port progress are shown in the slot rows
+            elif message_info[0] in ('port', 'state'):
+                continue
+            # Progress bar updates: only the newest value is applied
+            elif message_info[0] == 'progress':
+                progress_value = message_info[1]
+            elif message_info[0] == 'show_progress':
+                if not self.progress_visible:
+                    # Pack it inside the main control area, right after the status label
+                    self.progress_bar.pack(in_=self.control_area, fill=tk.X, pady=5, after=self.status_label)
+                    self.progress_visible = True
+            elif message_info[0] == 'hide_progress':
+                if self.progress_visible:
+                    self.progress_bar.pack_forget()
+                    self.progress_visible = False
+
+        for log_view, text in pending_progress.items():
+            log_view.update_last_line(text)
+        if progress_value is not None:
+            self.progress_bar['value'] = progress_value
+        self.log_writer.maybe_flush()
+        self.record_writer.maybe_flush()
+        if self.session_log:
+            self.session_log.maybe_flush()
+
+        self.refresh_slot_rows()
+        # Come back sooner while a flood is still queued
+        self.root.after(10 if not drained else 100, self.update_log)
+
+    def get_port_log_view(self, port):
+        """Return the log tab of a gang port, creating it on first use."""
+        if port not in self.port_log_views:
+            frame = tk.Frame(self.notebook, bg=self.colors['frame_bg'])
+            self.notebook.add(frame, text=f"🔌 {port}")
+            log_view = LogViewer(frame, self.colors, self.icons)
+            log_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            self.port_log_views[port] = log_view
+        return self.port_log_views[port]
+
+    def refresh_slot_rows(self):
+        """Show one status row per connected or busy port."""
+        connected = list(self.esp32_ports)
+        self.gang.remove_finished(keep_ports=connected)
+        slots = {slot.port: slot for slot in self.gang.get_slots()}
+        ports = sorted(set(connected) | set(slots))
+
+        for port in [p for p in self.slot_rows if p not in ports]:
+            self.slot_rows.pop(port)['frame'].destroy()
+
+        for port in ports:
+            row = self.slot_rows.get(port)
+            if row is None:
+                frame = tk.Frame(self.slots_inner, bg=self.colors['frame_bg'])
+                frame.pack(fill=tk.X, pady=1)
+                row = {
+                    'frame': frame,
+                    'port': tk.Label(frame, text=port, width=10, anchor='w', font=("Consolas", 10, "bold"),
+                                     bg=self.colors['frame_bg'], fg=self.colors['text']),
+                    'state': tk.Label(frame, width=16, anchor='w', font=("Segoe UI", 10, "bold"),
+                                      fg="white", padx=5),
+                    'progress': ttk.Progressbar(frame, orient='horizontal', length=120, mode='determinate'),
+                    'message': tk.Label(frame, anchor='w', font=("Consolas", 9),
+                                        bg=self.colors['frame_bg'], fg=self.colors['log_text']),
+                }
+                row['port'].pack(side=tk.LEFT)
+                row['state'].pack(side=tk.LEFT, padx=5)
+                row['progress'].pack(side=tk.LEFT, padx=5)
+                row['message'].pack(side=tk.LEFT, fill=tk.X, expand=True)
+                self.slot_rows[port] = row
+
+            slot = slots.get(port)
+            if slot is None:
+                state_text, state_bg, progress, message = "✅ " + _("Ready"), self.colors['status_success'], 0, ""
             else:
-                # Determine icon for new log entries
-                icon = self.icons['info']
-                if "[OK]" in message_str or "✅" in message_str or "[SUCCESS]" in message_str:
-                    icon = self.icons['success']
-                elif "[X]" in message_str or "❌" in message_str or "[ERROR]" in message_str or "[FAILED]" in message_str:
-                    icon = self.icons['error']
-                elif "[!]" in message_str or "⚠️" in message_str or "[WARNING]" in message_str:
-                    icon = self.icons['warning']
-                elif "Bluetooth" in message_str or "BLE" in message_str:
-                    icon = self.icons['bt']
-                elif "Firebase" in message_str:
-                    icon = self.icons['firebase']
-                elif "Flash" in message_str or "esptool" in message_str:
-                    icon = self.icons['flash']
-                
-                log_view.add_log_entry(message_str, icon)
-
-        self.root.after(100, self.update_log)
+                state_text, state_bg = self.slot_state_display(slot)
+                progress, message = slot.progress, slot.last_message
+                if port not in connected and not slot.is_finished:
+                    message = _("Disconnected") + " - " + message
+            if row['state'].cget('text') != state_text:
+                row['state'].config(text=state_text, bg=state_bg)
+            if row['progress']['value'] != progress:
+                row['progress']['value'] = progress
+            message = message[:80]
+            if row['message'].cget('text') != message:
+                row['message'].config(text=message)
+
+        if not ports and not self.slots_placeholder.winfo_ismapped():
+            self.slots_placeholder.pack(fill=tk.X)
+        elif ports and self.slots_placeholder.winfo_ismapped():
+            self.slots_placeholder.pack_forget()
+
+    def slot_state_display(self, slot):
+        """Return (text, background colour) for a slot's state."""
+        mode_bg = self.colors['status_prod'] if slot.mode == 'production' else self.colors['status_test']
+        return {
+            'waiting': ("⏳ " + _("Waiting"), self.colors['status_idle']),
+            'flashing': ("⚡ " + _("Flashing"), mode_bg),
+            'monitoring': ("🔵 " + _("Monitoring"), self.colors['highlight']),
+            'done': ("✅ " + _("Done"), self.colors['status_success']),
+            'failed': ("❌ " + _("Failed"), self.colors['status_warning']),
+        }.get(slot.state, (slot.state, self.colors['status_idle']))
+
+    def run_device_pipeline(self, log_queue, port, mode, stop_event, flash_limiter):
+        """Gang flasher job: the full device pipeline for one port."""
+        return process_device_thread(log_queue, port, mode, stop_event, self.hw_version_var.get(), self, flash_limiter)
 
     def start_flashing(self, operation):
-        if not self.esp32_port:
-            messagebox.showerror(_("Error"), _("No ESP32 device detected."))
+        ports = [p for p in self.esp32_ports if not self.gang.is_busy(p)]
+        if not ports:
+            messagebox.showerror(_("Error"), _("No idle ESP32 device detected."))
             return
 
         # Reset captured details on new flash operation
         self.captured_mac = None
         self.captured_ble_name = None
+        self.ble_ready_event.clear()
         self.bt_qc_button.config(state='disabled')
 
+        port_list = ", ".join(ports)
         if operation == 'production':
-            if not messagebox.askokcancel(_("Confirm"), _("Ready to flash PRODUCTION firmware to {port}?").format(port=self.esp32_port)):
+            if not messagebox.askokcancel(_("Confirm"), _("Ready to flash PRODUCTION firmware to {port}?").format(port=port_list)):
                 return
             self.status_label.config(text="🏭 " + _("Flashing Production..."), bg=self.colors['status_prod'])
         else: # testing
-            if not messagebox.askokcancel(_("Confirm"), _("Ready to flash TESTING firmware and burn eFuse on {port}? This is irreversible.").format(port=self.esp32_port)):
+            if not messagebox.askokcancel(_("Confirm"), _("Ready to flash TESTING firmware and burn eFuse on {port}? This is irreversible.").format(port=port_list)):
                 return
             self.status_label.config(text="🧪 " + _("Flashing Testing..."), bg=self.colors['status_test'])
-        
-        self.scanner_stop_event.set() # Stop the detector thread
-        
-        target_hw_version = self.hw_version_var.get()
-        # Pass 'self' to process_device_thread
-        flash_thread = threading.Thread(target=process_device_thread, args=(self.log_queue, self.esp32_port, operation, threading.Event(), target_hw_version, self), daemon=True)
-        flash_thread.start()
 
-        # Disable buttons during flash
-        self.prod_button.config(state='disabled')
-        self.test_button.config(state='disabled')
-        self.bt_qc_button.config(state='disabled')
+        self.smart_flash = self.smart_flash_var.get()
 
-        # Monitor thread to re-enable buttons
-        def monitor_flash_thread():
-            flash_thread.join()
-            self.scanner_stop_event.clear()
-            detector_thread = threading.Thread(target=self.device_detector_worker, daemon=True)
-            detector_thread.start()
+        # Each port runs its own pipeline; the detector keeps running so boards
+        # plugged in meanwhile can be started as soon as they appear
+        started = self.gang.submit_all(ports, operation)
+        self.log_queue.put(f"⚡ Started {operation} flash on {len(started)} board(s): {port_list} "
+                           f"(max {self.gang.max_parallel} flashing at once)")
 
-        monitor_thread = threading.Thread(target=monitor_flash_thread, daemon=True)
-        monitor_thread.start()
+    def start_baud_calibration(self):
+        """Find the highest reliable flash baud for every idle connected board."""
+        ports = [p for p in self.esp32_ports if not self.gang.is_busy(p)]
+        if not ports:
+            messagebox.showerror(_("Error"), _("No idle ESP32 device detected."))
+            return
+        if not messagebox.askokcancel(_("Calibrate Baud"),
+                                      _("Test increasing flash baud rates on {port}?\n\n"
+                                        "The app partition is overwritten with test data, "
+                                        "so flash the board again afterwards.").format(port=", ".join(ports))):
+            return
 
-    def device_detector_worker(self):
-        self.esp32_port = None
-        last_status = None
-
-        while not self.scanner_stop_event.is_set():
-            port, status = get_esp32_port(self.log_queue)
-
-            if status != last_status:
-                if status == "ESP32_FOUND":
-                    self.esp32_port = port
-                    self.log_queue.put(f"✅ ESP32 detected on port {port}")
-                    self.status_label.config(text="✅ " + _("ESP32 Ready on {}").format(port), bg=self.colors['status_success'])
-                    self.prod_button.config(state='normal')
-                    self.test_button.config(state='normal')
-                    self.bt_qc_button.config(state='normal')
-                elif status == "NO_ESP32_FOUND":
-                    self.esp32_port = None
-                    self.status_label.config(text="🔌 " + _("Connect ESP32 Device"), bg=self.colors['status_idle'])
-                    self.prod_button.config(state='disabled')
-                    self.test_button.config(state='disabled')
-                    self.bt_qc_button.config(state='disabled')
-                elif status == "MULTIPLE_ESP32_FOUND":
-                    self.esp32_port = None
-                    self.status_label.config(text="⚠️ " + _("Multiple ESP32s Detected"), bg=self.colors['status_warning'])
-                    self.prod_button.config(state='disabled')
-                    self.test_button.config(state='disabled')
-                    self.bt_qc_button.config(state='disabled')
-                last_status = status
-            
-            time.sleep(2)
+        self.calibrate_button.config(state='disabled')
+
+        def calibration_thread():
+            try:
+                for port in ports:
+                    get_baud_profile().calibrate(port, log=self.log_queue.put)
+            finally:
+                self.root.after(0, lambda: self.calibrate_button.config(state='normal'))
+
+        threading.Thread(target=calibration_thread, daemon=True).start()
+
+    def start_device_detector(self):
+        """Subscribe to ESP32 hotplug events (once) and show the boards already connected."""
+        if not self.detector_subscribed:
+            get_port_registry().subscribe(self.on_esp32_hotplug)
+            self.detector_subscribed = True
+        self.update_esp32_ports()
+
+    def on_esp32_hotplug(self, event, port_info):
+        """Hotplug callback (watcher thread): refresh the port list on the Tk thread."""
+        self.root.after(0, self.update_esp32_ports)
+
+    def update_esp32_ports(self):
+        if self.scanner_stop_event.is_set():
+            return
+        ports = get_esp32_ports()
+        for port in sorted(set(ports) - set(self.esp32_ports)):
+            self.log_queue.put(f"✅ ESP32 detected on port {port}")
+        self.esp32_ports = ports
+        self.esp32_port = ports[0] if len(ports) == 1 else None
+        if ports:
+            if len(ports) == 1:
+                status_text = "✅ " + _("ESP32 Ready on {}").format(ports[0])
+            else:
+                status_text = "✅ " + _("{} ESP32s Ready").format(len(ports))
+            self.status_label.config(text=status_text, bg=self.colors['status_success'])
+            self.prod_button.config(state='normal')
+            self.test_button.config(state='normal')
+            self.bt_qc_button.config(state='normal')
+        else:
+            self.status_label.config(text="🔌 " + _("Connect ESP32 Device"), bg=self.colors['status_idle'])
+            self.prod_button.config(state='disabled')
+            self.test_button.config(state='disabled')
+            self.bt_qc_button.config(state='disabled')
 
     def set_language(self, lang_code):
         """Set the application language and update UI."""
@@ -984,7 +1200,59 @@ class FlasherApp:
                                     "This will scan for QA-enabled devices and run microphone\n"
                                     "balance tests via Bluetooth LE.\n\n"
                                     "Make sure devices are powered on and in range.")):
-            self.start_bluetooth_qc_mode()
+            slots = self.get_qc_ready_slots()
+            if slots:
+                self.start_gang_qc(slots)
+            else:
+                self.start_bluetooth_qc_mode()
+
+    def get_qc_ready_slots(self):
+        """Flashed boards that announced their BLE MAC and have not been QC'd yet"""
+        qc_sessions = get_qc_session_manager()
+        return [slot for slot in self.gang.get_slots()
+                if slot.ble_mac and slot.qc_result is None and not qc_sessions.is_running(slot.ble_mac)]
+
+    def start_gang_qc(self, slots):
+        """QC every ready board at once, one BLE session per MAC"""
+        self.status_label.config(text="🔵 " + _("Bluetooth QC Active..."), bg='#7b68ee')
+        self.bt_qc_button.config(state='disabled')
+        qc_sessions = get_qc_session_manager()
+        self.log_queue.put(f"🟦 Starting Bluetooth QC on {len(slots)} board(s) "
+                           f"(max {qc_sessions.max_connections} connected at once)")
+
+        def on_done(result):
+            self.root.after(0, self.on_gang_qc_done, result)
+
+        for slot in slots:
+            if qc_sessions.submit(slot.ble_mac, slot.ble_name, slot.port, on_done):
+                self.gang_qc_pending += 1
+        if not self.gang_qc_pending:
+            self.stop_bluetooth_qc()
+
+    def on_gang_qc_done(self, result):
+        """Store one board's QC result (Tk thread)"""
+        slot = self.gang.get_slot(result['port']) if result['port'] else None
+        if slot and slot.ble_mac and slot.ble_mac.upper() == result['address'] and result['results']:
+            # Only boards that were actually tested; not found / connect failures are offered again
+            slot.qc_result = result
+        elif result.get('error'):
+            self.log_queue.put(f"⚠️ QC for {result['address']} did not run ({result['error']}) - it can be retried")
+        if result['results']:
+            self.display_test_results(result['results'])
+            if FIREBASE_AVAILABLE:
+                device_info = {'name': result['name'] or 'Unknown', 'address': result['address'],
+                               'port': result['port']}
+                if store_qc_results(device_info, result['results']):
+                    self.log_queue.put(f"💾 QC results for {result['address']} stored in Firebase database")
+                else:
+                    self.log_queue.put(f"⚠️ Failed to store QC results for {result['address']} in Firebase")
+
+        self.gang_qc_pending = max(0, self.gang_qc_pending - 1)
+        if not self.gang_qc_pending:
+            if self.session_log:
+                self.session_log.flush()
+            self.stop_bluetooth_qc()
+            self.bt_qc_button.config(state='normal')
 
     def bt_not_available(self):
         """Show message when Bluetooth is not available"""
@@ -1005,15 +1273,13 @@ class FlasherApp:
         self.test_button.config(state='disabled')
         self.bt_qc_button.config(state='disabled')
 
-        def bt_qc_thread_wrapper():
-            asyncio.run(self.run_bluetooth_qc())
+        def on_qc_done(_future):
             # Re-enable detector worker when done
             self.scanner_stop_event.clear()
-            detector_thread = threading.Thread(target=self.device_detector_worker, daemon=True)
-            detector_thread.start()
+            self.root.after(0, self.start_device_detector)
 
-        bt_thread = threading.Thread(target=bt_qc_thread_wrapper, daemon=True)
-        bt_thread.start()
+        # Runs on the shared BLE loop, next to the background scanner
+        get_ble_service().submit(self.run_bluetooth_qc()).add_done_callback(on_qc_done)
 
     def stop_bluetooth_qc(self):
         """Stop Bluetooth QC testing"""
@@ -1027,13 +1293,12 @@ class FlasherApp:
 
     def start_manual_bt_selection(self):
         """Wrapper to run the async device selection process."""
+        if not BT_QC_AVAILABLE or not BLEAK_AVAILABLE:
+            self.bt_not_available()
+            return
         self.log_queue.put("Starting manual Bluetooth device selection...")
         
-        def selection_thread_wrapper():
-            asyncio.run(self.manual_bt_selection_async())
-
-        selection_thread = threading.Thread(target=selection_thread_wrapper, daemon=True)
-        selection_thread.start()
+        get_ble_service().submit(self.manual_bt_selection_async())
 
     async def manual_bt_selection_async(self):
         """Async function to scan, select, and immediately test a BT device."""
@@ -1076,38 +1341,17 @@ class FlasherApp:
             self.log_queue.put(f"🟦 Starting Bluetooth QC for MAC: {self.captured_mac}...")
             
             self.log_queue.put("⏳ Waiting for device to signal it's ready for connection...")
-            if not self.ble_ready_event.wait(timeout=15):
+            # Waited in a worker thread so the BLE loop (and its scanner) keeps running
+            ready = await asyncio.get_running_loop().run_in_executor(None, self.ble_ready_event.wait, 15)
+            if not ready:
                 self.log_queue.put("❌ Timed out waiting for BLE ready signal from device.")
                 self.root.after(0, self.stop_bluetooth_qc)
                 return
 
-            found_device = None
-            max_retries = 3
-            for attempt in range(max_retries):
-                self.log_queue.put(f"🔎 Attempt {attempt + 1}/{max_retries}: Scanning for device with MAC {self.captured_mac}...")
-                try:
-                    devices = await bleak.BleakScanner.discover(timeout=7.0)
-                    self.log_queue.put(f"   - Found {len(devices)} BLE devices in this scan.")
-                    for i, d in enumerate(devices):
-                        self.log_queue.put(f"     - Device {i}: {d.name or 'Unknown'} ({d.address})")
-                    
-                    for device in devices:
-                        # Compare MAC addresses (case-insensitive)
-                        if device.address.upper() == self.captured_mac.upper():
-                            found_device = device
-                            self.log_queue.put(f"🎯 MAC Address match found: {device.name} at {device.address}")
-                            break
-                    if found_device:
-                        break
-                except Exception as e:
-                    self.log_queue.put(f"   - Error during scan attempt {attempt + 1}: {e}")
-                
-                if not found_device:
-                    self.log_queue.put(f"   - Device not found. Retrying in 2 seconds...")
-                    await asyncio.sleep(2)
-
+            # Returns as soon as the captured MAC (or name) advertises
+            found_device = await bt_qc_tester.find_device(self.captured_mac, self.captured_ble_name)
             if not found_device:
-                self.log_queue.put(f"❌ CRITICAL: Device with MAC '{self.captured_mac}' not found after {max_retries} attempts.")
+                self.log_queue.put(f"❌ CRITICAL: Device with MAC '{self.captured_mac}' not found.")
                 self.root.after(0, self.stop_bluetooth_qc)
                 return
 
@@ -1121,45 +1365,34 @@ class FlasherApp:
             self.log_queue.put("✅ Connected to Bluetooth device. Waiting for services to stabilize...")
             await asyncio.sleep(1.0) # Added delay for stability
 
-            # Run microphone balance test with retry logic
-            test_result = False
-            for i in range(2): # Try up to 2 times
-                test_result = await bt_qc_tester.run_test(0)  # Test index 0: Mic L/R Balance
-                if test_result:
-                    break
-                self.log_queue.put(f"⚠️ Test command failed to send on attempt {i+1}. Retrying after 1s...")
-                await asyncio.sleep(1.0)
+            # Run the QC plan; each step completes as soon as its reply arrives
+            plan = get_test_plan()
+            self.log_queue.put(f"▶️ Running QC plan ({len(plan.steps)} steps): {plan.describe()}")
+            bt_qc_tester.clear_results()
+            results = await QCPlanRunner(bt_qc_tester, plan).run()
 
             # Get MAC address
             mac_address = found_device.address
             self.log_queue.put(f"MAC Address: {mac_address}")
 
-            if test_result:
-                # Wait for results (they come via notifications)
-                await asyncio.sleep(15)  # Wait up to 15 seconds for test results
-
-                # Get final results
-                results = bt_qc_tester.get_test_results()
-                if results:
-                    self.display_test_results(results)
-
-                    # Store results in Firebase if available
-                    if FIREBASE_AVAILABLE:
-                        try:
-                            device_info = {
-                                'name': found_device.name or 'Unknown',
-                                'address': found_device.address
-                            }
-                            if store_qc_results(device_info, results):
-                                self.log_queue.put("💾 QC results stored in Firebase database")
-                            else:
-                                self.log_queue.put("⚠️ Failed to store QC results in Firebase")
-                        except Exception as e:
-                            self.log_queue.put(f"⚠️ Firebase storage error: {e}")
-                else:
-                    self.log_queue.put("⚠️ No test results received")
+            if results:
+                self.display_test_results(results)
+
+                # Store results in Firebase if available
+                if FIREBASE_AVAILABLE:
+                    try:
+                        device_info = {
+                            'name': found_device.name or 'Unknown',
+                            'address': found_device.address
+                        }
+                        if store_qc_results(device_info, results):
+                            self.log_queue.put("💾 QC results stored in Firebase database")
+                        else:
+                            self.log_queue.put("⚠️ Failed to store QC results in Firebase")
+                    except Exception as e:
+                        self.log_queue.put(f"⚠️ Firebase storage error: {e}")
             else:
-                self.log_queue.put("❌ Failed to run Bluetooth test")
+                self.log_queue.put("⚠️ No test results received")
 
             # Disconnect
             await bt_qc_tester.disconnect()
@@ -1167,9 +1400,9 @@ class FlasherApp:
         except Exception as e:
             self.log_queue.put(f"❌ Bluetooth QC error: {e}")
         finally:
-            # Store the session log to Firebase
-            if FIREBASE_AVAILABLE and self.session_logs:
-                store_session_log(self.session_logs)
+            # Push the QC part of the session log to Firebase
+            if self.session_log:
+                self.session_log.flush()
             
             self.root.after(0, self.stop_bluetooth_qc)
 
@@ -1365,7 +1598,8 @@ class FlasherApp:
 
             if 'evaluation_data' in result:
                 eval_data = result['evaluation_data']
-                if 'rms_L' in eval_data and 'rms_R' in eval_data:
+                if (isinstance(eval_data.get('rms_L'), (int, float)) and
+                        isinstance(eval_data.get('rms_R'), (int, float))):
                     balance = eval_data['rms_L'] / max(eval_data['rms_R'], 0.001)
                     if balance > 0.9 and balance < 1.1:
                         balance_status = "Balanced 🎵"
@@ -1400,11 +1634,15 @@ class FlasherApp:
         # Config Frame
         self.config_frame.config(text=f" ⚙️ {_('Configuration')} ")
         self.update_button.config(text=_("🔄 Check Updates"))
+        self.calibrate_button.config(text=_("🎚️ Calibrate Baud"))
         
         # Control Area
+        self.slots_frame.config(text=f" 🔌 {_('Connected Boards')} ")
+        self.slots_placeholder.config(text=_("No boards connected"))
         self.flash_frame.config(text=f" ⚡ {_('Firmware Flashing')} ")
         self.prod_button.config(text=_("🏭 Flash Production"))
         self.test_button.config(text=_("🧪 Flash Testing & eFuse"))
+        self.smart_flash_check.config(text=_("♻️ Smart re-flash (skip unchanged regions)"))
         
         self.qc_frame.config(text=f" 🔵 {_('Bluetooth Quality Control (QC)')} ")
         self.bt_select_button.config(text=_("📡 Scan & Test Device"))
@@ -1475,64 +1713,199 @@ class VersionDialog:
         self.top.destroy()
 
 class LogViewer(tk.Frame):
+    """Virtualized log view: a bounded ring of entries drawn on one canvas.
+
+    Only the rows that fit in the window exist as canvas items; scrolling and
+    new entries just re-point those items at different entries, so frame time
+    and memory do not grow with the length of the shift.
+    """
+
+    # Level filter choices: label -> levels shown (None = everything)
+    LEVEL_FILTERS = {
+        "All": None,
+        "Errors": {'error'},
+        "Warnings & Errors": {'warning', 'error'},
+        "Success": {'success'},
+    }
+
     def __init__(self, parent, colors, icons, *args, **kwargs):
         super().__init__(parent, bg=colors['log_bg'], *args, **kwargs)
         self.colors = colors
         self.icons = icons
+        self.icon_levels = {id(icon): level for level, icon in icons.items() if icon is not None}
+
+        self.entries = deque(maxlen=MAX_LOG_ENTRIES)   # [level, text, icon]
+        self.filtered = None                           # Matching entries while a filter is set
+        self.filter_levels = None
+        self.filter_text = ""
+        self.top = 0                                   # Index of the first visible row
+        self.follow = True                             # Stick to the newest entry
+        self.render_pending = False
+        self.row_items = []                            # (icon item, text item) per visible row
+
+        self.font = tkfont.Font(family="Consolas", size=10)
+        self.row_height = self.font.metrics('linespace') + 4
+
+        # Filter bar
+        filter_bar = tk.Frame(self, bg=colors['log_bg'])
+        filter_bar.pack(side="top", fill="x")
+        self.level_var = tk.StringVar(value="All")
+        level_menu = ttk.Combobox(filter_bar, textvariable=self.level_var, state='readonly', width=18,
+                                  values=list(self.LEVEL_FILTERS))
+        level_menu.pack(side="left", padx=5, pady=2)
+        level_menu.bind("<<ComboboxSelected>>", lambda e: self._apply_filter())
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(filter_bar, textvariable=self.search_var, font=("Consolas", 10),
+                                bg=colors['frame_bg'], fg=colors['log_text'], insertbackground=colors['log_text'])
+        search_entry.pack(side="left", fill="x", expand=True, padx=5, pady=2)
+        self.search_var.trace_add('write', lambda *args: self._apply_filter())
 
         self.canvas = tk.Canvas(self, bg=colors['log_bg'], highlightthickness=0)
-        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.log_frame = tk.Frame(self.canvas, bg=colors['log_bg'])
-
-        self.log_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas.create_window((0, 0), window=self.log_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
-        
-        self.log_frame.bind('<Enter>', self._bind_mouse)
-        self.log_frame.bind('<Leave>', self._unbind_mouse)
+
+        self.canvas.bind("<Configure>", lambda e: self._schedule_render())
+        self.canvas.bind('<Enter>', self._bind_mouse)
+        self.canvas.bind('<Leave>', self._unbind_mouse)
 
     def _bind_mouse(self, event=None):
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind_all("<Button-4>", lambda e: self._scroll_rows(-3))
+        self.canvas.bind_all("<Button-5>", lambda e: self._scroll_rows(3))
 
     def _unbind_mouse(self, event=None):
         self.canvas.unbind_all("<MouseWheel>")
+        self.canvas.unbind_all("<Button-4>")
+        self.canvas.unbind_all("<Button-5>")
 
     def _on_mousewheel(self, event):
-        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-
-    def add_log_entry(self, message, icon):
-        entry_frame = tk.Frame(self.log_frame, bg=self.colors['log_bg'])
-        entry_frame.pack(fill="x", pady=2)
-
-        icon_label = tk.Label(entry_frame, image=icon, bg=self.colors['log_bg'])
-        icon_label.pack(side="left", padx=(5, 10))
-
-        text_label = tk.Label(entry_frame, text=message.strip(), font=("Consolas", 10),
-                              bg=self.colors['log_bg'], fg=self.colors['log_text'],
-                              wraplength=self.winfo_width() - 50, justify="left")
-        text_label.pack(side="left", anchor="w")
-        
-        # Auto-scroll to the bottom
-        self.canvas.update_idletasks()
-        self.canvas.yview_moveto(1.0)
-        self.last_entry = entry_frame
+        self._scroll_rows(int(-3 * (event.delta / 120)))
+
+    # --- Public API ---
+    def add_log_entry(self, message, icon, level=None):
+        level = level or self.icon_levels.get(id(icon), 'info')
+        # Rows have a fixed height, so a multi-line message becomes one entry per
+        # line; only the first line carries the icon
+        for number, line in enumerate(message.strip().splitlines() or [""]):
+            entry = [level, line.rstrip(), icon if number == 0 else None]
+            if not self.follow and len(self.entries) == self.entries.maxlen:
+                self.top = max(0, self.top - 1)  # Oldest entry is about to drop off
+            self.entries.append(entry)
+            if self.filtered is not None and self._matches(entry):
+                self.filtered.append(entry)
+        self._schedule_render()
 
     def update_last_line(self, message):
         """Overwrites the last log entry, used for progress updates."""
-        if hasattr(self, 'last_entry') and self.last_entry.winfo_exists():
-            # Find the text label in the last entry and update it
-            for widget in self.last_entry.winfo_children():
-                if isinstance(widget, tk.Label) and not widget.cget("image"):
-                    widget.config(text=message.strip())
-                    return
-        
-        # If no last line or it was destroyed, just add a new line
+        if self.entries:
+            entry = self.entries[-1]
+            entry[1] = " ".join(message.strip().splitlines())  # Keep it to one row
+            if self.filtered is not None and not self._matches(entry):
+                if self.filtered and self.filtered[-1] is entry:
+                    self.filtered.pop()
+            self._schedule_render()
+            return
+
+        # If there is no last line yet, just add a new line
         self.add_log_entry(message, self.icons['flash'])
 
+    def clear(self):
+        self.entries.clear()
+        if self.filtered is not None:
+            self.filtered.clear()
+        self.top = 0
+        self.follow = True
+        self._schedule_render()
+
+    # --- Filtering ---
+    def _matches(self, entry) -> bool:
+        if self.filter_levels is not None and entry[0] not in self.filter_levels:
+            return False
+        return not self.filter_text or self.filter_text in entry[1].lower()
+
+    def _apply_filter(self):
+        self.filter_levels = self.LEVEL_FILTERS.get(self.level_var.get())
+        self.filter_text = self.search_var.get().strip().lower()
+        if self.filter_levels is None and not self.filter_text:
+            self.filtered = None
+        else:
+            self.filtered = deque((e for e in self.entries if self._matches(e)), maxlen=MAX_LOG_ENTRIES)
+        self.follow = True
+        self._schedule_render()
+
+    def _visible_entries(self):
+        return self.entries if self.filtered is None else self.filtered
+
+    # --- Scrolling ---
+    def _visible_rows(self) -> int:
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _scroll_rows(self, delta):
+        self._scroll_to(self.top + delta)
+
+    def _scroll_to(self, top):
+        total = len(self._visible_entries())
+        max_top = max(0, total - self._visible_rows())
+        self.top = min(max(0, int(top)), max_top)
+        self.follow = self.top >= max_top
+        self._schedule_render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * len(self._visible_entries()))
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else 1
+            self._scroll_rows(int(amount) * step)
+
+    # --- Rendering ---
+    def _schedule_render(self):
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self.render_pending = False
+        entries = self._visible_entries()
+        rows = self._visible_rows()
+        total = len(entries)
+        if self.follow:
+            self.top = max(0, total - rows)
+        self.top = min(self.top, max(0, total - rows))
+
+        # Grow the row item pool to fit the window; extra items are just blanked
+        while len(self.row_items) < rows:
+            y = len(self.row_items) * self.row_height + 2
+            icon_item = self.canvas.create_image(5, y, anchor="nw")
+            text_item = self.canvas.create_text(30, y, anchor="nw", font=self.font,
+                                                fill=self.colors['log_text'])
+            self.row_items.append((icon_item, text_item))
+
+        for row, (icon_item, text_item) in enumerate(self.row_items):
+            index = self.top + row
+            if row < rows and index < total:
+                _level, text, icon = entries[index]
+                self.canvas.itemconfigure(icon_item, image=icon or "")
+                self.canvas.itemconfigure(text_item, text=text[:MAX_LOG_LINE_CHARS])
+            else:
+                self.canvas.itemconfigure(icon_item, image="")
+                self.canvas.itemconfigure(text_item, text="")
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = FlasherApp(root)
     root.mainloop()
+    app.log_writer.close()
+    app.record_writer.close()
+    if BT_QC_AVAILABLE:
+        get_ble_service().stop()
+    if app.session_log:
+        app.session_log.close()
+    if FIREBASE_AVAILABLE:
+        # Commit queued results and logs; anything left is uploaded on the next start
+        flush_firebase_writes(timeout=10)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Local Firestore Module
+SQLite stand-in for the subset of the Firestore client API used by the flasher tools
+"""
+
+import copy
+import json
+import uuid
+import sqlite3
+import threading
+import functools
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from firebase_outbox import encode_document, decode_document, SERVER_TIMESTAMP
+
+# --- Configuration ---
+LOCAL_DB_FILE = "local_firestore.db"
+ASCENDING = "ASCENDING"      # Same values as google.cloud.firestore.Query
+DESCENDING = "DESCENDING"
+
+_INEQUALITY_OPS = ('<', '<=', '>', '>=', '!=')
+_MISSING = object()
+
+
+def _split_path(path: str) -> List[str]:
+    return [part for part in path.strip('/').split('/') if part]
+
+def _field(data: Dict[str, Any], field_path: str):
+    """Value at a dotted field path, or _MISSING"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _resolve_server_timestamps(value, now: datetime):
+    if isinstance(value, dict):
+        return {key: _resolve_server_timestamps(item, now) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_server_timestamps(item, now) for item in value]
+    if value is SERVER_TIMESTAMP:
+        return now
+    return value
+
+def _compare_values(a, b) -> int:
+    if a == b:
+        return 0
+    try:
+        return -1 if a < b else 1
+    except TypeError:
+        # Different types: order by type name, like Firestore orders by type first
+        return -1 if type(a).__name__ < type(b).__name__ else 1
+
+def _matches(value, op: str, expected) -> bool:
+    if value is _MISSING:
+        return False
+    try:
+        if op == '==':
+            return value == expected
+        if op == '!=':
+            return value != expected
+        if op == '<':
+            return value < expected
+        if op == '<=':
+            return value <= expected
+        if op == '>':
+            return value > expected
+        if op == '>=':
+            return value >= expected
+        if op == 'in':
+            return value in expected
+        if op == 'not-in':
+            return value not in expected
+        if op == 'array_contains':
+            return isinstance(value, list) and expected in value
+        if op == 'array_contains_any':
+            return isinstance(value, list) and any(item in value for item in expected)
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported query operator: {op}")
+
+
+class DocumentSnapshot:
+    """Result of a document read; mirrors firestore.DocumentSnapshot"""
+
+    def __init__(self, reference: 'DocumentReference', data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        value = _field(self._data or {}, field_path)
+        return None if value is _MISSING else value
+
+
+class DocumentReference:
+    def __init__(self, client: 'LocalFirestore', path: str):
+        self._client = client
+        self.path = "/".join(_split_path(path))
+        self.id = self.path.rsplit('/', 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, name: str) -> 'CollectionReference':
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self) -> DocumentSnapshot:
+        return DocumentSnapshot(self, self._client._read(self.path))
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        batch = self._client.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def update(self, data: Dict[str, Any]):
+        if self._client._read(self.path) is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self.set(data, merge=True)
+
+    def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        batch.commit()
+
+
+class Query:
+    """Immutable query over the documents directly inside one collection"""
+
+    def __init__(self, client: 'LocalFirestore', parent: str, filters=(), orders=(),
+                 limit: int = None, cursor: 'DocumentSnapshot' = None):
+        self._client = client
+        self._parent = parent
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> 'Query':
+        values = dict(filters=self._filters, orders=self._orders, limit=self._limit, cursor=self._cursor)
+        values.update(changes)
+        return Query(self._client, self._parent, **values)
+
+    def where(self, field_path: str, op_string: str, value) -> 'Query':
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> 'Query':
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> 'Query':
+        return self._copy(limit=count)
+
+    def start_after(self, document: DocumentSnapshot) -> 'Query':
+        return self._copy(cursor=document)
+
+    def select(self, field_paths) -> 'Query':
+        return self
+
+    def _effective_orders(self):
+        # Like Firestore: an inequality field is ordered first, the document id last
+        orders = list(self._orders)
+        for field_path, op, _value in self._filters:
+            if op in _INEQUALITY_OPS and not any(field == field_path for field, _dir in orders):
+                orders.insert(0, (field_path, ASCENDING))
+        return orders
+
+    def _compare(self, orders, a: DocumentSnapshot, b: DocumentSnapshot) -> int:
+        for field_path, direction in orders:
+            result = _compare_values(_field(a._data, field_path), _field(b._data, field_path))
+            if result:
+                return -result if direction == DESCENDING else result
+        return _compare_values(a.id, b.id)
+
+    def stream(self) -> Iterator[DocumentSnapshot]:
+        orders = self._effective_orders()
+        docs = [DocumentSnapshot(DocumentReference(self._client, path), data)
+                for path, data in self._client._children(self._parent)]
+        docs = [doc for doc in docs
+                if all(_matches(_field(doc._data, field), op, value) for field, op, value in self._filters)
+                and all(_field(doc._data, field) is not _MISSING for field, _dir in orders)]
+        compare = functools.partial(self._compare, orders)
+        docs.sort(key=functools.cmp_to_key(compare))
+        if self._cursor is not None:
+            docs = [doc for doc in docs if compare(doc, self._cursor) > 0]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter(docs)
+
+    def get(self) -> List[DocumentSnapshot]:
+        return list(self.stream())
+
+    def count(self) -> '_CountQuery':
+        return _CountQuery(self)
+
+
+class _AggregationResult:
+    def __init__(self, value: int):
+        self.alias = "count"
+        self.value = value
+
+class _CountQuery:
+    def __init__(self, query: Query):
+        self._query = query
+
+    def get(self):
+        return [[_AggregationResult(sum(1 for _doc in self._query.stream()))]]
+
+
+class CollectionReference(Query):
+    def __init__(self, client: 'LocalFirestore', path: str):
+        path = "/".join(_split_path(path))
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id: str = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self._parent}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+
+class WriteBatch:
+    """Writes applied atomically in one SQLite transaction on commit()"""
+
+    def __init__(self, client: 'LocalFirestore'):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference: DocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(('set', reference, data, merge))
+        return self
+
+    def delete(self, reference: DocumentReference):
+        self._writes.append(('delete', reference, None, False))
+        return self
+
+    def commit(self):
+        self._client._apply(self._writes)
+        self._writes = []
+
+
+class LocalFirestore:
+    """Firestore-compatible client storing documents in a local SQLite file.
+
+    Supports the calls the flasher uses: collection()/document() paths
+    (including subcollections), set/get/update/delete, where/order_by/limit/
+    start_after queries, count() and batch(). SERVER_TIMESTAMP is replaced
+    with the local time when a document is written. Queries filter and sort
+    in Python, which is fine for one station's data and for benchmarks.
+    """
+
+    def __init__(self, path: str = LOCAL_DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY,
+                parent TEXT NOT NULL,
+                data TEXT NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_parent ON documents (parent)")
+
+    def collection(self, path: str) -> CollectionReference:
+        if len(_split_path(path)) % 2 != 1:
+            raise ValueError(f"Not a collection path: {path}")
+        return CollectionReference(self, path)
+
+    def document(self, path: str) -> DocumentReference:
+        if len(_split_path(path)) % 2 != 0:
+            raise ValueError(f"Not a document path: {path}")
+        return DocumentReference(self, path)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- Storage ---
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM documents WHERE path = ?", (path,)).fetchone()
+        return decode_document(json.loads(row[0])) if row else None
+
+    def _children(self, parent: str):
+        with self.lock:
+            rows = self.conn.execute("SELECT path, data FROM documents WHERE parent = ?", (parent,)).fetchall()
+        return [(path, decode_document(json.loads(data))) for path, data in rows]
+
+    def _apply(self, writes):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for kind, reference, data, merge in writes:
+                    if kind == 'delete':
+                        self.conn.execute("DELETE FROM documents WHERE path = ?", (reference.path,))
+                        continue
+                    data = _resolve_server_timestamps(data, now)
+                    if merge:
+                        row = self.conn.execute("SELECT data FROM documents WHERE path = ?",
+                                                (reference.path,)).fetchone()
+                        if row:
+                            data = {**decode_document(json.loads(row[0])), **data}
+                    parent = reference.path.rsplit('/', 1)[0]
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO documents (path, parent, data) VALUES (?, ?, ?)",
+                        (reference.path, parent, json.dumps(encode_document(data), ensure_ascii=False)))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
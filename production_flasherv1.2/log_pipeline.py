@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Log Pipeline Module
+Turns every log_queue message into a LogRecord at the producer and writes the session logs
+"""
+
+import time
+import queue
+import threading
+
+from log_record import (LogRecord, SUBSYSTEM_APP, SUBSYSTEM_BLE, SUBSYSTEM_FIREBASE,
+                        LEVEL_INFO, LEVEL_SUCCESS, LEVEL_WARNING, LEVEL_ERROR, LEVEL_PROGRESS,
+                        LEVEL_BLUETOOTH, LEVEL_FIREBASE, LEVEL_FLASH)
+
+# --- Configuration ---
+FILE_FLUSH_INTERVAL = 1.0    # Seconds between session log flushes
+FILE_BUFFER_SIZE = 64 * 1024
+
+TAB_USB = "USB/Serial"
+TAB_BLUETOOTH = "Bluetooth"
+TAB_FIREBASE = "Firebase"
+TABS = (TAB_USB, TAB_BLUETOOTH, TAB_FIREBASE)
+
+_TAB_SUBSYSTEMS = {TAB_BLUETOOTH: SUBSYSTEM_BLE, TAB_FIREBASE: SUBSYSTEM_FIREBASE}
+_SUBSYSTEM_TABS = {SUBSYSTEM_BLE: TAB_BLUETOOTH, SUBSYSTEM_FIREBASE: TAB_FIREBASE}
+
+
+def tab_for(record: LogRecord) -> str:
+    """GUI tab a record is shown in"""
+    return _SUBSYSTEM_TABS.get(record.subsystem, TAB_USB)
+
+
+def classify(message, tab: str = None, port: str = None) -> LogRecord:
+    """Turn a legacy text message into a LogRecord by sniffing its text.
+
+    Only used for producers that still put plain strings (esptool output
+    lines, older modules); emitters create records with explicit fields.
+    """
+    text = str(message)
+    if tab is None:
+        tab = TAB_USB
+        if "[BLE" in text or "Bluetooth" in text:
+            tab = TAB_BLUETOOTH
+        elif "Firebase" in text:
+            tab = TAB_FIREBASE
+
+    if "Flashing..." in text and "%" in text:
+        level = LEVEL_PROGRESS
+    elif "[OK]" in text or "✅" in text or "[SUCCESS]" in text:
+        level = LEVEL_SUCCESS
+    elif "[X]" in text or "❌" in text or "[ERROR]" in text or "[FAILED]" in text:
+        level = LEVEL_ERROR
+    elif "[!]" in text or "⚠️" in text or "[WARNING]" in text:
+        level = LEVEL_WARNING
+    elif "Bluetooth" in text or "BLE" in text:
+        level = LEVEL_BLUETOOTH
+    elif "Firebase" in text:
+        level = LEVEL_FIREBASE
+    elif "Flash" in text or "esptool" in text:
+        level = LEVEL_FLASH
+    else:
+        level = LEVEL_INFO
+    return LogRecord(text, level, _TAB_SUBSYSTEMS.get(tab, SUBSYSTEM_APP), port)
+
+
+class LogQueue(queue.Queue):
+    """log_queue that only ever yields LogRecords and control tuples.
+
+    Records from LogEmitters pass straight through. Legacy producers may
+    still put plain strings, (tab, message) pairs or the BLE tester's dicts;
+    those are classified here, in the producing thread, so the Tk thread
+    never has to sniff message text. Gang ('port', port, message) tuples
+    are unwrapped into records carrying the port. Control tuples such as
+    ('progress', n) pass through unchanged.
+    """
+
+    def put(self, item, block=True, timeout=None):
+        super().put(self._to_record(item), block, timeout)
+
+    @staticmethod
+    def _to_record(item, port: str = None):
+        if isinstance(item, LogRecord):
+            if port and not item.port:
+                item.port = port
+            return item
+        if isinstance(item, tuple):
+            if len(item) == 3 and item[0] == 'port':
+                inner = LogQueue._to_record(item[2], item[1])
+                return inner if isinstance(inner, LogRecord) else ('port', item[1], inner)
+            if len(item) == 2 and item[0] in TABS:
+                return classify(item[1], tab=item[0], port=port)
+            return item
+        if isinstance(item, dict) and 'message' in item:
+            return LogRecord(str(item['message']), item.get('level', LEVEL_INFO), SUBSYSTEM_BLE, port,
+                             fields={'data': item['data']} if item.get('data') is not None else None,
+                             timestamp=item.get('timestamp'))
+        return classify(item, port=port)
+
+
+class BufferedLogFile:
+    """Session log file kept open with a write buffer, flushed at most every flush_interval"""
+
+    def __init__(self, path: str, flush_interval: float = FILE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        self.file = open(path, "a", encoding="utf-8", buffering=FILE_BUFFER_SIZE)
+
+    def write(self, text: str):
+        with self.lock:
+            if self.file is not None:
+                self.file.write(text)
+
+    def maybe_flush(self):
+        """Flush if the interval passed (call once per GUI tick)"""
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.time()
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
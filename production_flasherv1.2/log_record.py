@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Log Record Module
+Structured log records, the shared emitter API and JSONL/Firebase serializers
+"""
+
+import json
+import time
+import heapq
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# --- Configuration ---
+SUBSYSTEM_APP = 'app'
+SUBSYSTEM_DOWNLOAD = 'download'
+SUBSYSTEM_EFUSE = 'efuse'
+SUBSYSTEM_FLASH = 'flash'
+SUBSYSTEM_SERIAL = 'serial'
+SUBSYSTEM_BLE = 'ble'
+SUBSYSTEM_FIREBASE = 'firebase'
+
+# Levels double as the GUI icon names
+LEVEL_INFO = 'info'
+LEVEL_SUCCESS = 'success'
+LEVEL_WARNING = 'warning'
+LEVEL_ERROR = 'error'
+LEVEL_PROGRESS = 'progress'    # Single-line progress update, replaces the previous line
+LEVEL_BLUETOOTH = 'bt'         # Only produced when classifying legacy text messages
+LEVEL_FIREBASE = 'firebase'
+LEVEL_FLASH = 'flash'
+
+
+class LogRecord:
+    """One log message with its source, level and optional structured fields"""
+
+    __slots__ = ('timestamp', 'port', 'device', 'subsystem', 'level', 'message', 'fields')
+
+    def __init__(self, message: str, level: str = LEVEL_INFO, subsystem: str = SUBSYSTEM_APP,
+                 port: str = None, device: str = None, fields: Dict[str, Any] = None,
+                 timestamp: float = None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.port = port            # Serial port the board is on
+        self.device = device        # Board identity once known (BLE MAC, serial number)
+        self.subsystem = subsystem
+        self.level = level
+        self.message = message
+        self.fields = fields
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"LogRecord({self.level}, {self.subsystem}, {self.port}, {self.message!r})"
+
+    def file_text(self) -> str:
+        """One line for the plain text session log"""
+        text = self.message.strip()
+        return f"[{self.port}] {text}" if self.port else text
+
+    # --- Serializers ---
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'ts': round(self.timestamp, 6), 'level': self.level,
+                'subsystem': self.subsystem, 'message': self.message}
+        if self.port:
+            data['port'] = self.port
+        if self.device:
+            data['device'] = self.device
+        if self.fields:
+            data['fields'] = self.fields
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+    def to_firestore(self) -> Dict[str, Any]:
+        """Firestore document fields (timestamp as a UTC datetime)"""
+        data = self.to_dict()
+        data['timestamp'] = datetime.fromtimestamp(data.pop('ts'), timezone.utc)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LogRecord':
+        timestamp = data.get('ts', data.get('timestamp'))
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        return cls(data.get('message', ''), data.get('level', LEVEL_INFO),
+                   data.get('subsystem', SUBSYSTEM_APP), data.get('port'), data.get('device'),
+                   data.get('fields'), timestamp)
+
+
+class LogEmitter:
+    """Emits LogRecords for one subsystem (and port/device) into a sink.
+
+    The sink is anything with put() (log_queue, a gang PortLogQueue) or a
+    plain callable. Emitters can be passed where a log(str) callback is
+    expected; such calls are logged at info level.
+    """
+
+    __slots__ = ('sink', 'subsystem', 'port', 'device')
+
+    def __init__(self, sink, subsystem: str = SUBSYSTEM_APP, port: str = None, device: str = None):
+        self.sink = sink
+        self.subsystem = subsystem
+        self.port = port
+        self.device = device
+
+    def bind(self, subsystem: str = None, port: str = None, device: str = None) -> 'LogEmitter':
+        """Emitter for the same sink with some attributes replaced"""
+        return LogEmitter(self.sink, subsystem or self.subsystem, port or self.port, device or self.device)
+
+    def emit(self, level: str, message: str, **fields) -> Optional[LogRecord]:
+        if self.sink is None:
+            return None
+        record = LogRecord(str(message), level, self.subsystem, self.port, self.device, fields or None)
+        put = getattr(self.sink, 'put', self.sink)
+        put(record)
+        return record
+
+    def info(self, message: str, **fields):
+        return self.emit(LEVEL_INFO, message, **fields)
+
+    def success(self, message: str, **fields):
+        return self.emit(LEVEL_SUCCESS, message, **fields)
+
+    def warning(self, message: str, **fields):
+        return self.emit(LEVEL_WARNING, message, **fields)
+
+    def error(self, message: str, **fields):
+        return self.emit(LEVEL_ERROR, message, **fields)
+
+    def progress(self, message: str, percent: float = None, **fields):
+        if percent is not None:
+            fields['percent'] = percent
+        return self.emit(LEVEL_PROGRESS, message, **fields)
+
+    def put(self, item):
+        """Queue-style entry point: control tuples go to the sink unchanged"""
+        if isinstance(item, (tuple, LogRecord)):
+            put = getattr(self.sink, 'put', self.sink)
+            put(item)
+        else:
+            self.info(item)
+
+    __call__ = put
+
+
+def write_jsonl(records: Iterable[LogRecord], file) -> int:
+    """Append records to an open text file, one JSON object per line. Returns the count."""
+    count = 0
+    for record in records:
+        file.write(record.to_json() + "\n")
+        count += 1
+    return count
+
+def read_jsonl(path: str) -> Iterator[LogRecord]:
+    """Records from a JSONL log file, skipping damaged lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield LogRecord.from_dict(json.loads(line))
+            except (ValueError, TypeError):
+                continue
+
+def merge_records(*streams: Iterable[LogRecord]) -> Iterator[LogRecord]:
+    """Merge time-ordered record streams (e.g. from several stations) by timestamp"""
+    return heapq.merge(*streams, key=lambda record: record.timestamp)
@@ -14,10 +14,24 @@ import serial
 import tempfile
 import psutil
 
+# Per-port calibrated flash baud (optional, not bundled in older builds)
+try:
+    from baud_profile import get_baud_profile, is_link_error
+    BAUD_PROFILE_AVAILABLE = True
+except ImportError:
+    BAUD_PROFILE_AVAILABLE = False
+
+# Blocking serial reader with hotplug disconnect detection (optional, as above)
+try:
+    from serial_reader import SerialLineReader, SerialDisconnected
+    SERIAL_READER_AVAILABLE = True
+except ImportError:
+    SERIAL_READER_AVAILABLE = False
+
 # --- Configuration ---
 TARGET_HW_VERSION = "1.9.0"
 FIRMWARE_DIR_NAME = "testing_firmware"
-FLASH_BAUD = "460800"
+FLASH_BAUD = "460800"  # Default until the port is calibrated (see baud_profile.py)
 MONITOR_BAUD = 115200
 LOCK_FILE_NAME = "dino_partner_flasher.lock"
 
@@ -114,22 +128,38 @@ def flash_testing_firmware(log_queue, port, hardware_version):
         play_sound(ERROR_FREQ, ERROR_DUR)
         log_queue.put(('hide_progress',))
         return False
-    flash_cmd = [sys.executable, "-m", "esptool", "--chip", "esp32s3", "-p", port, "-b", FLASH_BAUD, "--before=default_reset", "--after=hard_reset", "write_flash", "--flash_mode", "dio", "--flash_freq", "80m", "--flash_size", "16MB", "0x0", bootloader, "0x260000", app, "0x10000", p_table, "0x15000", ota_data]
-    try:
+    baud = get_baud_profile().get_baud(port) if BAUD_PROFILE_AVAILABLE else int(FLASH_BAUD)
+
+    def run_flash(baud):
+        flash_cmd = [sys.executable, "-m", "esptool", "--chip", "esp32s3", "-p", port, "-b", str(baud), "--before=default_reset", "--after=hard_reset", "write_flash", "--flash_mode", "dio", "--flash_freq", "80m", "--flash_size", "16MB", "0x0", bootloader, "0x260000", app, "0x10000", p_table, "0x15000", ota_data]
         process = subprocess.Popen(flash_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        output = []
         for line in iter(process.stdout.readline, ''):
             log_queue.put(line)
+            output.append(line)
             match = re.search(r"([\d\.]+)\%", line)
             if match:
                 progress = int(float(match.group(1)))
                 log_queue.put(('progress', progress))
         process.stdout.close()
-        return_code = process.wait()
+        return process.wait(), "".join(output)
+
+    try:
+        return_code, output = run_flash(baud)
+        if return_code != 0 and BAUD_PROFILE_AVAILABLE and is_link_error(output):
+            # Fall back one baud step for this port and retry once
+            lower_baud = get_baud_profile().record_failure(port, baud)
+            if lower_baud:
+                log_queue.put(f"[!] Flash failed at {baud} baud, retrying at {lower_baud} baud...")
+                baud = lower_baud
+                return_code, output = run_flash(baud)
         if return_code != 0:
             log_queue.put(f"\n[X] Flash failed with exit code {return_code}.")
             play_sound(ERROR_FREQ, ERROR_DUR)
             return False
         else:
+            if BAUD_PROFILE_AVAILABLE:
+                get_baud_profile().record_success(port, baud)
             log_queue.put("\n[OK] Flash successful!")
             play_sound(END_FREQ, END_DUR)
             return True
@@ -145,6 +175,19 @@ def serial_monitor_thread(log_queue, port, stop_event):
     try:
         ser = serial.Serial(port, MONITOR_BAUD, timeout=1)
         log_queue.put(f"--- Serial monitor started for {port} ---\n")
+        if SERIAL_READER_AVAILABLE:
+            reader = SerialLineReader(ser, port)
+            while not stop_event.is_set():
+                try:
+                    lines = reader.read_lines()
+                except SerialDisconnected:
+                    log_queue.put(f"\n--- Device {port} disconnected. Closing monitor. ---\n")
+                    break
+                for line in lines:
+                    log_queue.put(line + "\n")
+            reader.close()
+            log_queue.put(f"--- Serial monitor for {port} stopped. ---\n")
+            return
         while not stop_event.is_set():
             try:
                 if ser.in_waiting > 0:
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - QC Test Plan Module
+Declarative Bluetooth QC steps loaded from qc_test_plan.json and run back-to-back
+"""
+
+import copy
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from i18n_utils import _
+from bluetooth_qc import TEXT_KIND, is_text_verdict
+
+# --- Configuration ---
+QC_PLAN_FILE = "qc_test_plan.json"
+DEFAULT_STEP_TIMEOUT_MS = 10000
+DEFAULT_MAX_IN_FLIGHT = 1      # Commands outstanding at once per device (firmware handles one at a time)
+RETRY_ON_DEFAULT = ['send', 'timeout']
+
+# Built-in plan, used when qc_test_plan.json is missing or invalid
+DEFAULT_PLAN = {
+    'max_in_flight': DEFAULT_MAX_IN_FLIGHT,
+    'steps': [
+        {
+            'id': 'mic_lr',
+            'name': "Test Mic L/R Balance",
+            'description': "Test microphone left/right balance",
+            'command': 'qa_mic_lr_test',
+            'payload': {'wait_ms': 2000, 'tone_ms': 2000, 'volume_percent': 95, 'freq_hz': 1000},
+            'response_kind': 'mic_lr_test',
+            'timeout_ms': 10000,
+            'retries': 1,
+            'complete_when': [{'field': 'payload.tone', 'op': 'exists'}],
+            'criteria': [
+                {'field': 'payload.tone.rms_L', 'op': '>', 'value': 4500, 'label': 'rms_L'},
+                {'field': 'payload.tone.rms_R', 'op': '>', 'value': 4500, 'label': 'rms_R'}
+            ]
+        }
+    ]
+}
+
+_MISSING = object()
+
+
+def _field(data: Any, field_path: str):
+    """Value at a dotted field path of a response, or _MISSING"""
+    value = data
+    for part in field_path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+def _check(actual, op: str, expected) -> bool:
+    if actual is _MISSING:
+        return op == 'missing'
+    try:
+        if op == 'exists':
+            return True
+        if op == '==':
+            return actual == expected
+        if op == '!=':
+            return actual != expected
+        if op == '>':
+            return actual > expected
+        if op == '>=':
+            return actual >= expected
+        if op == '<':
+            return actual < expected
+        if op == '<=':
+            return actual <= expected
+        if op == 'between':
+            return expected[0] <= actual <= expected[1]
+        if op == 'in':
+            return actual in expected
+        if op == 'contains':
+            return expected in actual
+    except (TypeError, IndexError):
+        return False
+    return False
+
+CRITERIA_OPS = ('==', '!=', '>', '>=', '<', '<=', 'between', 'in', 'contains', 'exists', 'missing')
+
+def _format_value(value) -> str:
+    if value is _MISSING:
+        return _("missing")
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+class QCStep:
+    """One QA command of a plan with its pass criteria and retry policy"""
+
+    def __init__(self, data: Dict[str, Any]):
+        if not isinstance(data, dict):
+            raise ValueError("QC step must be an object")
+        self.command = data.get('command')
+        if not self.command or not isinstance(self.command, str):
+            raise ValueError(f"QC step without command: {data}")
+        self.id = str(data.get('id') or self.command)
+        self.name = data.get('name') or self.id
+        self.description = data.get('description', '')
+        self.payload = data.get('payload') or {}
+        self.response_kind = data.get('response_kind')          # Fallback match when the reply carries no id
+        self.timeout_ms = int(data.get('timeout_ms', DEFAULT_STEP_TIMEOUT_MS))
+        self.retries = max(0, int(data.get('retries', 0)))
+        self.retry_on = list(data.get('retry_on', RETRY_ON_DEFAULT))   # send, timeout, fail
+        self.retry_delay_ms = max(0, int(data.get('retry_delay_ms', 0)))
+        self.depends_on = [str(d) for d in data.get('depends_on', [])]
+        self.criteria = list(data.get('criteria', []))
+        self.complete_when = list(data.get('complete_when', []))   # Conditions marking the final reply
+        for criterion in self.criteria + self.complete_when:
+            if criterion.get('op') not in CRITERIA_OPS or (not criterion.get('field')):
+                raise ValueError(f"Invalid criterion in step '{self.id}': {criterion}")
+
+    def is_final(self, response: Dict[str, Any]) -> bool:
+        """Whether a reply completes the step; acks and progress messages do not.
+
+        Uses complete_when when given, otherwise a reply is final once it
+        carries at least one field the criteria look at.
+        """
+        if self.complete_when:
+            return all(_check(_field(response, c['field']), c['op'], c.get('value')) for c in self.complete_when)
+        if not self.criteria:
+            return True
+        return any(_field(response, c['field']) is not _MISSING for c in self.criteria)
+
+    def evaluate(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the pass criteria to a response"""
+        if response.get('kind') == TEXT_KIND and self.response_kind != TEXT_KIND:
+            # Legacy firmware: a plain text PASS/FAIL verdict instead of the structured reply
+            text = response.get('text', '')
+            passed = is_text_verdict(text) and 'FAIL' not in text
+            return {
+                'passed': passed,
+                'checks': [{'label': 'result', 'op': 'contains', 'expected': 'PASS', 'actual': text,
+                            'passed': passed, 'display': text}]
+            }
+
+        checks = []
+        for criterion in self.criteria:
+            actual = _field(response, criterion['field'])
+            checks.append({
+                'label': criterion.get('label') or criterion['field'].rsplit('.', 1)[-1],
+                'op': criterion['op'],
+                'expected': criterion.get('value'),
+                'actual': None if actual is _MISSING else actual,
+                'passed': _check(actual, criterion['op'], criterion.get('value')),
+                'display': _format_value(actual)
+            })
+        return {
+            'passed': all(check['passed'] for check in checks),
+            'checks': checks
+        }
+
+
+class QCTestPlan:
+    """Steps of a QC plan in dependency order.
+
+    Steps listed in the file run in that order; depends_on turns the list
+    into a graph so a step is skipped when something it needs failed.
+    """
+
+    def __init__(self, steps: List[QCStep], max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, source: str = None):
+        self.steps = self._ordered(steps)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], source: str = None) -> 'QCTestPlan':
+        if not isinstance(data, dict) or not isinstance(data.get('steps'), list) or not data['steps']:
+            raise ValueError("QC plan needs a non-empty 'steps' list")
+        steps = [QCStep(step) for step in data['steps']]
+        return cls(steps, data.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT), source)
+
+    @staticmethod
+    def _ordered(steps: List[QCStep]) -> List[QCStep]:
+        """Topological order that keeps the file order where dependencies allow"""
+        by_id = {}
+        for step in steps:
+            if step.id in by_id:
+                raise ValueError(f"Duplicate QC step id: {step.id}")
+            by_id[step.id] = step
+        for step in steps:
+            for dependency in step.depends_on:
+                if dependency not in by_id:
+                    raise ValueError(f"QC step '{step.id}' depends on unknown step '{dependency}'")
+
+        ordered, placed = [], set()
+        while len(ordered) < len(steps):
+            ready = [s for s in steps if s.id not in placed and all(d in placed for d in s.depends_on)]
+            if not ready:
+                raise ValueError("QC plan has a dependency cycle")
+            ordered.append(ready[0])
+            placed.add(ready[0].id)
+        return ordered
+
+    def describe(self) -> str:
+        return ", ".join(step.name for step in self.steps)
+
+
+def load_test_plan(path: str = QC_PLAN_FILE) -> QCTestPlan:
+    """Plan from a JSON file, or the built-in mic test plan if the file is missing or invalid"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return QCTestPlan.from_dict(json.load(f), path)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Warning: Invalid QC test plan {path}, using built-in plan: {e}")
+    return QCTestPlan.from_dict(copy.deepcopy(DEFAULT_PLAN), "built-in")
+
+
+class QCPlanRunner:
+    """Runs a plan against one connected BluetoothQCTester.
+
+    Each step is sent as soon as its dependencies have passed and a command
+    slot is free (max_in_flight), and completes the moment its correlated
+    response arrives, so there are no fixed sleeps between steps. Every
+    result carries the step's duration and attempt count.
+    """
+
+    def __init__(self, tester, plan: QCTestPlan):
+        self.tester = tester
+        self.plan = plan
+
+    async def run(self) -> List[Dict[str, Any]]:
+        """Run all steps; returns their results in plan order"""
+        started = time.monotonic()
+        limiter = asyncio.Semaphore(self.plan.max_in_flight)
+        tasks = {}
+        for step in self.plan.steps:
+            # Dependencies come earlier in the ordered plan, so their tasks already exist
+            tasks[step.id] = asyncio.ensure_future(self._run_step(step, tasks, limiter, started))
+        try:
+            results = list(await asyncio.gather(*tasks.values()))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        total_ms = (time.monotonic() - started) * 1000
+        passed = sum(1 for r in results if r['status'] == 'pass')
+        self.tester.log('info', _("QC plan finished: {}/{} steps passed in {:.0f} ms").format(
+            passed, len(results), total_ms), {'qc_plan_ms': round(total_ms)})
+        return results
+
+    async def _run_step(self, step: QCStep, tasks, limiter: asyncio.Semaphore, plan_started: float) -> Dict[str, Any]:
+        for dependency in step.depends_on:
+            dependency_result = await tasks[dependency]
+            if dependency_result['status'] != 'pass':
+                result = self._result(step, 'skipped', _("Skipped: {} did not pass").format(dependency), 0, 0, plan_started)
+                self.tester.log('warning', _("Skipping {}: {} did not pass").format(step.name, dependency))
+                return self._record(result)
+
+        async with limiter:
+            step_started = time.monotonic()
+            attempt = 0
+            while True:
+                attempt += 1
+                attempt_started = time.monotonic()
+                self.tester.log('info', _("Starting test: {}").format(step.name))
+                response, outcome = await self.tester.execute_command(
+                    step.command, step.payload, step.timeout_ms / 1000, step.response_kind, step.is_final)
+                response_ms = (time.monotonic() - attempt_started) * 1000
+
+                if outcome == 'ok':
+                    evaluation = step.evaluate(response)
+                    outcome = 'pass' if evaluation['passed'] else 'fail'
+                if outcome == 'pass' or attempt > step.retries or outcome not in step.retry_on:
+                    break
+                self.tester.log('warning', _("{} on attempt {} ({}), retrying").format(step.name, attempt, outcome))
+                if step.retry_delay_ms:
+                    await asyncio.sleep(step.retry_delay_ms / 1000)
+
+        duration_ms = (time.monotonic() - step_started) * 1000
+        if outcome in ('pass', 'fail'):
+            details = ", ".join(f"{c['label']}: {c['display']} ({c['op']} {c['expected']}) "
+                                f"{_('PASS') if c['passed'] else _('FAIL')}" for c in evaluation['checks'])
+            result = self._result(step, outcome, details or _("Response received"), duration_ms, attempt, plan_started)
+            # Fields missing from the reply are left out rather than stored as None
+            result['evaluation_data'] = {c['label']: c['actual'] for c in evaluation['checks']
+                                         if c['actual'] is not None}
+            result['evaluation_data']['criteria'] = evaluation['checks']
+            result['raw_response'] = response
+        elif outcome == 'timeout':
+            result = self._result(step, 'fail', _("No response within {:.1f}s").format(step.timeout_ms / 1000),
+                                  duration_ms, attempt, plan_started)
+            result['error'] = 'timeout'
+        else:
+            result = self._result(step, 'fail', _("Command could not be sent"), duration_ms, attempt, plan_started)
+            result['error'] = 'send'
+        result['response_ms'] = round(response_ms)
+
+        self.tester.log('success' if result['status'] == 'pass' else 'error',
+                        _("{}: {} in {:.0f} ms ({})").format(step.name, result['status'].upper(), duration_ms, result['details']),
+                        {'step': step.id, 'duration_ms': round(duration_ms), 'attempts': attempt})
+        return self._record(result)
+
+    @staticmethod
+    def _result(step: QCStep, status: str, details: str, duration_ms: float, attempts: int, plan_started: float) -> Dict[str, Any]:
+        return {
+            'name': step.name,
+            'step': step.id,
+            'command': step.command,
+            'status': status,
+            'details': details,
+            'attempts': attempts,
+            'duration_ms': round(duration_ms),
+            'finished_ms': round((time.monotonic() - plan_started) * 1000),   # Offset from plan start
+            'timestamp': time.time()
+        }
+
+    def _record(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        self.tester.test_results.append(result)
+        return result
+
+
+# Plan used by the QC flows; replaced from config.ini at startup
+_active_plan: Optional[QCTestPlan] = None
+
+def get_test_plan() -> QCTestPlan:
+    """Get the active QC test plan (loaded from qc_test_plan.json on first use)"""
+    global _active_plan
+    if _active_plan is None:
+        _active_plan = load_test_plan()
+    return _active_plan
+
+def set_test_plan(plan: QCTestPlan):
+    """Make a plan the active one for every following QC session"""
+    global _active_plan
+    _active_plan = plan
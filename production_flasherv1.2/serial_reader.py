@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Serial Reader Module
+Blocking serial line reader with hotplug-based disconnect detection
+"""
+
+import time
+import codecs
+import threading
+from typing import List, Optional
+
+import serial
+
+from usb_hotplug import get_port_registry, EVENT_REMOVE
+
+# --- Configuration ---
+READ_TIMEOUT = 0.5        # Max seconds a read blocks, bounds how long stop requests wait
+CHUNK_SIZE = 4096         # Reusable read buffer size
+MAX_LINE_LENGTH = 4096    # Unterminated output longer than this is emitted as a line
+TRANSIENT_ERROR_DELAY = 0.1
+
+
+class SerialDisconnected(Exception):
+    """The monitored port went away (read error or hotplug remove event)"""
+
+
+class SerialLineReader:
+    """Reads a serial port into a reusable buffer and splits it into lines.
+
+    Reads block in the driver until data arrives or READ_TIMEOUT passes, so
+    an idle port costs no CPU and many ports can be monitored from their own
+    threads. Disconnects are reported by raising SerialDisconnected, either
+    from the read error itself or from the hotplug registry's remove event,
+    which also cancels a read that is currently blocked.
+    """
+
+    def __init__(self, ser: serial.Serial, port: str = None, chunk_size: int = CHUNK_SIZE):
+        self.ser = ser
+        self.port = port or ser.port
+        self.buffer = bytearray(chunk_size)
+        self.view = memoryview(self.buffer)
+        self.pending = bytearray()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.removed = threading.Event()
+        if ser.timeout is None or ser.timeout > READ_TIMEOUT:
+            ser.timeout = READ_TIMEOUT
+        self.registry = get_port_registry()
+        self.registry.subscribe(self._on_hotplug, esp32_only=False)
+
+    def _on_hotplug(self, event, port_info):
+        if event == EVENT_REMOVE and port_info.device == self.port:
+            self.removed.set()
+            try:
+                self.ser.cancel_read()
+            except Exception:
+                pass
+
+    def read_chunk(self) -> Optional[memoryview]:
+        """Block until data arrives (or the read timeout passes).
+
+        Returns a view into the reusable buffer that is valid until the next
+        call, or None on timeout. Raises SerialDisconnected.
+        """
+        if self.removed.is_set():
+            raise SerialDisconnected(f"{self.port} was removed")
+        try:
+            count = self.ser.readinto(self.view[:1])
+            if count:
+                waiting = min(self.ser.in_waiting, len(self.buffer) - 1)
+                if waiting:
+                    count += self.ser.readinto(self.view[1:1 + waiting])
+        except (serial.SerialException, OSError) as e:
+            if self.removed.is_set() or not self.registry.is_connected(self.port):
+                raise SerialDisconnected(str(e))
+            # ESP32 USB-JTAG ports briefly report readiness without data around a reset
+            time.sleep(TRANSIENT_ERROR_DELAY)
+            return None
+        if self.removed.is_set():
+            raise SerialDisconnected(f"{self.port} was removed")
+        return self.view[:count] if count else None
+
+    def read_text(self) -> str:
+        """Decoded text of the next chunk ('' on timeout), safe across split UTF-8 sequences"""
+        chunk = self.read_chunk()
+        return self.decoder.decode(chunk) if chunk is not None else ""
+
+    def read_lines(self) -> List[str]:
+        """Complete lines received so far (with line endings stripped); [] on timeout"""
+        chunk = self.read_chunk()
+        if chunk is None:
+            return []
+        self.pending += chunk
+        lines = []
+        start = 0
+        while True:
+            end = self.pending.find(b'\n', start)
+            if end < 0:
+                break
+            lines.append(self.pending[start:end].decode('utf-8', errors='replace').rstrip('\r'))
+            start = end + 1
+        del self.pending[:start]
+        if len(self.pending) > MAX_LINE_LENGTH:
+            lines.append(self.pending.decode('utf-8', errors='replace'))
+            self.pending.clear()
+        return lines
+
+    def close(self):
+        """Stop listening for hotplug events and close the port"""
+        self.registry.unsubscribe(self._on_hotplug)
+        try:
+            self.ser.close()
+        except Exception:
+            pass
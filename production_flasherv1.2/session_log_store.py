@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Session Log Store Module
+Streams session logs to Firestore as a parent document plus compressed chunk documents
+"""
+
+import json
+import time
+import zlib
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from log_record import LogRecord, LEVEL_ERROR, LEVEL_WARNING
+from firebase_outbox import SERVER_TIMESTAMP
+
+# Optional zstd support (better ratio and faster than zlib on esptool output)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+# --- Configuration ---
+SESSION_COLLECTION = "logs"
+CHUNK_SUBCOLLECTION = "chunks"
+CHUNK_MAX_BYTES = 256 * 1024     # Uncompressed JSONL per chunk (Firestore documents are capped at 1 MiB)
+CHUNK_MAX_AGE = 30.0             # Seconds before a partial chunk is written anyway
+MAX_SESSION_ISSUES = 200         # Error/warning records kept as fields on the session document
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+FORMAT_CHUNKED = 'chunked-jsonl'
+UPLOADED_FIELD = 'uploaded_at'   # Server time of the last upload; the outbox may deliver hours or days late
+
+
+def compress_chunk(raw: bytes, codec: str = None) -> Tuple[str, bytes]:
+    """Compress one chunk. Returns (codec, data); zstd is used when available."""
+    codec = codec or (CODEC_ZSTD if ZSTD_AVAILABLE else CODEC_ZLIB)
+    if codec == CODEC_ZSTD:
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return CODEC_ZLIB, zlib.compress(raw, ZLIB_LEVEL)
+
+def decompress_chunk(codec: str, data: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstd-compressed log chunk - install zstandard: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown log chunk codec: {codec}")
+
+def chunk_records(chunk: Dict[str, Any]) -> List[LogRecord]:
+    """LogRecords stored in one chunk document, skipping damaged lines"""
+    raw = decompress_chunk(chunk.get('codec', CODEC_ZLIB), chunk['data'])
+    records = []
+    for line in raw.decode('utf-8', errors='replace').splitlines():
+        try:
+            records.append(LogRecord.from_dict(json.loads(line)))
+        except (ValueError, TypeError):
+            continue
+    return records
+
+def reassemble_records(chunks: Iterable[Dict[str, Any]]) -> Iterator[LogRecord]:
+    """Records of a session from its chunk documents, in chunk order"""
+    for chunk in sorted(chunks, key=lambda chunk: chunk.get('index', 0)):
+        yield from chunk_records(chunk)
+
+def _as_record(line) -> LogRecord:
+    return line if isinstance(line, LogRecord) else LogRecord(str(line))
+
+
+class SessionLogWriter:
+    """Streams one session log to Firestore while the session runs.
+
+    Records are buffered as JSONL; once the buffer reaches max_bytes (or is
+    older than max_age, see maybe_flush()) it is compressed and queued as
+    logs/<session>/chunks/<index>. The parent logs/<session> document is
+    re-queued with every chunk so it always carries the current chunk and
+    line counts plus recent errors/warnings. close() writes the last chunk
+    and marks the session closed. Documents go through queue_document
+    (FirebaseDB.queue_document), so chunks are stored durably in the outbox.
+    """
+
+    def __init__(self, queue_document: Callable[[str, Dict[str, Any], str], Optional[str]],
+                 session_id: str, source: str = "gui",
+                 max_bytes: int = CHUNK_MAX_BYTES, max_age: float = CHUNK_MAX_AGE):
+        self.queue_document = queue_document
+        self.session_id = session_id
+        self.source = source
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.started = datetime.now(timezone.utc)
+        self.buffer: List[str] = []
+        self.buffer_bytes = 0
+        self.buffer_started = None
+        self.chunk_count = 0
+        self.line_count = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.issues: List[LogRecord] = []
+        self.closed = False
+        self._queue_session('open')
+
+    def append(self, line):
+        """Add a LogRecord (or plain text line) to the session"""
+        record = _as_record(line)
+        text = record.to_json() + "\n"
+        with self.lock:
+            if self.closed:
+                return
+            if not self.buffer:
+                self.buffer_started = record.timestamp
+            self.buffer.append(text)
+            self.buffer_bytes += len(text.encode('utf-8'))
+            self.line_count += 1
+            if record.level in (LEVEL_ERROR, LEVEL_WARNING):
+                self.issues.append(record)
+                del self.issues[:-MAX_SESSION_ISSUES]
+            if self.buffer_bytes >= self.max_bytes:
+                self._write_chunk()
+
+    def extend(self, lines: Iterable[Any]):
+        for line in lines:
+            self.append(line)
+
+    def maybe_flush(self, now: float = None):
+        """Write the pending chunk if it is older than max_age (call periodically)"""
+        with self.lock:
+            if self.buffer and (now or time.time()) - self.buffer_started >= self.max_age:
+                self._write_chunk()
+
+    def flush(self):
+        """Write the pending chunk now (e.g. after a device finished)"""
+        with self.lock:
+            if self.buffer:
+                self._write_chunk()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            if self.buffer:
+                self._write_chunk(update_session=False)
+            self.closed = True
+            self._queue_session('closed')
+
+    def _write_chunk(self, update_session: bool = True):
+        raw = "".join(self.buffer).encode('utf-8')
+        codec, data = compress_chunk(raw)
+        chunk = {
+            'index': self.chunk_count,
+            'codec': codec,
+            'data': data,
+            'lines': len(self.buffer),
+            'raw_bytes': len(raw),
+            'first_ts': self.buffer_started,
+        }
+        self.buffer, self.buffer_bytes, self.buffer_started = [], 0, None
+        collection = f"{SESSION_COLLECTION}/{self.session_id}/{CHUNK_SUBCOLLECTION}"
+        if not self.queue_document(collection, chunk, f"{self.chunk_count:06d}"):
+            print(f"Error queueing log chunk {self.chunk_count} of session {self.session_id}")
+        self.chunk_count += 1
+        self.raw_bytes += len(raw)
+        self.stored_bytes += len(data)
+        if update_session:
+            self._queue_session('open')
+
+    def _queue_session(self, status: str):
+        doc_data = {
+            'timestamp': self.started,
+            'updated_at': datetime.now(timezone.utc),
+            UPLOADED_FIELD: SERVER_TIMESTAMP,
+            'session_id': self.session_id,
+            'source': self.source,
+            'station': socket.gethostname(),
+            'format': FORMAT_CHUNKED,
+            'status': status,
+            'chunk_count': self.chunk_count,
+            'line_count': self.line_count,
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.stored_bytes,
+        }
+        if self.issues:
+            # Structured errors/warnings so failures can be queried per port or subsystem
+            doc_data['issues'] = [record.to_firestore() for record in self.issues]
+        self.queue_document(SESSION_COLLECTION, doc_data, self.session_id)
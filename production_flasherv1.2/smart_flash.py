@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Smart Flash Module
+Skips flash regions (and app blocks) whose on-chip MD5 already matches the image
+"""
+
+import os
+import inspect
+import hashlib
+import tempfile
+from argparse import Namespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+# --- Configuration ---
+BLOCK_SIZE = 0x10000           # App images are compared and rewritten in 64 KB blocks
+FLASH_SIZE_BYTES = 16 * 1024 * 1024
+FLASH_MODE = "dio"
+FLASH_FREQ = "80m"
+FLASH_SIZE = "16MB"
+
+STATUS_SKIPPED = 'skipped'     # Flash already matched, nothing written
+STATUS_PARTIAL = 'partial'     # Only changed blocks written
+STATUS_WRITTEN = 'written'     # Whole region written
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def _expected_flash_image(esp, address: int, data: bytes) -> bytes:
+    """Return the bytes esptool will actually write at address.
+
+    write_flash patches flash mode/freq/size (and the appended SHA-256) into the
+    bootloader header, so the raw bootloader file never matches the flash.
+    """
+    try:
+        import esptool.cmds as cmds
+        update = cmds._update_image_flash_params
+        if len(inspect.signature(update).parameters) == 4:  # esptool 4.x
+            args = Namespace(flash_mode=FLASH_MODE, flash_freq=FLASH_FREQ, flash_size=FLASH_SIZE)
+            return update(esp, address, args, data)
+        return update(esp, address, FLASH_FREQ, FLASH_MODE, FLASH_SIZE, data)
+    except Exception:
+        return data
+
+
+def _changed_runs(esp, address: int, data: bytes) -> List[Tuple[int, int]]:
+    """Compare an image block by block. Returns [(offset, length)] of changed runs."""
+    runs = []
+    for offset in range(0, len(data), BLOCK_SIZE):
+        block = data[offset:offset + BLOCK_SIZE]
+        if esp.flash_md5sum(address + offset, len(block)) == _md5(block):
+            continue
+        if runs and runs[-1][0] + runs[-1][1] == offset:
+            runs[-1] = (runs[-1][0], runs[-1][1] + len(block))
+        else:
+            runs.append((offset, len(block)))
+    return runs
+
+
+def plan_smart_flash(session, regions: List[Tuple[str, int, str]],
+                     on_line: Callable[[str], None] = None) -> Optional[List[Dict]]:
+    """Work out what needs writing for [(name, address, path)].
+
+    Returns one plan entry per region: {'name', 'address', 'path', 'size',
+    'status', 'runs': [(offset, length)], 'blocks_total', 'blocks_changed'},
+    or None when the session cannot read flash MD5s (subprocess backend).
+    """
+    images = []
+    for name, address, path in regions:
+        with open(path, 'rb') as f:
+            images.append((name, address, path, f.read()))
+
+    def compare(esp):
+        esp.flash_spi_attach(0)
+        esp.flash_set_parameters(FLASH_SIZE_BYTES)
+        plan = []
+        for name, address, path, data in images:
+            expected = _expected_flash_image(esp, address, data)
+            blocks_total = (len(expected) + BLOCK_SIZE - 1) // BLOCK_SIZE
+            entry = {'name': name, 'address': address, 'path': path, 'size': len(expected),
+                     'blocks_total': blocks_total}
+            if esp.flash_md5sum(address, len(expected)) == _md5(expected):
+                entry.update(status=STATUS_SKIPPED, runs=[], blocks_changed=0)
+            elif blocks_total > 1 and expected is data:
+                runs = _changed_runs(esp, address, data)
+                changed = sum((length + BLOCK_SIZE - 1) // BLOCK_SIZE for _, length in runs)
+                status = STATUS_PARTIAL if changed < blocks_total else STATUS_WRITTEN
+                entry.update(status=status, runs=runs, blocks_changed=changed)
+            else:
+                # Bootloader (header patched by esptool) or single-block images: write whole
+                entry.update(status=STATUS_WRITTEN, runs=[(0, len(expected))], blocks_changed=blocks_total)
+            plan.append(entry)
+        return plan
+
+    return session.call_loader(compare, on_line)
+
+
+def build_write_args(plan: List[Dict], work_dir: str) -> List[str]:
+    """Return '<address> <file>' arguments for write_flash covering the plan's changed runs"""
+    args = []
+    for entry in plan:
+        if entry['status'] == STATUS_SKIPPED:
+            continue
+        if entry['runs'] == [(0, entry['size'])]:
+            args += [hex(entry['address']), entry['path']]
+            continue
+        with open(entry['path'], 'rb') as f:
+            data = f.read()
+        for offset, length in entry['runs']:
+            address = entry['address'] + offset
+            part_path = os.path.join(work_dir, f"{entry['name']}_{address:08x}.bin")
+            with open(part_path, 'wb') as f:
+                f.write(data[offset:offset + length])
+            args += [hex(address), part_path]
+    return args
+
+
+def smart_flash(session, regions: List[Tuple[str, int, str]], flash_options: List[str],
+                on_line: Callable[[str], None] = None) -> Tuple[Optional[int], List[Dict]]:
+    """Flash only what differs from the device.
+
+    Returns (esptool exit code, per-region report). The exit code is None when
+    smart flashing is not possible and the caller should do a normal full flash.
+    """
+    plan = plan_smart_flash(session, regions, on_line)
+    if plan is None:
+        return None, []
+
+    with tempfile.TemporaryDirectory(prefix="smart_flash_") as work_dir:
+        write_args = build_write_args(plan, work_dir)
+        if write_args:
+            return_code, _output = session.esptool(["write_flash"] + list(flash_options) + write_args,
+                                                   on_line=on_line, after="hard_reset")
+        else:
+            session.close(reset=True)  # Nothing to write, just boot the app
+            return_code = 0
+
+    report = []
+    for entry in plan:
+        bytes_written = sum(length for _, length in entry['runs']) if return_code == 0 else 0
+        report.append({
+            'region': entry['name'],
+            'address': hex(entry['address']),
+            'size': entry['size'],
+            'status': entry['status'] if return_code == 0 or entry['status'] == STATUS_SKIPPED else 'failed',
+            'blocks_changed': entry['blocks_changed'],
+            'blocks_total': entry['blocks_total'],
+            'bytes_written': bytes_written,
+        })
+    return return_code, report
+
+
+def format_report(report: List[Dict]) -> List[str]:
+    """Human readable lines for a smart flash report"""
+    lines = ["Smart flash report:"]
+    for entry in report:
+        detail = ""
+        if entry['status'] == STATUS_PARTIAL:
+            detail = f" ({entry['blocks_changed']}/{entry['blocks_total']} blocks)"
+        lines.append(f"   {entry['region']:<16} {entry['address']:>9}  {entry['status'].upper()}{detail}"
+                     f"  {entry['bytes_written'] // 1024} KB written")
+    return lines
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - Storage Backend Module
+Pluggable document stores behind FirebaseDB: Cloud Firestore or a local SQLite stand-in
+"""
+
+import os
+import configparser
+from typing import Any, Optional
+
+from i18n_utils import _
+from local_firestore import LocalFirestore, LOCAL_DB_FILE
+
+# Firebase imports with fallback
+try:
+    from firebase_admin import credentials, firestore, initialize_app
+    FIREBASE_AVAILABLE = True
+except ImportError:
+    FIREBASE_AVAILABLE = False
+
+# --- Configuration ---
+CONFIG_FILE = "config.ini"
+BACKEND_ENV_VAR = "DINOCORE_STORAGE_BACKEND"   # Overrides storage_backend in config.ini
+BACKEND_FIRESTORE = "firestore"
+BACKEND_LOCAL = "local"
+
+# Common Firebase credentials locations
+CREDENTIAL_PATHS = [
+    'production_flasherv1.2/firebase-credentials.json',
+    'firebase-credentials.json',
+    'credentials.json',
+    'firebase-adminsdk.json',
+    os.path.expanduser('~/.firebase/credentials.json'),
+    os.path.expanduser('~/firebase-credentials.json')
+]
+
+
+class StorageBackend:
+    """A document store with Firestore client semantics.
+
+    connect() returns a client offering collection(), document() and
+    batch() as used by FirebaseDB, the outbox uploader and the log tools.
+    """
+
+    name = None
+
+    def available(self) -> bool:
+        """True if the backend can be used in this installation"""
+        return True
+
+    def connect(self, credentials_path: str = None, project_id: str = None) -> Optional[Any]:
+        raise NotImplementedError
+
+
+class FirestoreBackend(StorageBackend):
+    """Google Cloud Firestore through firebase-admin"""
+
+    name = BACKEND_FIRESTORE
+
+    def available(self) -> bool:
+        return FIREBASE_AVAILABLE
+
+    def connect(self, credentials_path: str = None, project_id: str = None) -> Optional[Any]:
+        if not FIREBASE_AVAILABLE:
+            print(_("Firebase not available - install firebase-admin: pip install firebase-admin"))
+            return None
+
+        # Use provided credentials or look for default paths
+        if credentials_path and os.path.exists(credentials_path):
+            cred = credentials.Certificate(credentials_path)
+        else:
+            cred = None
+            for path in CREDENTIAL_PATHS:
+                if os.path.exists(path):
+                    cred = credentials.Certificate(path)
+                    print(f"Found Firebase credentials at: {path}")
+                    break
+
+            if not cred:
+                print(_("Firebase credentials not found. Please provide credentials file."))
+                return None
+
+        # Initialize Firebase app
+        if project_id:
+            initialize_app(cred, {'projectId': project_id})
+        else:
+            initialize_app(cred)
+
+        # Get Firestore client
+        return firestore.client()
+
+
+class LocalBackend(StorageBackend):
+    """SQLite file with the same collection/document layout (offline stations, tests, benchmarks)"""
+
+    name = BACKEND_LOCAL
+
+    def __init__(self, path: str = LOCAL_DB_FILE):
+        self.path = path
+
+    def connect(self, credentials_path: str = None, project_id: str = None) -> Optional[Any]:
+        print(f"Using local document store: {os.path.abspath(self.path)}")
+        return LocalFirestore(self.path)
+
+
+BACKENDS = {
+    BACKEND_FIRESTORE: FirestoreBackend,
+    BACKEND_LOCAL: LocalBackend,
+}
+
+
+def configured_backend_name(config_file: str = CONFIG_FILE) -> str:
+    """Backend chosen by DINOCORE_STORAGE_BACKEND or storage_backend in config.ini"""
+    name = os.environ.get(BACKEND_ENV_VAR)
+    if not name:
+        config = configparser.ConfigParser()
+        try:
+            config.read(config_file, encoding='utf-8')
+        except configparser.Error:
+            pass
+        name = config['DEFAULT'].get('storage_backend', BACKEND_FIRESTORE)
+    return name.strip().lower()
+
+def create_backend(name: str = None, **options) -> StorageBackend:
+    """Backend instance by name (default: the configured one)"""
+    name = name or configured_backend_name()
+    if name not in BACKENDS:
+        print(f"Warning: Unknown storage backend '{name}', using {BACKEND_FIRESTORE}")
+        name = BACKEND_FIRESTORE
+    return BACKENDS[name](**options)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+DinoCore Production Flasher - USB Hotplug Module
+Serial port registry updated from udev hotplug events (polling fallback elsewhere)
+"""
+
+import sys
+import threading
+from typing import Callable, Dict, List
+from serial.tools.list_ports import comports
+
+try:
+    import pyudev
+    PYUDEV_AVAILABLE = True
+except ImportError:
+    PYUDEV_AVAILABLE = False
+    pyudev = None
+
+try:
+    from serial.tools.list_ports_linux import SysFS
+except ImportError:
+    SysFS = None
+
+# --- Configuration ---
+ESP32_VID = 0x303A
+ESP32_PID = 0x1001
+POLL_INTERVAL = 1.0     # Seconds between scans when udev is not available
+
+EVENT_ADD = 'add'
+EVENT_REMOVE = 'remove'
+
+BACKEND_UDEV = 'udev'
+BACKEND_POLLING = 'polling'
+
+
+def is_esp32(info) -> bool:
+    """True for an ESP32-S3 USB Serial/JTAG port"""
+    return info.vid == ESP32_VID and info.pid == ESP32_PID
+
+def _port_info(device_path: str):
+    """ListPortInfo for a single tty device node, without enumerating every port"""
+    if SysFS is not None:
+        info = SysFS(device_path)
+        return info if info.subsystem != "platform" else None
+    for info in comports():
+        if info.device == device_path:
+            return info
+    return None
+
+
+class PortRegistry:
+    """Connected serial ports, kept current from hotplug events.
+
+    On Linux with pyudev a netlink monitor reports tty add/remove events as
+    they happen and only the affected port is looked up. Elsewhere a
+    background thread rescans every POLL_INTERVAL seconds and reports the
+    difference. Subscribers are called as callback(event, port_info) from
+    the watcher thread.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.ports: Dict[str, object] = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.backend = None
+        self.observer = None
+        self.poll_thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Take the initial port snapshot and start watching (idempotent)"""
+        with self.lock:
+            if self.backend is not None:
+                return
+            self.backend = BACKEND_POLLING
+            # Ports already present are not reported as events
+            self.ports = {info.device: info for info in comports()}
+
+        if PYUDEV_AVAILABLE and sys.platform.startswith('linux'):
+            try:
+                context = pyudev.Context()
+                monitor = pyudev.Monitor.from_netlink(context)
+                monitor.filter_by(subsystem='tty')
+                self.observer = pyudev.MonitorObserver(monitor, callback=self._on_udev_event,
+                                                       name='usb-hotplug')
+                self.observer.daemon = True
+                self.observer.start()
+                self.backend = BACKEND_UDEV
+                # Catch devices plugged in between the snapshot and the monitor start
+                self._rescan()
+                return
+            except Exception as e:
+                print(f"Warning: udev hotplug monitor unavailable ({e}), polling serial ports instead")
+
+        self.poll_thread = threading.Thread(target=self._poll_worker, daemon=True, name='usb-hotplug')
+        self.poll_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.send_stop()
+
+    def subscribe(self, callback: Callable[[str, object], None], esp32_only: bool = True):
+        """Call callback(event, port_info) for every port added or removed from now on.
+        Ports connected before the first subscription are only listed by get_ports()."""
+        with self.lock:
+            self.subscribers.append((callback, esp32_only))
+        self.start()
+
+    def unsubscribe(self, callback: Callable[[str, object], None]):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s[0] != callback]
+
+    def get_ports(self) -> List[object]:
+        """ListPortInfo of every connected serial port, ordered by device name"""
+        self.start()
+        with self.lock:
+            return [self.ports[device] for device in sorted(self.ports)]
+
+    def get_esp32_ports(self) -> List[str]:
+        """Device names of the connected ESP32 ports"""
+        return [info.device for info in self.get_ports() if is_esp32(info)]
+
+    def is_connected(self, device: str) -> bool:
+        self.start()
+        with self.lock:
+            return device in self.ports
+
+    # --- Event sources ---
+    def _on_udev_event(self, device):
+        device_path = device.device_node
+        if not device_path:
+            return
+        if device.action == 'add':
+            try:
+                info = _port_info(device_path)
+            except Exception:
+                info = None
+            if info is not None:
+                self._update({device_path: info}, [])
+        elif device.action == 'remove':
+            self._update({}, [device_path])
+
+    def _poll_worker(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self._rescan()
+            except Exception as e:
+                print(f"Warning: Serial port scan failed: {e}")
+
+    def _rescan(self):
+        current = {info.device: info for info in comports()}
+        with self.lock:
+            removed = [device for device in self.ports if device not in current]
+        self._update(current, removed)
+
+    # --- Registry updates ---
+    def _update(self, present: Dict[str, object], removed: List[str]):
+        events = []
+        with self.lock:
+            for device in removed:
+                info = self.ports.pop(device, None)
+                if info is not None:
+                    events.append((EVENT_REMOVE, info))
+            for device, info in present.items():
+                if device not in self.ports:
+                    events.append((EVENT_ADD, info))
+                self.ports[device] = info
+            subscribers = list(self.subscribers)
+
+        for event, info in events:
+            for callback, esp32_only in subscribers:
+                if esp32_only and not is_esp32(info):
+                    continue
+                try:
+                    callback(event, info)
+                except Exception as e:
+                    print(f"Warning: Hotplug subscriber failed on {info.device}: {e}")
+
+
+# Global registry shared by the GUI, auto flasher and console
+port_registry = PortRegistry()
+
+def get_port_registry() -> PortRegistry:
+    """Get the global port registry instance (starts watching on first use)"""
+    return port_registry